@@ -0,0 +1,176 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.....................................................................................................................
+Purpose:
+           -Support code for llm_steps.py (AbstractSearcher, the "article link handler" tool)
+           -Targeted abstract extraction from article landing pages, in order of reliability:
+                1. citation_abstract / dcterms.abstract / dc.description / og:description meta tags
+                2. "abstract" fields of JSON-LD blocks
+                3. known publisher abstract containers (Springer/Nature, Elsevier, Wiley, PLOS, bioRxiv, arXiv, PubMed, ...)
+                4. readability-style fallback: the block of paragraphs with the most text and the fewest links
+           -The page is fed to an incremental (pull) parser that stops as soon as a complete abstract is found
+            (citation_abstract/dcterms.abstract or JSON-LD in the <head>, else a publisher container); descriptions
+            may be cut without any mark, so they never stop the parse and only count when no other stage finds one
+Benchmark:
+           python benchmarks/bench_abstracts.py --save urls.txt --corpus abstract_corpus (see the benchmark's notes on the corpus)
+'''
+#.....................................................................................................................
+
+
+# Importing essential libraries and modules
+import html
+import json
+import re
+from typing import Dict, List, Optional
+
+from lxml import etree
+
+# Meta tags holding an abstract, best first; the first two are complete abstracts by definition
+META_ABSTRACT = ("citation_abstract", "dcterms.abstract", "dc.description", "dcterms.description", "og:description",
+                 "twitter:description", "description")
+DEFINITIVE_META = ("citation_abstract", "dcterms.abstract")
+META_TITLE = ("citation_title", "dc.title", "og:title")
+# id/class tokens of the abstract containers of the major publishers
+CONTAINER_PATTERN = re.compile(
+    r"^(abstract|abstracts|abs\d+(-content)?|abstract[-_]?(content|section|text|body|\d+)|abstractsection|abstractinfull|"
+    r"article-?abstract|section-abstract|hlfld-abstract|eng-abstract|abstract-author|author-abstract|ltx_abstract)$",
+    re.IGNORECASE,
+)
+CONTAINER_TAGS = ("div", "section", "blockquote", "article", "p")
+MIN_ABSTRACT_CHARS = 100
+CHUNK_CHARS = 8192
+WHITESPACE = re.compile(r"\s+")
+TAG = re.compile(r"<[^>]+>")
+LEADING_HEADING = re.compile(r"^(abstract|summary)\s*[:.]?\s*", re.IGNORECASE)
+
+
+def clean_text(text: str) -> str:
+    """Plain, single-spaced text (tags and entities of meta/JSON-LD values removed)."""
+    return WHITESPACE.sub(" ", html.unescape(TAG.sub(" ", text or ""))).strip()
+
+
+def _truncated(text: str) -> bool:
+    # og:description and description are often cut by the publisher
+    return text.endswith(("...", "…")) or len(text) < MIN_ABSTRACT_CHARS
+
+
+def _jsonld_abstract(data) -> Optional[str]:
+    # First "abstract" string of a JSON-LD document (objects, lists and @graph are searched depth-first)
+    if isinstance(data, dict):
+        abstract = data.get("abstract")
+        if isinstance(abstract, str) and abstract.strip():
+            return abstract
+        if isinstance(abstract, dict) and isinstance(abstract.get("text"), str):
+            return abstract["text"]
+        data = list(data.values())
+    if isinstance(data, list):
+        for item in data:
+            if isinstance(item, (dict, list)):
+                found = _jsonld_abstract(item)
+                if found:
+                    return found
+    return None
+
+
+def _is_container(element) -> bool:
+    if element.tag not in CONTAINER_TAGS:
+        return False
+    tokens = [element.get("id") or ""] + (element.get("class") or "").split()
+    if element.get("data-title", "").lower() == "abstract" or element.get("itemprop") == "description":
+        return True
+    return any(CONTAINER_PATTERN.match(token) for token in tokens if token)
+
+
+def _element_text(element) -> str:
+    return LEADING_HEADING.sub("", WHITESPACE.sub(" ", " ".join(element.itertext())).strip())
+
+
+def density_text(root) -> str:
+    """Readability-style fallback: paragraphs of the block with the most text and the fewest links."""
+    scores: Dict[etree._Element, float] = {}
+    paragraphs: Dict[etree._Element, List[str]] = {}
+    for p in root.iter("p"):
+        text = WHITESPACE.sub(" ", " ".join(p.itertext())).strip()
+        if len(text) < 25:
+            continue
+        link_chars = sum(len(" ".join(a.itertext())) for a in p.iter("a"))
+        score = (len(text) + 10 * text.count(",")) * (1 - min(1.0, link_chars / len(text)))
+        parent = p.getparent()
+        if parent is None:
+            continue
+        scores[parent] = scores.get(parent, 0.0) + score
+        paragraphs.setdefault(parent, []).append(text)
+    if not scores:
+        return ""
+    best = max(scores, key=scores.get)
+    return LEADING_HEADING.sub("", "\n".join(paragraphs[best]))
+
+
+def extract_abstract(page: str) -> Dict[str, str]:
+    """
+    Title and abstract of an article landing page.
+    Returns {"title", "abstract", "source"}; source tells which stage found the abstract
+    ("meta:<name>", "json-ld", "container", "density" or "" when nothing was found).
+    """
+    parser = etree.HTMLPullParser(events=("end",))
+    meta: Dict[str, str] = {}
+    titles: Dict[str, str] = {}
+    found: Dict[str, str] = {}
+    complete = False
+    for start in range(0, len(page), CHUNK_CHARS):
+        parser.feed(page[start : start + CHUNK_CHARS])
+        for _, element in parser.read_events():
+            tag = element.tag
+            if not isinstance(tag, str):
+                continue
+            if tag == "meta":
+                name = (element.get("name") or element.get("property") or "").lower()
+                content = clean_text(element.get("content") or "")
+                if name in META_ABSTRACT and content and name not in meta:
+                    meta[name] = content
+                    complete = name in DEFINITIVE_META and not _truncated(content)
+                elif name in META_TITLE and content:
+                    titles.setdefault(name, content)
+            elif tag == "title":
+                titles.setdefault("title", clean_text(element.text or ""))
+            elif tag == "script" and "ld+json" in (element.get("type") or "").lower():
+                try:
+                    abstract = _jsonld_abstract(json.loads(element.text or ""))
+                except ValueError:
+                    abstract = None
+                if abstract and "json-ld" not in found:
+                    found["json-ld"] = clean_text(abstract)
+                    complete = complete or not _truncated(found["json-ld"])
+            elif _is_container(element):
+                text = _element_text(element)
+                if len(text) >= MIN_ABSTRACT_CHARS and "container" not in found:
+                    found["container"] = text
+                    complete = True
+            if complete:
+                break
+        if complete:
+            break
+    title = next((titles[name] for name in META_TITLE + ("title",) if titles.get(name)), "")
+    # descriptions come last: a cut og:description must not win over a JSON-LD or container abstract
+    candidates = [(f"meta:{name}", meta[name]) for name in DEFINITIVE_META if name in meta]
+    candidates += [(source, found[source]) for source in ("json-ld", "container") if source in found]
+    candidates += [(f"meta:{name}", meta[name]) for name in META_ABSTRACT if name in meta and name not in DEFINITIVE_META]
+    for source, text in candidates:
+        if not _truncated(text):
+            return {"title": title, "abstract": text, "source": source}
+    if not complete:
+        try:
+            root = parser.close()
+        except etree.XMLSyntaxError:
+            root = None
+        text = density_text(root) if root is not None else ""
+        if text:
+            return {"title": title, "abstract": text, "source": "density"}
+    if candidates:
+        # only a cut description: better than nothing
+        source, text = candidates[0]
+        return {"title": title, "abstract": text, "source": source}
+    return {"title": title, "abstract": "", "source": ""}
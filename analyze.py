@@ -25,8 +25,17 @@ import json
 from sqlalchemy import create_engine  
 import sqlalchemy as sql
 from plotly.graph_objects import Figure
+from cassette import get_cassette
+from result_export import render_export_controls
+from figure_optimizer import optimize_figure
+from result_viewer import ResultHandle, render_result_viewer
 import time
 import io
+import hashlib
+from collections import namedtuple
+from contextlib import contextmanager
+from abc import ABC, abstractmethod
+import threading
 def get_table_schema(sql_query_tool, sql_engine='sqlite'):
   
   
@@ -103,15 +112,19 @@ class ChatGPT_Handler: #designed for chatcompletion API
     #This method sends a prompt to the language model 
     #and returns its output. 
     #It includes parameters for stopping the output generation (stop) and for controlling the randomness of the generation (temperature).
-        response = openai.ChatCompletion.create(
-        engine=self.gpt_deployment, 
-        messages = prompt,
-        temperature=self.temperature,
-        max_tokens=self.max_response_tokens,
-        stop=stop
-        )
+    #The call goes through the cassette layer (cassette.py) so it can be recorded and replayed offline.
+        def create():
+            response = openai.ChatCompletion.create(
+            engine=self.gpt_deployment, 
+            messages = prompt,
+            temperature=self.temperature,
+            max_tokens=self.max_response_tokens,
+            stop=stop
+            )
+            return response['choices'][0]['message']['content']
             
-        llm_output = response['choices'][0]['message']['content']
+        request = {"engine": self.gpt_deployment, "messages": prompt, "temperature": self.temperature, "max_tokens": self.max_response_tokens, "stop": stop}
+        llm_output = get_cassette().call("llm", request, create)
         return llm_output
     def extract_output(self, text_input):
     #This method is the core of the class, where it uses regular expressions
@@ -173,44 +186,243 @@ class SQL_Query(ChatGPT_Handler):
         self.db_path= db_path #This is the built-in demo using SQLite
         
         self.driver= driver
+        self._engine = None
+        self._engine_lock = threading.Lock()
         
+    def get_engine(self):
+        #The SQLAlchemy engine is created once per SQL_Query and reused for every query (and for exports).
+        #The lock keeps threads sharing the SQL_Query (batch_analyze.py workers) from creating two engines.
+        with self._engine_lock:
+            if self._engine is None:
+                if self.db_path is not None:  
+                    self._engine = create_engine(f'sqlite:///{self.db_path}')  
+                else:  
+                    connecting_string = f"Driver={{ODBC Driver 17 for SQL Server}};Server=tcp:{self.dbserver},1433;Database={self.database};Uid={self.db_user};Pwd={self.db_password}"
+                    params = parse.quote_plus(connecting_string)
+
+                    self._engine = create_engine("mssql+pyodbc:///?odbc_connect=%s" % params)
+        return self._engine
+
     def execute_sql_query(self, query, limit=10000):
         #The execute_sql_query method establishes a connection to either a SQLite or SQL Server database and executes the provided SQL query. 
         #It processes the results into a pandas DataFrame, infers data types, handles date columns, and applies a limit to the number of results if specified.
+        #With a limit, rows are read from the cursor in chunks and reading stops at the limit, instead of loading the full result first.
         
-        if self.db_path is not None:  
-            engine = create_engine(f'sqlite:///{self.db_path}')  
-        else:  
-            connecting_string = f"Driver={{ODBC Driver 17 for SQL Server}};Server=tcp:{self.dbserver},1433;Database={self.database};Uid={self.db_user};Pwd={self.db_password}"
-            params = parse.quote_plus(connecting_string)
-
-            engine = create_engine("mssql+pyodbc:///?odbc_connect=%s" % params)
-
+        engine = self.get_engine()
 
-        result = pd.read_sql_query(query, engine)
+        if limit is None:
+            result = pd.read_sql_query(query, engine)
+        else:
+            chunks = []
+            n_rows = 0
+            reader = pd.read_sql_query(query, engine, chunksize=min(limit, 10000))
+            for chunk in reader:
+                chunks.append(chunk)
+                n_rows += len(chunk)
+                if n_rows >= limit:
+                    break
+            reader.close()
+            result = pd.concat(chunks, ignore_index=True) if len(chunks) > 0 else pd.DataFrame()
+            result = result.head(limit)  # limit to save memory  
         result = result.infer_objects()
         for col in result.columns:  
             if 'date' in col.lower():  
                 result[col] = pd.to_datetime(result[col], errors="ignore")  
   
-        if limit is not None:  
-            result = result.head(limit)  # limit to save memory  
-  
         # session.close()  
         return result  
 
+#The StepSupervisor class watches the think/act loop of AnalyzeGPT.
+#Every step is fingerprinted from its action (SQL or Python code) and the error it produced, 
+#so that cycles (the same failing action coming back) and no-progress streaks (errors, wrong output format,
+#or re-observing the same data) are caught early instead of spending all max_steps LLM calls.
+#On a detection it switches strategy (add a schema excerpt, then escalate to GPT-4) before aborting.
+class StepSupervisor:
+    def __init__(self, max_steps=15, max_repeats=2, max_stagnant_steps=3, schema_excerpt="", escalation_deployment=None) -> None:
+        self.max_steps = max_steps
+        self.max_repeats = max_repeats
+        self.max_stagnant_steps = max_stagnant_steps
+        self.schema_excerpt = schema_excerpt
+        self.escalation_deployment = escalation_deployment
+        self.trace = []
+        self.stop_reason = None
+        self._seen = {}
+        self._seen_observations = set()
+        self._stagnant_steps = 0
+        self._strategies = []
+        if schema_excerpt:
+            self._strategies.append("add_schema")
+        if escalation_deployment:
+            self._strategies.append("escalate")
+
+    @staticmethod
+    def fingerprint(text):
+    #Normalize case, whitespace and quoting so trivially reformatted actions share a fingerprint
+        if text is None:
+            return None
+        text = re.sub(r"\s+", " ", str(text)).strip().lower().rstrip(";")
+        text = text.replace('"', "'")
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+    def record(self, step, action, error=None, observation=None, wrong_format=False):
+    #Record one step and return the decision for the loop: "continue", "add_schema", "escalate" or "abort"
+        action_fp = self.fingerprint(action)
+        error_fp = self.fingerprint(error)
+        observation_fp = self.fingerprint(observation)
+        key = (action_fp, error_fp)
+        self._seen[key] = self._seen.get(key, 0) + 1
+
+        repeated_observation = observation_fp is not None and observation_fp in self._seen_observations
+        if observation_fp is not None:
+            self._seen_observations.add(observation_fp)
+        if error is not None or wrong_format or repeated_observation:
+            self._stagnant_steps += 1
+        else:
+            self._stagnant_steps = 0
+
+        entry = {"step": step, "action": action_fp, "error": error_fp, "observation": observation_fp,
+                 "wrong_format": wrong_format, "decision": "continue", "reason": None}
+        self.trace.append(entry)
+
+        if step >= self.max_steps:
+            entry["decision"] = "abort"
+            entry["reason"] = self.stop_reason = f"exceeded max_steps={self.max_steps}"
+            return "abort"
+        reason = None
+        if (error is not None or wrong_format) and self._seen[key] > self.max_repeats:
+            reason = f"cycle: same {'output format error' if wrong_format else 'failing action'} repeated {self._seen[key]} times"
+        elif self._stagnant_steps >= self.max_stagnant_steps:
+            reason = f"no progress for {self._stagnant_steps} consecutive steps"
+        if reason is None:
+            return "continue"
+
+        entry["reason"] = reason
+        if self._strategies:
+            decision = self._strategies.pop(0)
+            #give the new strategy a fair chance before judging it again
+            self._seen = {}
+            self._stagnant_steps = 0
+        else:
+            decision = "abort"
+            self.stop_reason = reason
+        entry["decision"] = decision
+        return decision
+
+    def finish(self, step, reason):
+    #Record why the loop stopped when it ends normally (answer given, output produced, service error)
+        if self.stop_reason is None:
+            self.stop_reason = reason
+        self.trace.append({"step": step, "decision": "stop", "reason": reason})
+
+def get_schema_excerpt(table_schema, text):
+    #Return the schema lines for the tables referenced in text (a failing SQL/Python action or its error),
+    #falling back to the whole schema when no table is recognized.
+    lines = [line.strip() for line in table_schema.split("\n") if line.strip()]
+    text = (text or "").lower()
+    excerpt = []
+    for line in lines:
+        table_name = line.split(",")[0].replace("table:", "").strip().strip("[]").split(".")[-1].lower()
+        if table_name and table_name in text:
+            excerpt.append(line)
+    if len(excerpt) == 0:
+        excerpt = lines
+    return "\n".join(excerpt)
+
+#AnalyzeGPT does not write to Streamlit directly. Every step produces an AnalyzeEvent 
+#(question, thought, sql, code, observation, dataframe, figure, text, answer, error, prompt, trace)
+#that is handed to a pluggable sink, so the same engine runs inside a Streamlit page or headless (e.g. batch_analyze.py).
+AnalyzeEvent = namedtuple("AnalyzeEvent", ["kind", "label", "data"])
+
+class EventSink(ABC):
+    #Base class for event sinks. Subclasses implement emit() to render or store the events.
+    @abstractmethod
+    def emit(self, event):
+        pass
+
+class CollectingSink(EventSink):
+    #The CollectingSink keeps all events in memory, used for headless and batch runs.
+    def __init__(self) -> None:
+        self.events = []
+    def emit(self, event):
+        self.events.append(event)
+    def of_kind(self, kind):
+        return [event for event in self.events if event.kind == kind]
+
+class StreamlitSink(EventSink):
+    #The StreamlitSink renders events into a Streamlit container (e.g. a column), 
+    #and keeps the session state bits (the result export for the download button) that the PGS Chat page relies on.
+    def __init__(self, container, session_state=None) -> None:
+        self.container = container
+        self.session_state = session_state
+    def emit(self, event):
+        st = self.container
+        if event.kind == "question":
+            st.write(f"Question: {event.data}")
+        elif event.kind in ("sql", "code"):
+            st.write(event.label)
+            st.code(event.data)
+        elif event.kind == "figure":
+            st.plotly_chart(event.data)
+        elif event.kind == "dataframe":
+            st.write(event.data)
+        elif event.kind == "result":
+            # Keep the result handle for the session, so paging/sorting/filtering keeps working across reruns;
+            # the export of the previous result is removed
+            if self.session_state is not None:
+                self.session_state["result_handle"] = event.data
+                previous = self.session_state.pop("result_export", None)
+                if previous is not None:
+                    previous.cleanup()
+            render_result_viewer(st, event.data)
+            render_export_controls(st, event.data, self.session_state)
+        else:
+            if event.label is not None:
+                st.write(event.label)
+            st.write(event.data)
+
+#The StageTimer class accumulates wall time per stage of a run (llm, sql, exec, render).
+#Stages can be nested (execute_sql inside exec, show() inside exec); a nested stage's time is not counted again in its parent.
+class StageTimer:
+    def __init__(self) -> None:
+        self.totals = {}
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            child_time = self._stack.pop()
+            self.totals[name] = self.totals.get(name, 0.0) + elapsed - child_time
+            if len(self._stack) > 0:
+                self._stack[-1] += elapsed
+
 #The AnalyzeGPT class, inheriting from ChatGPT_Handler,
 #is designed to handle a conversational flow with a language model,
 #specifically focusing on tasks that involve SQL queries and content extraction. 
 class AnalyzeGPT(ChatGPT_Handler):
  
     
-    def __init__(self,sql_engine,content_extractor, sql_query_tool, system_message,few_shot_examples,st,**kwargs) -> None:
+    def __init__(self,sql_engine,content_extractor, sql_query_tool, system_message,few_shot_examples,st=None,escalation_deployment=None,sink=None,table_schema=None,page_size=25,**kwargs) -> None:
     #The constructor initializes the AnalyzeGPT object, 
     #sets up the initial conversation history with the system message, 
     #and stores references to a content extractor, an SQL query tool, and the Streamlit instance for potential UI interactions.
+    #escalation_deployment (e.g. the GPT-4 deployment) is used by the step supervisor when the default model gets stuck.
+    #sink receives the events when run()/query_run() are not given a Streamlit container; 
+    #table_schema can be passed in to avoid reading the schema again for every instance (batch runs).
+    #page_size is the number of rows query_run fetches up front (the first page of the result viewer).
         super().__init__(**kwargs)          
-        table_schema = get_table_schema(sql_query_tool,sql_engine)
+        self.sql_engine = sql_engine
+        self.page_size = page_size
+        if table_schema is None:
+            table_schema = get_table_schema(sql_query_tool,sql_engine)
+        self.table_schema = table_schema
+        self.escalation_deployment = escalation_deployment
+        self.trace = []
+        self.timer = StageTimer()
         system_message = f"""
         <<data_sources>>
         {table_schema}
@@ -219,6 +431,7 @@ class AnalyzeGPT(ChatGPT_Handler):
         """
         self.conversation_history =  [{"role": "system", "content": system_message}]
         self.st = st
+        self.sink = sink if sink is not None else CollectingSink()
         self.content_extractor = content_extractor
         self.sql_query_tool = sql_query_tool
     def get_next_steps(self, updated_user_content, stop):
@@ -233,21 +446,23 @@ class AnalyzeGPT(ChatGPT_Handler):
         # print("prompt input ", self.conversation_history)
         n=0
         try:
-            llm_output = self._call_llm(self.conversation_history, stop)
+            with self.timer.stage("llm"):
+                llm_output = self._call_llm(self.conversation_history, stop)
             # print("llm_output \n", llm_output)
 
         except Exception as e:
             time.sleep(8) #sleep for 8 seconds
+            llm_output = "OPENAI_ERROR"     
             while n<5:
                 try:
-                    llm_output = self._call_llm(self.conversation_history, stop)
+                    with self.timer.stage("llm"):
+                        llm_output = self._call_llm(self.conversation_history, stop)
+                    break
                 except Exception as e:
                     n +=1
                     print("error calling open AI, I am retrying 5 attempts , attempt ", n)
                     time.sleep(8) #sleep for 8 seconds
                     print(e)
-
-            llm_output = "OPENAI_ERROR"     
              
     
         # print("llm_output: ", llm_output)
@@ -259,129 +474,187 @@ class AnalyzeGPT(ChatGPT_Handler):
 
         return llm_output,output
 
-    def run(self, question: str, show_code,show_prompt,st) -> any:
+    def _new_supervisor(self, max_steps):
+    #Create the step supervisor for one run; escalation is only offered when it changes the deployment
+        escalation_deployment = self.escalation_deployment
+        if escalation_deployment == self.gpt_deployment:
+            escalation_deployment = None
+        supervisor = StepSupervisor(max_steps=max_steps, schema_excerpt=self.table_schema, escalation_deployment=escalation_deployment)
+        self.trace = supervisor.trace
+        return supervisor
+
+    def _apply_strategy(self, decision, supervisor, action, error):
+    #Apply a supervisor decision and return the text to append to the next prompt
+        if decision == "add_schema":
+            excerpt = get_schema_excerpt(self.table_schema, f"{action}\n{error}")
+            return f"\nYou seem to be stuck. Use only the following tables and columns:\n{excerpt}\nThought: "
+        if decision == "escalate":
+            print("Escalating to deployment ", supervisor.escalation_deployment)
+            self.gpt_deployment = supervisor.escalation_deployment
+        return ""
+
+    def _get_sink(self, st):
+    #A Streamlit container passed to run()/query_run() takes precedence over the configured sink
+        if st is None:
+            return self.sink
+        session_state = self.st.session_state if self.st is not None else None
+        return StreamlitSink(st, session_state)
+
+    def run(self, question: str, show_code,show_prompt,st=None) -> any:
     #The run method in the AnalyzeGPT class is designed to execute and display the results of SQL queries, as well as visualize the data using Plotly. 
+    #It returns the final answer (or None if no answer was given).
         import numpy as np
         import plotly.express as px
         import plotly.graph_objs as go
         import pandas as pd
 
-        st.write(f"Question: {question}")
-        # if "init" not in self.st.session_state.keys():
-            
-        #     self.st.session_state['init']= True
-        #The method defines two helper functions: execute_sql for executing SQL queries using the sql_query_tool,
-        #and show for displaying data or plots in the Streamlit app.
+        sink = self._get_sink(st)
+        self.timer = StageTimer()
+        def emit(kind, label, data):
+            with self.timer.stage("render"):
+                sink.emit(AnalyzeEvent(kind, label, data))
+        emit("question", None, question)
+        #The method defines three helper functions: execute_sql for executing SQL queries using the sql_query_tool,
+        #show for displaying data or plots to the user and observe for the model to look at data itself.
         #The show function is capable of handling both data frames and Plotly figures. 
-        #If the data is not a figure, it's stored in the Streamlit session state under a custom key.
+        #If the data is not a figure, it's also kept as an observation for the model.
+        observed = {}
         def execute_sql(query):
-            return self.sql_query_tool.execute_sql_query(query)
+            with self.timer.stage("sql"):
+                return self.sql_query_tool.execute_sql_query(query)
         observation=None
         def show(data):
+            #Large figures are downsampled / switched to WebGL before they are sent to the browser
             if type(data) is Figure:
-                st.plotly_chart(data)
+                emit("figure", None, optimize_figure(data))
+            elif isinstance(data, pd.DataFrame):
+                emit("dataframe", None, data)
             else:
-                st.write(data)
-        
-            # i=0
-            # for key in self.st.session_state.keys():
-            #     if "show" in key:
-            #         i +=1
-            # self.st.session_state[f'show{i}']=data 
+                emit("text", None, data)
             if type(data) is not Figure:
-                self.st.session_state[f'observation: this was shown to user']=data
+                observed['this was shown to user']=data
         
         def observe(name, data):
             try:
                 data = data[:10] # limit the print out observation to 10 rows
             except:
                 pass
-            self.st.session_state[f'observation:{name}']=data
+            observed[name]=data
 
         max_steps = 15
         count =1
+        supervisor = self._new_supervisor(max_steps)
+        default_deployment = self.gpt_deployment
+        answer = None
 
         finish = False
         new_input= f"Question: {question}"
-        # if self.st.session_state['init']:
-        #     new_input= f"Question: {question}"
-        # else:
-        #     new_input=self.st.session_state['history'] +f"\nQuestion: {question}"
-        while not finish:
-
-            llm_output,next_steps = self.get_next_steps(new_input, stop=["Observation:", f"Thought {count+1}"])
-            if llm_output=='OPENAI_ERROR':
-                st.write("Error Calling Azure Open AI, probably due to max service limit, please try again")
-                break
-            elif llm_output=='WRONG_OUTPUT_FORMAT': #just have open AI try again till the right output comes
-                count +=1
-                continue
-
-            new_input += f"\n{llm_output}"
-            for key, value in next_steps.items():
-                new_input += f"\n{value}"
+        try:
+            while not finish:
+
+                llm_output,next_steps = self.get_next_steps(new_input, stop=["Observation:", f"Thought {count+1}"])
+                if llm_output=='OPENAI_ERROR':
+                    emit("error", None, "Error Calling Azure Open AI, probably due to max service limit, please try again")
+                    supervisor.finish(count, "openai_error")
+                    break
+                elif llm_output=='WRONG_OUTPUT_FORMAT': #just have open AI try again till the right output comes, unless the supervisor gives up
+                    decision = supervisor.record(count, llm_output, wrong_format=True)
+                    if decision == "abort":
+                        emit("error", None, f"Stopped early: {supervisor.stop_reason}")
+                        break
+                    new_input += self._apply_strategy(decision, supervisor, llm_output, None)
+                    count +=1
+                    continue
+
+                action = None
+                step_error = None
+                step_observation = None
+                new_input += f"\n{llm_output}"
+                for key, value in next_steps.items():
+                    new_input += f"\n{value}"
                 
-                if "ACTION" in key.upper():
-                    if show_code:
-                        st.write(key)
-                        st.code(value)
-                    observations =[]
-                    serialized_obs=[]
-                    try:
-                        # if "print(" in value:
-                        #     raise Exception("You must not use print() statement, instead use st.write() to write to end user or observe(name, data) to view data yourself. Please regenerate the code")
-                        exec(value, locals())
-                        for key in self.st.session_state.keys():
-                            if "observation:" in key:
-                                observation=self.st.session_state[key]
-                                observations.append((key.split(":")[1],observation))
-                                if type(observation) is pd:
-                                    # serialized_obs.append((key.split(":")[1],observation.to_json(orient='records', date_format='iso')))
-                                    serialized_obs.append((key.split(":")[1],observation.to_string()))
-
-                                elif type(observation) is not Figure:
-                                    serialized_obs.append({key.split(":")[1]:str(observation)})
-                                del self.st.session_state[key]
-                    except Exception as e:
-                        observations.append(("Error:",str(e)))
-                        serialized_obs.append({"\nEncounter following error, can you try again?\n:":str(e)+"\nAction:"})
+                    if "ACTION" in key.upper():
+                        action = value
+                        if show_code:
+                            emit("code", key, value)
+                        observations =[]
+                        serialized_obs=[]
+                        observed.clear()
+                        try:
+                            with self.timer.stage("exec"):
+                                exec(value, locals())
+                            for name, observation in observed.items():
+                                observations.append((name,observation))
+                                if type(observation) is not Figure:
+                                    serialized_obs.append({name:str(observation)})
+                            step_observation = str(serialized_obs) if len(serialized_obs)>0 else None
+                        except Exception as e:
+                            step_error = str(e)
+                            observations.append(("Error:",str(e)))
+                            serialized_obs.append({"\nEncounter following error, can you try again?\n:":str(e)+"\nAction:"})
                         
-                    for observation in observations:
-                        st.write(observation[0])
-                        st.write(observation[1])
+                        for observation in observations:
+                            if observation[0] == "Error:":
+                                emit("error", observation[0], observation[1])
+                            else:
+                                emit("observation", observation[0], observation[1])
+
+                        obs = f"\nObservation on the first 10 rows of data: {serialized_obs}"
+                        new_input += obs
+                    elif "Answer" in key:
+                        emit("answer", key, value)
+                    else:
+                        emit("thought", key, value)
+                    if "Answer" in key:
+                        print("Answer is given, finish")                    
+                        answer = value
+                        finish= True
+                    
+                if show_prompt:
+                    emit("prompt", "Prompt", self.conversation_history)
 
-                    obs = f"\nObservation on the first 10 rows of data: {serialized_obs}"
-                    new_input += obs
+                if finish:
+                    supervisor.finish(count, "answered")
                 else:
-                    st.write(key)
-                    st.write(value)
-                if "Answer" in key:
-                    print("Answer is given, finish")                    
-                
-                    finish= True
-                    
-            if show_prompt:
-                self.st.write("Prompt")
-                self.st.write(self.conversation_history)
-
-            count +=1
-            if count>= max_steps:
-                print("Exceeding threshold, finish")
-                break
- 
+                    decision = supervisor.record(count, action, error=step_error, observation=step_observation)
+                    if decision == "abort":
+                        print("Supervisor stopped the loop: ", supervisor.stop_reason)
+                        emit("error", None, f"Stopped early: {supervisor.stop_reason}")
+                        break
+                    new_input += self._apply_strategy(decision, supervisor, action, step_error)
+                count +=1
+        finally:
+            #an exception must not leave the session on the escalated deployment
+            self.gpt_deployment = default_deployment
+        if show_prompt:
+            emit("trace", "Trace", self.trace)
+        return answer
 
     
-    def query_run(self, question: str, show_code,show_prompt,st) -> any:
+    def query_run(self, question: str, show_code,show_prompt,st=None) -> any:
     #The query_run method in the AnalyzeGPT class is designed to handle a user's question, 
     #interact with the language model to generate next steps based on the question, execute SQL queries if required,
-    #and display the results or errors. 
+    #and display the results or errors. It returns a ResultHandle on the query result (or None);
+    #only the first page is fetched here, further pages are fetched on demand by the result viewer.
     
-        st.write(f"Question: {question}")
+        sink = self._get_sink(st)
+        self.timer = StageTimer()
+        def emit(kind, label, data):
+            with self.timer.stage("render"):
+                sink.emit(AnalyzeEvent(kind, label, data))
+        emit("question", None, question)
         def execute_sql(query):
         #The method displays the user's question and defines a helper function execute_sql to execute SQL queries using the sql_query_tool.
-            return self.sql_query_tool.execute_sql_query(query)
+        #The query is wrapped in a ResultHandle; fetching the first page validates it without reading the whole result.
+            with self.timer.stage("sql"):
+                handle = ResultHandle(self.sql_query_tool, query, self.sql_engine)
+                handle.page(0, self.page_size)
+                return handle
         max_steps = 15
         count =1
+        supervisor = self._new_supervisor(max_steps)
+        default_deployment = self.gpt_deployment
+        output =None
 
         new_input= f"Question: {question}"
         #This section handles the iterative interaction with the language model. 
@@ -390,67 +663,63 @@ class AnalyzeGPT(ChatGPT_Handler):
         #The prompt history is displayed if show_prompt is enabled. 
         #If a valid output is generated within the maximum number of steps (max_steps), it is displayed and a download option is provided. 
         #If the maximum number of steps is reached without a valid output, it informs the user that the question could not be handled.
-        while count<= max_steps:
-
-            llm_output,next_steps = self.get_next_steps(new_input, stop=["Observation:", f"Thought {count+1}"])
-            if llm_output=='OPENAI_ERROR':
-                st.write("Error Calling Azure Open AI, probably due to max service limit, please try again")
-                break
-            elif llm_output=='WRONG_OUTPUT_FORMAT': #just have open AI try again till the right output comes
-                count +=1
-                continue
-            output =None
-            error= False
-
-            new_input += f"\n{llm_output}"
-            for key, value in next_steps.items():
-                new_input += f"\n{value}"
+        #The step supervisor stops the loop early when the same failing query or output format error keeps coming back.
+        try:
+            while count<= max_steps:
+
+                llm_output,next_steps = self.get_next_steps(new_input, stop=["Observation:", f"Thought {count+1}"])
+                if llm_output=='OPENAI_ERROR':
+                    emit("error", None, "Error Calling Azure Open AI, probably due to max service limit, please try again")
+                    supervisor.finish(count, "openai_error")
+                    break
+                elif llm_output=='WRONG_OUTPUT_FORMAT': #just have open AI try again till the right output comes, unless the supervisor gives up
+                    decision = supervisor.record(count, llm_output, wrong_format=True)
+                    if decision == "abort":
+                        emit("error", None, f"Cannot handle the question, please change the question and try again ({supervisor.stop_reason})")
+                        break
+                    new_input += self._apply_strategy(decision, supervisor, llm_output, None)
+                    count +=1
+                    continue
+                output =None
+                error= False
+                action = None
+
+                new_input += f"\n{llm_output}"
+                for key, value in next_steps.items():
+                    new_input += f"\n{value}"
                 
-                if "SQL" in key.upper():
-                    if show_code:
-                        st.write("SQL Code")
-                        st.code(value)
-                    try:
-                        output = execute_sql(value)
-                    except Exception as e:
+                    if "SQL" in key.upper():
+                        action = value
+                        if show_code:
+                            emit("sql", "SQL Code", value)
+                        try:
+                            output = execute_sql(value)
+                        except Exception as e:
                         
-                        new_input +="Encounter following error, can you try again?\n"+str(e)
-                        error=str(e)
-                else:
-                    if show_code:
-                        st.write(value)
-            if show_prompt:
-                self.st.write("Prompt")
-                self.st.write(self.conversation_history)
-
-            if output is not None:
-                st.write(output)
-           
-                outputstr = io.StringIO()
-                output.to_csv(outputstr, index=False)
-                # Save CSV text to session state
-                self.st.session_state.csv_text = outputstr.getvalue()
-                # Create download button
-                st.download_button(
-                label="Download CSV",
-                data=self.st.session_state.csv_text,
-                file_name="data.csv",
-                mime="text/csv")
-            
-                break
-
-            if error:
-                st.write(error)
-
-            count +=1
-            if count>= max_steps:
-                st.write("Cannot handle the question, please change the question and try again")
-        
-
-
-
-
-
-
-
-    
\ No newline at end of file
+                            new_input +="Encounter following error, can you try again?\n"+str(e)
+                            error=str(e)
+                    else:
+                        if show_code:
+                            emit("thought", None, value)
+                if show_prompt:
+                    emit("prompt", "Prompt", self.conversation_history)
+
+                if output is not None:
+                    emit("result", "result", output)
+                    supervisor.finish(count, "output")
+                    break
+
+                if error:
+                    emit("error", None, error)
+
+                decision = supervisor.record(count, action, error=error if error else "no SQL query in response")
+                if decision == "abort":
+                    emit("error", None, f"Cannot handle the question, please change the question and try again ({supervisor.stop_reason})")
+                    break
+                new_input += self._apply_strategy(decision, supervisor, action, error)
+                count +=1
+        finally:
+            self.gpt_deployment = default_deployment
+        if show_prompt:
+            emit("trace", "Trace", self.trace)
+        return output
@@ -0,0 +1,288 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.....................................................................................................................
+Purpose:
+           -Offline local arXiv index backed by SQLite FTS5 (title, authors and abstract)
+           -Ingests the public arXiv metadata snapshot (JSON lines, one paper per line, plain or .gz) in a single
+            streaming pass with batched inserts, optionally filtered to categories (e.g. q-bio, stat)
+           -Answers the "arxiv search" tool locally in milliseconds: free text, title ("ti"), author ("au", also
+            arXiv's Smith_A form), abstract ("abs") and "all" queries and arXiv ID lookups; the arXiv API stays
+            the fallback. Every word (except stopwords) must match, or any word when no paper matches them all
+           -A file is ingested again when its size or modification time changed (refreshed snapshots keep their name)
+Usage:
+           python arxiv_mirror.py ingest --db data/arxiv_mirror.db --categories q-bio,stat arxiv-metadata-oai-snapshot.json
+           python arxiv_mirror.py search --db data/arxiv_mirror.db "ti:polygenic risk scores"
+References:
+           https://www.kaggle.com/datasets/Cornell-University/arxiv
+           https://info.arxiv.org/help/api/user-manual.html#query_details
+'''
+#.....................................................................................................................
+
+
+# Importing essential libraries and modules
+import argparse
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from pubmed_mirror import STOPWORDS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (rowid INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, data TEXT NOT NULL);
+CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(title, authors, abstract, content='', contentless_delete=1);
+CREATE TABLE IF NOT EXISTS ingested_files (name TEXT PRIMARY KEY, papers INTEGER, ingested_at REAL, size INTEGER, mtime REAL);
+"""
+# SQLite before 3.43 has no contentless_delete; a regular FTS5 table (which also stores the text) is used instead
+SCHEMA_FALLBACK = SCHEMA.replace("content='', contentless_delete=1", "")
+# New (0704.0001, 2101.01234v2) and old (q-bio/0601001) style identifiers
+ARXIV_ID = re.compile(r"^(?:arxiv:)?(\d{4}\.\d{4,5}|[a-z\-]+(?:\.[a-z]{2})?/\d{7})(?:v\d+)?$", re.IGNORECASE)
+# arXiv API field prefixes ("ti:word", or "ti word" as the agent is told to write them)
+# ("all" only with the colon: "all cause mortality" is a free-text query)
+FIELD_PREFIX = re.compile(r"^(ti|au|abs|all(?=:))(?::\s*|\s+)(.+)$", re.IGNORECASE | re.DOTALL)
+FIELD_COLUMNS = {"ti": "title", "au": "authors", "abs": "abstract", "all": None}
+
+
+def _in_categories(categories: str, wanted: Optional[Sequence[str]]) -> bool:
+    # "q-bio" selects q-bio.GN, q-bio.NC, ...; "stat.ML" selects only stat.ML
+    if not wanted:
+        return True
+    return any(category == prefix or category.startswith(prefix + ".") for category in categories.split() for prefix in wanted)
+
+
+def _paper(record: dict) -> dict:
+    # Fields kept from a snapshot record
+    authors = record.get("authors_parsed")
+    if authors:
+        names = ", ".join(" ".join(part for part in (first, last) if part) for last, first, *_ in authors)
+    else:
+        names = " ".join((record.get("authors") or "").split())
+    versions = record.get("versions") or []
+    return {
+        "id": record["id"],
+        "title": " ".join((record.get("title") or "").split()),
+        "authors": names,
+        "abstract": " ".join((record.get("abstract") or "").split()),
+        "categories": record.get("categories", ""),
+        "doi": record.get("doi"),
+        "journal_ref": record.get("journal-ref"),
+        "updated": record.get("update_date", ""),
+        "version": versions[-1]["version"] if versions else "",
+    }
+
+
+def fts_query(query: str, column: Optional[str] = None, operator: str = "AND") -> str:
+    """
+    FTS5 MATCH expression, optionally on one column: the words of the query without stopwords, quoted (so no FTS5
+    syntax leaks in) and joined with AND (every word must occur) or OR (any word). Author queries keep every word
+    and match initials as prefixes, so arXiv's "Smith_A" finds "Alice Smith".
+    """
+    # "_" separates the surname from the initials in arXiv author queries
+    tokens = re.findall(r"[^\W_]+", query.lower())
+    if column != "authors":
+        tokens = [token for token in tokens if token not in STOPWORDS] or tokens
+    terms = f" {operator} ".join(f'"{token}"*' if column == "authors" and len(token) == 1 else f'"{token}"' for token in dict.fromkeys(tokens))
+    if not terms:
+        return ""
+    return f"{{{column}}}: ({terms})" if column else terms
+
+
+class ArxivMirror:
+    """
+    Local arXiv index.
+
+    Parameters:
+        path: SQLite database file
+        batch_size: papers per insert transaction while ingesting
+    """
+
+    def __init__(self, path: str, batch_size: int = 5000) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        try:
+            self._connection.executescript(SCHEMA)
+        except sqlite3.OperationalError:
+            self._connection.executescript(SCHEMA_FALLBACK)
+        # indexes created before files were recognized by size and modification time
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(ingested_files)")}
+        for column, column_type in (("size", "INTEGER"), ("mtime", "REAL")):
+            if column not in columns:
+                self._connection.execute(f"ALTER TABLE ingested_files ADD COLUMN {column} {column_type}")
+        self._lock = threading.Lock()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def _write_batch(self, papers: List[dict]) -> None:
+        with self._lock, self._connection:
+            # papers already in the index (an older snapshot) are replaced
+            ids = [paper["id"] for paper in papers]
+            for start in range(0, len(ids), 500):
+                chunk = ids[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rowids = [row[0] for row in self._connection.execute(f"SELECT rowid FROM papers WHERE id IN ({placeholders})", chunk)]
+                if rowids:
+                    marks = ",".join("?" * len(rowids))
+                    self._connection.execute(f"DELETE FROM papers_fts WHERE rowid IN ({marks})", rowids)
+                    self._connection.execute(f"DELETE FROM papers WHERE rowid IN ({marks})", rowids)
+            for paper in papers:
+                rowid = self._connection.execute("INSERT INTO papers (id, data) VALUES (?, ?)", (paper["id"], json.dumps(paper))).lastrowid
+                self._connection.execute(
+                    "INSERT INTO papers_fts(rowid, title, authors, abstract) VALUES (?, ?, ?, ?)",
+                    (rowid, paper["title"], paper["authors"], paper["abstract"]),
+                )
+
+    def ingest_file(self, path: str, categories: Optional[Sequence[str]] = None, force: bool = False) -> int:
+        """Stream a snapshot file into the index; returns the number of papers (0 if this version was already ingested)."""
+        name = os.path.basename(path)
+        stat = os.stat(path)
+        with self._lock:
+            done = self._connection.execute(
+                "SELECT 1 FROM ingested_files WHERE name = ? AND size = ? AND mtime = ?", (name, stat.st_size, stat.st_mtime)
+            ).fetchone()
+        if done and not force:
+            return 0
+        opener = gzip.open if path.endswith(".gz") else open
+        # one paper may occur twice in a file; the last version wins
+        batch: Dict[str, dict] = {}
+        count = 0
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if not _in_categories(record.get("categories", ""), categories):
+                    continue
+                paper = _paper(record)
+                batch[paper["id"]] = paper
+                count += 1
+                if len(batch) >= self.batch_size:
+                    self._write_batch(list(batch.values()))
+                    batch = {}
+        if batch:
+            self._write_batch(list(batch.values()))
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO ingested_files (name, papers, ingested_at, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                (name, count, time.time(), stat.st_size, stat.st_mtime),
+            )
+        return count
+
+    def ingest(self, paths: Iterable[str], categories: Optional[Sequence[str]] = None, force: bool = False) -> int:
+        total = 0
+        for path in paths:
+            total += self.ingest_file(path, categories, force)
+        if total == 0:
+            return total
+        # merge the FTS5 index segments written by the batches
+        with self._lock:
+            self._connection.execute("INSERT INTO papers_fts(papers_fts) VALUES ('optimize')")
+            self._connection.commit()
+        return total
+
+    def lookup(self, arxiv_ids: List[str]) -> List[dict]:
+        """Papers by arXiv ID (versions are ignored), in the order of the IDs."""
+        ids = [re.sub(r"v\d+$", "", re.sub(r"^arxiv:", "", arxiv_id, flags=re.IGNORECASE)) for arxiv_id in arxiv_ids]
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._connection.execute(f"SELECT id, data FROM papers WHERE id IN ({placeholders})", ids).fetchall()
+        found = {paper_id: json.loads(data) for paper_id, data in rows}
+        return [found[paper_id] for paper_id in ids if paper_id in found]
+
+    def _match(self, match: str, k: int) -> List[dict]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT p.data FROM papers_fts JOIN papers p ON p.rowid = papers_fts.rowid "
+                "WHERE papers_fts MATCH ? ORDER BY bm25(papers_fts) LIMIT ?",
+                (match, k),
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def search(self, query: str, k: int = 3) -> List[dict]:
+        """
+        BM25-ranked papers for an arxiv search tool query: arXiv IDs (separated by spaces) are looked up,
+        "ti"/"au"/"abs" prefixed queries search one field, other ("all") queries title, authors and abstract.
+        Papers must match every word, or any word when no paper matches them all (except for author queries).
+        """
+        query = query.strip()
+        tokens = query.split()
+        if tokens and all(ARXIV_ID.match(token) for token in tokens):
+            return self.lookup(tokens)[:k]
+        column = None
+        prefixed = FIELD_PREFIX.match(query)
+        if prefixed:
+            query, column = prefixed.group(2), FIELD_COLUMNS[prefixed.group(1).lower()]
+        match = fts_query(query, column)
+        if not match:
+            return []
+        papers = self._match(match, k)
+        # (not for authors: any of the words of a name would match other people)
+        if not papers and " AND " in match and column != "authors":
+            papers = self._match(fts_query(query, column, "OR"), k)
+        return papers
+
+
+def format_papers(papers: List[dict], max_chars: int = 4000) -> str:
+    """Papers in the text format of ArxivAPIWrapper.run, with the entry link added."""
+    docs = [
+        f"Published: {paper['updated']}\nTitle: {paper['title']}\nAuthors: {paper['authors']}\n"
+        f"Entry ID: http://arxiv.org/abs/{paper['id']}{paper.get('version') or ''}\nSummary: {paper['abstract']}"
+        for paper in papers
+    ]
+    return "\n\n".join(docs)[:max_chars]
+
+
+_mirror: Optional[ArxivMirror] = None
+_mirror_lock = threading.Lock()
+
+
+def get_arxiv_mirror() -> Optional[ArxivMirror]:
+    """Return the process-wide index (GENEVIC_ARXIV_MIRROR), or None when no index is configured."""
+    global _mirror
+    path = os.environ.get("GENEVIC_ARXIV_MIRROR")
+    if not path or not os.path.exists(path):
+        return None
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = ArxivMirror(path)
+        return _mirror
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local arXiv index (SQLite FTS5) of the arXiv metadata snapshot.")
+    parser.add_argument("command", choices=["ingest", "search"])
+    parser.add_argument("args", nargs="+", help="snapshot files to ingest, or the search query")
+    parser.add_argument("--db", default=os.environ.get("GENEVIC_ARXIV_MIRROR", "data/arxiv_mirror.db"))
+    parser.add_argument("--categories", default="", help="comma-separated categories or archives to keep (e.g. q-bio,stat)")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--force", action="store_true", help="ingest files again even if already ingested")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args(argv)
+    mirror = ArxivMirror(args.db, batch_size=args.batch_size)
+    if args.command == "ingest":
+        start = time.perf_counter()
+        categories = [category.strip() for category in args.categories.split(",") if category.strip()]
+        total = mirror.ingest(args.args, categories, force=args.force)
+        print(f"Ingested {total} papers in {time.perf_counter() - start:.1f}s ({mirror.count()} in the index)")
+    else:
+        start = time.perf_counter()
+        for paper in mirror.search(" ".join(args.args), args.k):
+            print(f"{paper['id']}\t{paper['updated']}\t{paper['title']}")
+        print(f"({(time.perf_counter() - start) * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.........................................................................................
+Purpose:
+        -Command-line entry point that runs a file of questions through AnalyzeGPT without Streamlit
+        -Questions run concurrently (--workers) and the results are written to JSONL or Parquet
+        -Used for nightly batch reports over the PGS Rank database
+Usage:
+        python batch_analyze.py --faq query --output results.jsonl
+        python batch_analyze.py --questions questions.txt --mode visualize --workers 8 --output results.parquet
+        Questions file: .txt (one question per line), .json (list of questions or a prompts_dict like {"ChatGPT": [...]})
+        or .jsonl (one {"question": ...} per line).
+'''
+#..........................................................................................
+
+# Importing essential libraries and modules
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import openai
+import pandas as pd
+from dotenv import load_dotenv
+
+from analyze import AnalyzeGPT, AnalyzeEvent, SQL_Query, ChatGPT_Handler, CollectingSink, get_table_schema
+import pgschat_prompts
+
+# Set some constants for OpenAI API (same as the PGS Chat page)
+max_response_tokens = 1250
+token_limit= 4096
+temperature=0
+
+MODES = {
+    "query": (pgschat_prompts.QUERY_SYSTEM_MESSAGE, pgschat_prompts.QUERY_FEW_SHOT_EXAMPLES, pgschat_prompts.QUERY_EXTRACT_PATTERNS, pgschat_prompts.QUERY_PROMPTS),
+    "visualize": (pgschat_prompts.VISUALIZE_SYSTEM_MESSAGE, pgschat_prompts.VISUALIZE_FEW_SHOT_EXAMPLES, pgschat_prompts.VISUALIZE_EXTRACT_PATTERNS, pgschat_prompts.VISUALIZE_PROMPTS),
+}
+
+
+def load_questions(path, model="ChatGPT"):
+    #Read the questions from a .txt, .json (list or prompts_dict) or .jsonl file
+    path = Path(path)
+    if path.suffix == ".txt":
+        return [line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()]
+    if path.suffix == ".jsonl":
+        questions = []
+        for line in path.read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                item = json.loads(line)
+                questions.append(item["question"] if isinstance(item, dict) else item)
+        return questions
+    data = json.loads(path.read_text(encoding="utf-8"))
+    if isinstance(data, dict):
+        #prompts_dict as in the PGS Chat page
+        data = data[model] if model in data else [q for prompts in data.values() for q in prompts]
+    return list(data)
+
+
+def build_sql_query_tool(sql_engine):
+    #Create the SQL_Query tool from the same settings as the PGS Chat page
+    if sql_engine == "sqlserver":
+        return SQL_Query(driver='ODBC Driver 17 for SQL Server', dbserver=os.environ.get("SQL_SERVER"), database=os.environ.get("SQL_DATABASE"),
+                         db_user=os.environ.get("SQL_USER"), db_password=os.environ.get("SQL_PASSWORD"))
+    db_path = os.environ.get("SQLITE_DB_PATH", "data/PGSrankDB.db")
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"SQLITE database not found: {db_path}")
+    return SQL_Query(db_path=db_path)
+
+
+def run_question(question, mode, sql_engine, sql_query_tool, table_schema, deployment, escalation_deployment, max_rows):
+    #Run one question on a fresh AnalyzeGPT (the conversation history is per instance) and turn the events into a flat record
+    system_message, few_shot_examples, extract_patterns, _ = MODES[mode]
+    sink = CollectingSink()
+    analyzer = AnalyzeGPT(sql_engine=sql_engine, content_extractor=ChatGPT_Handler(extract_patterns=extract_patterns), sql_query_tool=sql_query_tool,
+                          system_message=system_message, few_shot_examples=few_shot_examples, sink=sink, table_schema=table_schema,
+                          escalation_deployment=escalation_deployment, gpt_deployment=deployment, max_response_tokens=max_response_tokens,
+                          token_limit=token_limit, temperature=temperature)
+    start = time.perf_counter()
+    # every record has the same keys, also when the analysis raises
+    record = {"question": question, "mode": mode, "deployment": deployment, "answer": None, "rows": None, "result": None}
+    try:
+        if mode == "query":
+            output = analyzer.query_run(question, show_code=True, show_prompt=False)
+            record["rows"] = None if output is None else output.count()
+            record["result"] = None if output is None else output.page(0, max_rows).to_json(orient="records", date_format="iso")
+        else:
+            record["answer"] = analyzer.run(question, show_code=True, show_prompt=False)
+    except Exception as e:
+        sink.emit(AnalyzeEvent("error", None, str(e)))
+    record["elapsed_s"] = round(time.perf_counter() - start, 3)
+    record["timings"] = json.dumps({stage: round(seconds, 3) for stage, seconds in analyzer.timer.totals.items()})
+    code = [event.data for event in sink.events if event.kind in ("sql", "code")]
+    record["code"] = code[-1] if len(code) > 0 else None
+    record["figures"] = len(sink.of_kind("figure"))
+    record["errors"] = json.dumps([str(event.data) for event in sink.of_kind("error")])
+    record["steps"] = max([entry["step"] for entry in analyzer.trace], default=0)
+    stop = [entry["reason"] for entry in analyzer.trace if entry.get("reason")]
+    record["stop_reason"] = stop[-1] if len(stop) > 0 else None
+    return record
+
+
+def write_results(records, output):
+    #Write the records as JSONL or Parquet depending on the output file extension
+    if output.endswith(".parquet"):
+        pd.DataFrame(records).to_parquet(output, index=False)
+    else:
+        with open(output, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a batch of PGS Chat questions through AnalyzeGPT without Streamlit.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--questions", help="questions file (.txt, .json or .jsonl)")
+    source.add_argument("--faq", choices=list(MODES), help="use the PGS Chat FAQ prompts of this mode")
+    parser.add_argument("--mode", choices=list(MODES), default=None, help="query (Retrieve from DB) or visualize (Visualize DB); defaults to --faq or query")
+    parser.add_argument("--model", choices=["ChatGPT", "GPT-4"], default="ChatGPT")
+    parser.add_argument("--workers", type=int, default=4, help="maximum number of questions running at the same time")
+    parser.add_argument("--max-rows", type=int, default=100, help="maximum number of result rows kept per question")
+    parser.add_argument("--output", default="results.jsonl", help="output file (.jsonl or .parquet)")
+    args = parser.parse_args(argv)
+    if args.faq and args.mode and args.mode != args.faq:
+        parser.error(f"--faq {args.faq} prompts cannot run in --mode {args.mode}")
+
+    # Check if the environment is local or Azure, then load environment variables
+    if os.getenv('WEBSITE_SITE_NAME') is None:
+        load_dotenv(dotenv_path=Path('.') / 'secrets.env')
+    openai.api_type = "azure"
+    openai.api_version = "2023-03-15-preview"
+    openai.api_key = os.environ.get("AZURE_OPENAI_API_KEY")
+    openai.api_base = os.environ.get("AZURE_OPENAI_ENDPOINT")
+    chatgpt = os.environ.get("AZURE_OPENAI_CHATGPT_DEPLOYMENT", "gpt-35-turbo")
+    gpt4 = os.environ.get("AZURE_OPENAI_GPT4_DEPLOYMENT", chatgpt)
+    deployment = chatgpt if args.model == "ChatGPT" else gpt4
+
+    mode = args.mode or args.faq or "query"
+    questions = MODES[args.faq][3][args.model] if args.faq else load_questions(args.questions, args.model)
+    sql_engine = os.environ.get("SQL_ENGINE", "sqlite")
+    sql_query_tool = build_sql_query_tool(sql_engine)
+    # The workers share one SQL_Query; create its engine before they start
+    sql_query_tool.get_engine()
+    # Read the schema once for the whole batch
+    table_schema = get_table_schema(sql_query_tool, sql_engine)
+
+    records = [None] * len(questions)
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {executor.submit(run_question, question, mode, sql_engine, sql_query_tool, table_schema, deployment, gpt4, args.max_rows): i
+                   for i, question in enumerate(questions)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            records[i] = future.result()
+            print(f"[{done}/{len(questions)}] {records[i]['elapsed_s']}s {questions[i]}")
+    write_results(records, args.output)
+    print(f"Wrote {len(records)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.........................................................................................
+Purpose:
+        -Benchmark of the abstract extraction of the "article link handler" tool over a corpus of saved pages
+        -Compares the former extraction (BeautifulSoup tree, text of every <p>) with abstract_extractor.py:
+         per-page p50/p95 latency, output size and, where the expected abstract is known (page.json next to
+         page.html), token recall and precision of the output
+        -The corpus is a directory of saved pages; --save fetches a list of URLs into it (bounded fetch of
+         modified_requests.py). Recall and precision need the expected abstract of each saved page, written by
+         hand as page.json ({"abstract": ...}); no corpus of publisher pages is shipped with the repository
+        -Without --corpus a synthetic corpus is generated (synthetic_pages.py). Its pages are built on the same
+         assumptions as the extractor, so recall/precision there only catch regressions and say nothing about
+         real publisher pages; the latency comparison holds
+        -Exits with status 1 when the extractor is slower than the former extraction or its recall is too low
+Usage:
+        python benchmarks/bench_abstracts.py --save urls.txt --corpus abstract_corpus
+        python benchmarks/bench_abstracts.py --corpus abstract_corpus --report abstracts_report.json
+        python benchmarks/bench_abstracts.py
+'''
+#..........................................................................................
+
+# Importing essential libraries and modules
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from abstract_extractor import extract_abstract
+from synthetic_pages import generate
+
+
+def paragraphs_baseline(page):
+    #Former AbstractSearcher extraction: the text of every <p> of the page
+    soup = BeautifulSoup(page, "lxml")
+    return "".join(data.get_text() + "\n" for data in soup.find_all("p"))
+
+
+def tokens(text):
+    return Counter(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def overlap(expected, output):
+    #Token recall and precision of the output against the expected abstract
+    expected_tokens, output_tokens = tokens(expected), tokens(output)
+    common = sum((expected_tokens & output_tokens).values())
+    recall = common / max(1, sum(expected_tokens.values()))
+    precision = common / max(1, sum(output_tokens.values()))
+    return recall, precision
+
+
+def save_pages(urls_file, corpus):
+    #Fetch the URLs (one per line) into the corpus directory
+    from modified_requests import TextRequestsWrapper
+
+    os.makedirs(corpus, exist_ok=True)
+    wrapper = TextRequestsWrapper(use_cache=False)
+    with open(urls_file) as f:
+        urls = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    for url in urls:
+        try:
+            page = wrapper.fetch(url)
+        except Exception as e:
+            print(f"skipped {url}: {e}")
+            continue
+        if page.kind != "html":
+            print(f"skipped {url}: {page.kind} ({page.reason})")
+            continue
+        name = os.path.join(corpus, hashlib.sha1(url.encode()).hexdigest()[:16] + ".html")
+        with open(name, "w", encoding="utf-8") as f:
+            f.write(page.text())
+        print(f"saved {url} -> {name}")
+
+
+def run(corpus, repeat):
+    #Return per-page measurements of both extractions
+    results = []
+    for path in sorted(glob.glob(os.path.join(corpus, "*.html"))):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            page = f.read()
+        expected = None
+        if os.path.exists(path[:-5] + ".json"):
+            with open(path[:-5] + ".json") as f:
+                expected = json.load(f)
+        row = {"page": os.path.basename(path), "bytes": len(page.encode()), "layout": (expected or {}).get("layout")}
+        for method, extract in (("paragraphs", paragraphs_baseline), ("extractor", lambda p: extract_abstract(p))):
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                output = extract(page)
+                times.append(time.perf_counter() - start)
+            text = output["abstract"] if isinstance(output, dict) else output
+            row[method] = {"s": min(times), "chars": len(text)}
+            if isinstance(output, dict):
+                row[method]["source"] = output["source"]
+            if expected is not None:
+                row[method]["recall"], row[method]["precision"] = overlap(expected["abstract"], text)
+        results.append(row)
+    return results
+
+
+def summarize(results, method):
+    times = np.array([row[method]["s"] for row in results])
+    summary = {
+        "p50_s": float(np.percentile(times, 50)),
+        "p95_s": float(np.percentile(times, 95)),
+        "total_s": float(times.sum()),
+        "mean_chars": float(np.mean([row[method]["chars"] for row in results])),
+    }
+    scored = [row[method] for row in results if "recall" in row[method]]
+    if scored:
+        summary["recall"] = float(np.mean([score["recall"] for score in scored]))
+        summary["precision"] = float(np.mean([score["precision"] for score in scored]))
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Abstract extraction benchmark over saved publisher pages.")
+    parser.add_argument("--corpus", default=None, help="directory of saved pages (*.html, optional *.json with the expected abstract)")
+    parser.add_argument("--save", default=None, help="fetch the URLs listed in this file into --corpus first")
+    parser.add_argument("--pages", type=int, default=140, help="size of the synthetic corpus used without --corpus")
+    parser.add_argument("--repeat", type=int, default=3, help="extract every page this many times (the fastest run counts)")
+    parser.add_argument("--min-recall", type=float, default=0.9)
+    parser.add_argument("--report", default=None, help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    if args.save:
+        if not args.corpus:
+            parser.error("--save needs --corpus")
+        save_pages(args.save, args.corpus)
+    corpus = args.corpus
+    if corpus is None:
+        corpus = os.path.join(tempfile.gettempdir(), "genevic_bench", f"abstract_corpus_{args.pages}")
+        if not glob.glob(os.path.join(corpus, "*.html")):
+            print(f"Generating synthetic corpus with {args.pages} pages ...")
+            generate(corpus, args.pages)
+
+    results = run(corpus, args.repeat)
+    if not results:
+        print(f"No pages in {corpus}")
+        return 1
+    report = {"corpus": corpus, "synthetic": args.corpus is None, "pages": len(results), "summary": {}, "sources": {}, "layouts": {},
+              "results": results}
+    if report["synthetic"]:
+        print("Synthetic corpus: recall/precision check for regressions only (the pages follow the extractor's own assumptions)")
+    for method in ("paragraphs", "extractor"):
+        report["summary"][method] = summary = summarize(results, method)
+        line = f"{method:>10}  p50={summary['p50_s'] * 1000:.1f}ms p95={summary['p95_s'] * 1000:.1f}ms total={summary['total_s']:.2f}s chars={summary['mean_chars']:.0f}"
+        if "recall" in summary:
+            line += f" recall={summary['recall']:.2f} precision={summary['precision']:.2f}"
+        print(line)
+    report["sources"] = dict(Counter(row["extractor"]["source"] or "none" for row in results))
+    print("sources:", ", ".join(f"{source}={count}" for source, count in sorted(report["sources"].items())))
+    for layout in sorted({row["layout"] for row in results if row["layout"]}):
+        rows = [row for row in results if row["layout"] == layout]
+        report["layouts"][layout] = {method: summarize(rows, method) for method in ("paragraphs", "extractor")}
+        fast, slow = report["layouts"][layout]["extractor"], report["layouts"][layout]["paragraphs"]
+        print(f"{layout:>10}  {slow['p50_s'] * 1000:.1f}ms -> {fast['p50_s'] * 1000:.1f}ms, recall {fast.get('recall', float('nan')):.2f}, precision {fast.get('precision', float('nan')):.2f}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+    violations = []
+    extractor, paragraphs = report["summary"]["extractor"], report["summary"]["paragraphs"]
+    if extractor["p50_s"] > paragraphs["p50_s"]:
+        violations.append(f"extractor p50 {extractor['p50_s']:.4f}s > paragraphs p50 {paragraphs['p50_s']:.4f}s")
+    if extractor.get("recall", 1.0) < args.min_recall:
+        violations.append(f"extractor recall {extractor['recall']:.2f} < {args.min_recall}")
+    for violation in violations:
+        print("REGRESSION:", violation)
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
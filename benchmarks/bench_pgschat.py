@@ -0,0 +1,178 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.........................................................................................
+Purpose:
+        -Offline end-to-end benchmark of PGS Chat (AnalyzeGPT.query_run and AnalyzeGPT.run)
+        -Starts the stub LLM server (stub_llm_server.py) replaying recorded completions for the FAQ prompts
+        -Generates synthetic PGS Rank databases (synthetic_pgsdb.py) of the requested sizes
+        -Reports per-stage p50/p95 latency (llm, sql, exec, render), payload size, peak RSS and step counts
+        -Exits with status 1 when a regression threshold (thresholds.json) is exceeded
+Usage:
+        python benchmarks/bench_pgschat.py --rows 1000 100000 --report bench_report.json
+'''
+#..........................................................................................
+
+# Importing essential libraries and modules
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import openai
+import pandas as pd
+from plotly.graph_objects import Figure
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from analyze import AnalyzeGPT, SQL_Query, ChatGPT_Handler, EventSink, get_table_schema
+import pgschat_prompts
+from result_viewer import ResultHandle
+from stub_llm_server import load_recordings, start_server
+from synthetic_pgsdb import generate
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STAGES = ["llm", "sql", "exec", "render"]
+MODES = {
+    "query": (pgschat_prompts.QUERY_SYSTEM_MESSAGE, pgschat_prompts.QUERY_FEW_SHOT_EXAMPLES, pgschat_prompts.QUERY_EXTRACT_PATTERNS),
+    "visualize": (pgschat_prompts.VISUALIZE_SYSTEM_MESSAGE, pgschat_prompts.VISUALIZE_FEW_SHOT_EXAMPLES, pgschat_prompts.VISUALIZE_EXTRACT_PATTERNS),
+}
+
+
+class PayloadSink(EventSink):
+    #Serializes every event the way it would be sent to the browser, so the render stage has a realistic cost
+    def __init__(self) -> None:
+        self.payload_bytes = 0
+    def emit(self, event):
+        data = event.data
+        if isinstance(data, Figure):
+            payload = data.to_json()
+        elif isinstance(data, pd.DataFrame):
+            payload = data.to_json(orient="split", date_format="iso")
+        elif isinstance(data, ResultHandle):
+            #the result viewer sends the first page and the row count
+            payload = data.page(0, 25).to_json(orient="split", date_format="iso") + str(data.count())
+        else:
+            payload = str(data)
+        self.payload_bytes += len(payload)
+
+
+def peak_rss_mb():
+    #ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_case(question, mode, sql_query_tool, table_schema, deployment):
+    system_message, few_shot_examples, extract_patterns = MODES[mode]
+    sink = PayloadSink()
+    analyzer = AnalyzeGPT(sql_engine="sqlite", content_extractor=ChatGPT_Handler(extract_patterns=extract_patterns), sql_query_tool=sql_query_tool,
+                          system_message=system_message, few_shot_examples=few_shot_examples, sink=sink, table_schema=table_schema,
+                          gpt_deployment=deployment, max_response_tokens=1250, token_limit=4096, temperature=0)
+    start = time.perf_counter()
+    if mode == "query":
+        analyzer.query_run(question, show_code=True, show_prompt=False)
+    else:
+        analyzer.run(question, show_code=True, show_prompt=False)
+    result = {stage: analyzer.timer.totals.get(stage, 0.0) for stage in STAGES}
+    result["total"] = time.perf_counter() - start
+    result["steps"] = max([entry["step"] for entry in analyzer.trace], default=0)
+    result["payload_bytes"] = sink.payload_bytes
+    result["stop"] = analyzer.trace[-1]["reason"] if len(analyzer.trace) > 0 else None
+    return result
+
+
+def summarize(results):
+    summary = {}
+    for stage in STAGES + ["total"]:
+        values = [r[stage] for r in results]
+        summary[stage] = {"p50_s": float(np.percentile(values, 50)), "p95_s": float(np.percentile(values, 95))}
+    summary["steps"] = {"mean": float(np.mean([r["steps"] for r in results])), "max": int(max(r["steps"] for r in results))}
+    summary["payload_bytes"] = {"max": int(max(r["payload_bytes"] for r in results))}
+    return summary
+
+
+def check_thresholds(report, thresholds):
+    #Return the list of threshold violations
+    violations = []
+    for key, summary in report["results"].items():
+        mode = key.split("@")[0]
+        limits = thresholds.get(mode, {})
+        for stage, limit in limits.get("max_p95_s", {}).items():
+            if summary[stage]["p95_s"] > limit:
+                violations.append(f"{key}: {stage} p95 {summary[stage]['p95_s']:.3f}s > {limit}s")
+        if "max_mean_steps" in limits and summary["steps"]["mean"] > limits["max_mean_steps"]:
+            violations.append(f"{key}: mean steps {summary['steps']['mean']:.2f} > {limits['max_mean_steps']}")
+        if "max_payload_bytes" in limits and summary["payload_bytes"]["max"] > limits["max_payload_bytes"]:
+            violations.append(f"{key}: payload {summary['payload_bytes']['max']} bytes > {limits['max_payload_bytes']}")
+    if "max_peak_rss_mb" in thresholds and report["peak_rss_mb"] > thresholds["max_peak_rss_mb"]:
+        violations.append(f"peak RSS {report['peak_rss_mb']:.0f}MB > {thresholds['max_peak_rss_mb']}MB")
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline PGS Chat benchmark with a stub LLM server.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000], help="synthetic database sizes (variant rows), 1k to 50M")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--recordings", default=os.path.join(HERE, "recordings", "pgschat_faq.json"))
+    parser.add_argument("--latency-scale", type=float, default=0.0, help="scale the recorded LLM latencies (0 = no simulated latency)")
+    parser.add_argument("--repeat", type=int, default=1, help="run every prompt this many times")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "genevic_bench"), help="where the synthetic databases are kept")
+    parser.add_argument("--thresholds", default=os.path.join(HERE, "thresholds.json"))
+    parser.add_argument("--report", default=None, help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    recordings = load_recordings(args.recordings)
+    server, base_url, completions = start_server(recordings, latency_scale=args.latency_scale)
+    openai.api_type = "azure"
+    openai.api_version = "2023-03-15-preview"
+    openai.api_base = base_url
+    openai.api_key = "stub"
+    os.makedirs(args.workdir, exist_ok=True)
+
+    report = {"results": {}, "latency_scale": args.latency_scale}
+    try:
+        for rows in args.rows:
+            db_path = os.path.join(args.workdir, f"pgs_{rows}.db")
+            if not os.path.exists(db_path):
+                print(f"Generating synthetic database with {rows} rows ...")
+                generate(db_path, rows)
+            sql_query_tool = SQL_Query(db_path=db_path)
+            table_schema = get_table_schema(sql_query_tool, "sqlite")
+            for mode in args.modes:
+                results = []
+                for recording in [r for r in recordings if r["mode"] == mode]:
+                    for _ in range(args.repeat):
+                        results.append(run_case(recording["question"], mode, sql_query_tool, table_schema, "stub"))
+                key = f"{mode}@{rows}"
+                report["results"][key] = summarize(results)
+                summary = report["results"][key]
+                print(f"{key:>20}  " + "  ".join(f"{stage} p50={summary[stage]['p50_s']:.3f}s p95={summary[stage]['p95_s']:.3f}s" for stage in STAGES + ["total"])
+                      + f"  steps mean={summary['steps']['mean']:.2f}  payload max={summary['payload_bytes']['max']}B")
+    finally:
+        server.shutdown()
+    report["peak_rss_mb"] = peak_rss_mb()
+    report["llm_calls"] = completions.calls
+    print(f"peak RSS {report['peak_rss_mb']:.0f}MB, {completions.calls} LLM calls")
+
+    violations = []
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds, encoding="utf-8") as f:
+            violations = check_thresholds(report, json.load(f))
+    report["violations"] = violations
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    for violation in violations:
+        print("REGRESSION:", violation)
+    return 1 if len(violations) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.........................................................................................
+Purpose:
+        -Local OpenAI-compatible stub server that replays recorded chat completions
+        -Serves both Azure (/openai/deployments/<name>/chat/completions) and OpenAI (/v1/chat/completions) routes
+        -Used by the offline benchmarks so that no Azure OpenAI call is made
+Usage:
+        python benchmarks/stub_llm_server.py --port 8765 --recordings benchmarks/recordings/pgschat_faq.json
+'''
+#..........................................................................................
+
+# Importing essential libraries and modules
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def load_recordings(path):
+    #A recordings file is a list of {"question": ..., "mode": ..., "completions": [...], "latency_ms": ...}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _apply_stop(text, stop):
+    #Cut the completion at the first stop sequence, as the real API does
+    for sequence in stop or []:
+        index = text.find(sequence)
+        if index >= 0:
+            text = text[:index]
+    return text
+
+
+class StubCompletions:
+    #Picks the next recorded completion for a conversation.
+    #The server is stateless: the recording is found from the "Question: ..." line in the prompt and
+    #the next completion is the first one whose text does not already appear in the prompt
+    #(AnalyzeGPT appends every completion it got to the next user message).
+    def __init__(self, recordings, default_completion="```sql\nSELECT 1\n```", latency_scale=1.0) -> None:
+        self.recordings = recordings
+        self.default_completion = default_completion
+        self.latency_scale = latency_scale
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def complete(self, messages, stop=None):
+        with self._lock:
+            self.calls += 1
+        prompt = "\n".join(str(message.get("content", "")) for message in messages if message.get("role") != "system")
+        for recording in self.recordings:
+            if f"Question: {recording['question']}" not in prompt:
+                continue
+            completions = [_apply_stop(text, stop) for text in recording["completions"]]
+            latency = recording.get("latency_ms", 0) / 1000.0 * self.latency_scale
+            for text in completions:
+                if text.strip() not in prompt:
+                    return text, latency
+            #the recording is exhausted: repeat the last completion
+            return completions[-1], latency
+        return _apply_stop(self.default_completion, stop), 0.0
+
+
+def make_handler(completions):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not self.path.split("?")[0].endswith("/chat/completions"):
+                self.send_error(404, "Only chat/completions is supported")
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            stop = body.get("stop")
+            if isinstance(stop, str):
+                stop = [stop]
+            text, latency = completions.complete(body.get("messages", []), stop)
+            if latency > 0:
+                time.sleep(latency)
+            response = {
+                "id": f"chatcmpl-stub-{completions.calls}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+            payload = json.dumps(response).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+
+def start_server(recordings, host="127.0.0.1", port=0, latency_scale=1.0):
+    #Start the stub server on a background thread and return (server, base_url, completions)
+    completions = StubCompletions(recordings, latency_scale=latency_scale)
+    server = ThreadingHTTPServer((host, port), make_handler(completions))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}", completions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server replaying recorded completions.")
+    parser.add_argument("--recordings", default="benchmarks/recordings/pgschat_faq.json")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiply the recorded latencies by this factor")
+    args = parser.parse_args(argv)
+    server, base_url, _ = start_server(load_recordings(args.recordings), args.host, args.port, args.latency_scale)
+    print(f"Stub LLM server listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
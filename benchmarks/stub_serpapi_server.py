@@ -0,0 +1,120 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.........................................................................................
+Purpose:
+        -Local stand-in for SerpAPI (Google Scholar engine and Account API) for testing the GoogleScholar tool,
+         its result cache and its quota ledger (serpapi_cache.py) without paid searches
+        -/search.json returns deterministic organic_results built from the query, after a simulated latency;
+         every search uses one unit of the simulated quota, and an exhausted quota is answered like SerpAPI
+        -/account.json reports the searches left
+Usage:
+        python benchmarks/stub_serpapi_server.py --port 8766 --quota 100 --latency 2
+        GENEVIC_SERPAPI_URL=http://127.0.0.1:8766 SERPAPI_API_KEY=stub streamlit run Home.py
+'''
+#..........................................................................................
+
+# Importing essential libraries and modules
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubSerpAPI:
+    #Simulated account: quota, latency and the searches made
+    def __init__(self, quota=100, latency=0.0) -> None:
+        self.quota = quota
+        self.latency = latency
+        self.searches = []
+        self._lock = threading.Lock()
+
+    def search(self, params):
+        if params.get("engine") != "google_scholar":
+            return 400, {"error": "Only the google_scholar engine is supported by the stub."}
+        with self._lock:
+            if self.quota <= 0:
+                return 429, {"error": "Your account has run out of searches."}
+            self.quota -= 1
+            self.searches.append(params.get("q", ""))
+        query = params.get("q", "")
+        results = []
+        for position in range(int(params.get("num", 10))):
+            digest = hashlib.sha1(f"{query}:{position}".encode()).hexdigest()
+            results.append({
+                "position": position,
+                "title": f"{query.title()}: study {position + 1}",
+                "result_id": digest[:12],
+                "link": f"https://doi.org/10.5555/{digest[:8]}",
+                "snippet": f"We report findings on {query} in cohort {position + 1} ...",
+                "publication_info": {"summary": f"A Author, B Author - Journal {position + 1}, 2023 - example.org"},
+            })
+        return 200, {
+            "search_metadata": {"id": digest[:24], "status": "Success"},
+            "search_parameters": {key: value for key, value in params.items() if key != "api_key"},
+            "organic_results": results,
+        }
+
+    def account(self):
+        with self._lock:
+            return 200, {"plan_searches_left": self.quota, "total_searches_left": self.quota, "this_month_usage": len(self.searches)}
+
+
+def make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            if not params.get("api_key"):
+                status, body = 401, {"error": "Invalid API key."}
+            elif url.path in ("/search", "/search.json"):
+                if stub.latency > 0:
+                    time.sleep(stub.latency)
+                status, body = stub.search(params)
+            elif url.path in ("/account", "/account.json"):
+                status, body = stub.account()
+            else:
+                status, body = 404, {"error": "Unknown endpoint."}
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+
+def start_server(host="127.0.0.1", port=0, quota=100, latency=0.0):
+    #Start the stub server on a background thread and return (server, base_url, stub)
+    stub = StubSerpAPI(quota, latency)
+    server = ThreadingHTTPServer((host, port), make_handler(stub))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}", stub
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for SerpAPI (Google Scholar engine).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--quota", type=int, default=100, help="searches before the account runs out")
+    parser.add_argument("--latency", type=float, default=2.0, help="seconds per search (SerpAPI takes a few seconds)")
+    args = parser.parse_args(argv)
+    server, base_url, _ = start_server(args.host, args.port, args.quota, args.latency)
+    print(f"Stub SerpAPI server listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
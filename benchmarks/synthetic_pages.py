@@ -0,0 +1,148 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.........................................................................................
+Purpose:
+        -Generate a corpus of synthetic article landing pages for the abstract extraction benchmark
+        -One layout per family of publisher markup: Highwire meta tags (bioRxiv, PNAS), JSON-LD with a cut
+         og:description, Springer/Nature sections, Elsevier, arXiv, PubMed and an unmarked page
+        -Pages carry the usual boilerplate (navigation, inline scripts, full text, references), so their
+         size (200-600KB) is close to real publisher pages
+        -Every page.html gets a page.json holding the expected abstract and the layout
+        -The layouts follow the same assumptions about publisher markup as abstract_extractor.py, so the corpus
+         guards the extractor against regressions; it does not measure its accuracy on real pages
+Usage:
+        python benchmarks/synthetic_pages.py --pages 140 --output synthetic_corpus
+'''
+#..........................................................................................
+
+# Importing essential libraries and modules
+import argparse
+import html
+import json
+import os
+import random
+
+WORDS = (
+    "gene expression variant locus risk polygenic score cohort association genome wide analysis Alzheimer disease "
+    "neuronal microglia amyloid tau pathway enrichment transcript protein cell model patients controls significant "
+    "heritability ancestry European African sample replication effect size regulatory chromatin methylation "
+    "inflammation signaling receptor kinase mutation phenotype clinical biomarker plasma cerebrospinal fluid"
+).split()
+LAYOUTS = ["highwire", "jsonld", "springer", "elsevier", "arxiv", "pubmed", "unmarked"]
+
+
+def sentence(rng, n_words=None):
+    words = rng.choices(WORDS, k=n_words or rng.randint(12, 28))
+    return " ".join(words).capitalize() + ("," if rng.random() < 0.2 else "") + " " + " ".join(rng.choices(WORDS, k=4)) + "."
+
+
+def paragraph(rng, n_sentences=None):
+    return " ".join(sentence(rng) for _ in range(n_sentences or rng.randint(4, 8)))
+
+
+def boilerplate_head(rng):
+    #Stylesheets, analytics and a large inline script, as on most publisher pages
+    script = "var config = " + json.dumps({f"key{i}": sentence(rng) for i in range(300)}) + ";"
+    links = "".join(f'<link rel="stylesheet" href="/static/css/bundle{i}.css">' for i in range(15))
+    return f"{links}<script>{script}</script><style>body {{ font-family: sans-serif; }}</style>"
+
+
+def navigation(rng):
+    items = "".join(f'<li><a href="/section/{i}">{html.escape(" ".join(rng.choices(WORDS, k=2)))}</a></li>' for i in range(250))
+    return f'<header><nav class="site-nav"><ul>{items}</ul></nav><p class="banner"><a href="/login">Log in</a> | <a href="/subscribe">Subscribe to the journal for full access</a></p></header>'
+
+
+def full_text(rng):
+    sections = []
+    for i in range(rng.randint(12, 25)):
+        paragraphs = "".join(f"<p>{paragraph(rng)}</p>" for _ in range(rng.randint(3, 6)))
+        sections.append(f'<section id="sec{i}"><h2>{html.escape(sentence(rng, 4))}</h2>{paragraphs}</section>')
+    references = "".join(
+        f'<li><p class="c-reference">{html.escape(sentence(rng))} <a href="https://doi.org/10.1000/{i}">doi</a></p></li>'
+        for i in range(rng.randint(80, 200))
+    )
+    return "".join(sections) + f'<section id="references"><h2>References</h2><ol>{references}</ol></section>'
+
+
+def footer(rng):
+    return "<footer>" + "".join(f'<p><a href="/about/{i}">{" ".join(rng.choices(WORDS, k=3))}</a></p>' for i in range(40)) + "</footer>"
+
+
+def page(rng, layout):
+    #Return (html, abstract) of one page
+    title = html.escape(sentence(rng, 10)[:-1])
+    abstract_paragraphs = [paragraph(rng) for _ in range(rng.randint(1, 3))]
+    abstract = " ".join(abstract_paragraphs)
+    escaped = html.escape(abstract, quote=True)
+    cut = html.escape(abstract[:200] + "...", quote=True)
+    #Some publishers cut the description without any mark
+    silent_cut = html.escape(abstract[:160].rsplit(" ", 1)[0], quote=True)
+    meta = [f'<meta name="citation_journal_title" content="Journal of {rng.choice(WORDS).title()}">',
+            f'<meta name="viewport" content="width=device-width">', f'<meta property="og:title" content="{title}">']
+    body_abstract = ""
+    if layout == "highwire":
+        meta += [f'<meta name="citation_title" content="{title}">', f'<meta name="citation_abstract" content="&lt;p&gt;{escaped}&lt;/p&gt;">',
+                 f'<meta property="og:description" content="{cut}">']
+        body_abstract = "".join(f'<div class="section abstract"><h2>Abstract</h2><p>{p}</p></div>' for p in abstract_paragraphs)
+    elif layout == "jsonld":
+        meta += [f'<meta property="og:description" content="{cut}">']
+        jsonld = json.dumps({"@context": "https://schema.org", "@graph": [
+            {"@type": "WebPage", "name": title}, {"@type": "ScholarlyArticle", "headline": title, "abstract": abstract}]})
+        meta += [f'<script type="application/ld+json">{jsonld}</script>']
+    elif layout == "springer":
+        meta += [f'<meta name="description" content="{cut}">']
+        inner = "".join(f"<p>{p}</p>" for p in abstract_paragraphs)
+        body_abstract = f'<section aria-labelledby="Abs1" data-title="Abstract" lang="en"><div class="c-article-section" id="Abs1-section"><h2 class="c-article-section__title" id="Abs1">Abstract</h2><div class="c-article-section__content" id="Abs1-content">{inner}</div></div></section>'
+    elif layout == "elsevier":
+        inner = "".join(f"<p>{p}</p>" for p in abstract_paragraphs)
+        body_abstract = f'<div class="Abstracts u-font-serif" id="abstracts"><div class="abstract author" id="ab0010"><h2 class="section-title">Abstract</h2><div id="as0010"><div class="u-margin-s-bottom" id="sp0010">{inner}</div></div></div></div>'
+    elif layout == "arxiv":
+        body_abstract = f'<blockquote class="abstract mathjax"><span class="descriptor">Abstract:</span>{escaped}</blockquote>'
+    elif layout == "pubmed":
+        meta += [f'<meta name="description" content="{cut}">', f'<meta property="og:description" content="{silent_cut}">']
+        inner = "".join(f"<p>{p}</p>" for p in abstract_paragraphs)
+        body_abstract = f'<div class="abstract" id="abstract"><h2 class="title">Abstract</h2><div class="abstract-content selected" id="eng-abstract">{inner}</div></div>'
+    else:
+        #No markup at all: the abstract is the densest block of paragraphs
+        abstract_paragraphs = [paragraph(rng, 10) for _ in range(4)]
+        abstract = " ".join(abstract_paragraphs)
+        inner = "".join(f"<p>{p}</p>" for p in abstract_paragraphs)
+        doc = (f"<!DOCTYPE html><html><head><title>{title}</title>{boilerplate_head(rng)}</head><body>{navigation(rng)}"
+               f'<main><h1>{title}</h1><div class="entry">{inner}</div></main>{footer(rng)}</body></html>')
+        return doc, abstract
+    doc = (f'<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>{title} | Journal</title>{"".join(meta)}'
+           f"{boilerplate_head(rng)}</head><body>{navigation(rng)}<main><article><h1>{title}</h1>{body_abstract}"
+           f"{full_text(rng)}</article></main>{footer(rng)}</body></html>")
+    return doc, abstract
+
+
+def generate(output, pages, seed=42):
+    #Write `pages` pages (layouts in turn) to the output directory; returns the directory
+    os.makedirs(output, exist_ok=True)
+    rng = random.Random(seed)
+    for i in range(pages):
+        layout = LAYOUTS[i % len(LAYOUTS)]
+        doc, abstract = page(rng, layout)
+        name = os.path.join(output, f"{layout}_{i:04d}")
+        with open(name + ".html", "w", encoding="utf-8") as f:
+            f.write(doc)
+        with open(name + ".json", "w", encoding="utf-8") as f:
+            json.dump({"abstract": abstract, "layout": layout}, f)
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic article landing pages.")
+    parser.add_argument("--pages", type=int, default=140)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    generate(args.output, args.pages, args.seed)
+    print(f"Wrote {args.pages} pages to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.........................................................................................
+Purpose:
+        -Generate a synthetic PGS Rank SQLite database of a given size for the benchmarks
+        -pgssnpmeta holds one row per (PGS score, variant); pgsmeta holds one row per PGS score
+        -Rows are inserted in batches so that 50M variant rows can be generated with flat memory
+Usage:
+        python benchmarks/synthetic_pgsdb.py --rows 1000000 --output data/pgs_1m.db
+'''
+#..........................................................................................
+
+# Importing essential libraries and modules
+import argparse
+import os
+import random
+import sqlite3
+
+TRAITS = ["Alzheimer", "Schizophrenia", "Parkinson", "Bipolar", "Type 2 Diabetes", "Coronary Artery Disease"]
+ANCESTRIES = ["European", "African", "East Asian", "South Asian", "Hispanic", "Multi-ancestry"]
+FUNCS = ["exonic", "intronic", "intergenic", "UTR3", "UTR5", "ncRNA_intronic", "upstream", "downstream"]
+KNOWN_GENES = ["APOE", "TREM2", "SORL1", "BIN1", "CLU", "PICALM", "ABCA7", "CR1", "CD33", "MS4A6A", "EPHA1", "PTK2B"]
+
+SCHEMA = """
+CREATE TABLE pgsmeta (pgsid TEXT PRIMARY KEY, trait TEXT, ancestry TEXT, nvariants INTEGER);
+CREATE TABLE pgssnpmeta (pgsid TEXT, rsid TEXT, snpcoord TEXT, gene TEXT, func TEXT, rank REAL, trait TEXT);
+"""
+INDEXES = """
+CREATE INDEX idx_pgssnpmeta_trait_gene ON pgssnpmeta (trait, gene);
+CREATE INDEX idx_pgssnpmeta_trait_rank ON pgssnpmeta (trait, rank);
+CREATE INDEX idx_pgssnpmeta_pgsid ON pgssnpmeta (pgsid);
+"""
+
+
+def generate(output, rows, variants_per_score=1000, n_genes=20000, batch_size=50000, seed=42):
+    #Write a database with `rows` variant rows; returns the path
+    if os.path.exists(output):
+        os.remove(output)
+    rng = random.Random(seed)
+    genes = KNOWN_GENES + [f"GENE{i}" for i in range(max(0, n_genes - len(KNOWN_GENES)))]
+    n_scores = max(1, (rows + variants_per_score - 1) // variants_per_score)
+
+    connection = sqlite3.connect(output)
+    connection.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + SCHEMA)
+    scores = []
+    for i in range(n_scores):
+        scores.append((f"PGS{i + 1:06d}", TRAITS[i % len(TRAITS)], rng.choice(ANCESTRIES), 0))
+
+    batch = []
+    counts = [0] * n_scores
+    for row in range(rows):
+        score = row % n_scores
+        pgsid, trait, _, _ = scores[score]
+        counts[score] += 1
+        #known genes are frequent so that the FAQ prompts return something
+        gene = rng.choice(KNOWN_GENES) if rng.random() < 0.2 else rng.choice(genes)
+        chromosome = rng.randint(1, 22)
+        position = rng.randint(10000, 240000000)
+        batch.append((pgsid, f"rs{rng.randint(1, 999999999)}", f"{chromosome}_{position}", gene, rng.choice(FUNCS), round(rng.random(), 4), trait))
+        if len(batch) >= batch_size:
+            connection.executemany("INSERT INTO pgssnpmeta VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if len(batch) > 0:
+        connection.executemany("INSERT INTO pgssnpmeta VALUES (?, ?, ?, ?, ?, ?, ?)", batch)
+    connection.executemany("INSERT INTO pgsmeta VALUES (?, ?, ?, ?)", [(s[0], s[1], s[2], counts[i]) for i, s in enumerate(scores)])
+    connection.executescript(INDEXES)
+    connection.commit()
+    connection.close()
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic PGS Rank SQLite database.")
+    parser.add_argument("--rows", type=int, default=1000, help="number of variant rows (1k to 50M)")
+    parser.add_argument("--output", default="data/pgs_synthetic.db")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    generate(args.output, args.rows, seed=args.seed)
+    print(f"Wrote {args.rows} variant rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.....................................................................................................................
+Purpose:
+           -Record/replay ("cassette") layer for all outbound LLM and HTTP traffic
+           -Hooked into ChatGPT_Handler._call_llm, modified_requests.Requests, NewPubMedAPIWrapper,
+            the arxiv and Google Scholar tools and the gseapy enrichr call of the Gene API Chat page
+           -Requests and responses are stored in a gzip-compressed JSON lines file and replayed
+            deterministically with the original (or a scaled) latency, so that benchmarks run without network
+Usage:
+           GENEVIC_CASSETTE=cassettes/session.jsonl.gz GENEVIC_CASSETTE_MODE=record streamlit run Home.py
+           GENEVIC_CASSETTE=cassettes/session.jsonl.gz GENEVIC_CASSETTE_MODE=replay GENEVIC_CASSETTE_LATENCY=0 python benchmarks/bench_pgschat.py
+'''
+#.....................................................................................................................
+
+
+# Importing essential libraries and modules
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+import pandas as pd
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when a request was not recorded."""
+
+
+class Cassette:
+    """
+    Record/replay store for outbound calls.
+
+    Parameters:
+        path: gzip-compressed JSON lines file holding the recorded interactions
+        mode: "off" (call through), "record" (call through and store) or "replay" (never call out)
+        latency_scale: replayed calls sleep for the recorded latency times this factor (0 = no sleep)
+        strict: in replay mode, raise CassetteMiss for unknown requests instead of calling through
+    """
+
+    def __init__(self, path: Optional[str] = None, mode: str = "off", latency_scale: float = 1.0, strict: bool = True) -> None:
+        if mode not in ("off", "record", "replay"):
+            raise ValueError(f"unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode if path else "off"
+        self.latency_scale = latency_scale
+        self.strict = strict
+        self._entries: Dict[str, list] = {}
+        self._replayed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        if self.mode == "replay":
+            self._load()
+
+    @staticmethod
+    def key(kind: str, request: Dict[str, Any]) -> str:
+        canonical = json.dumps({"kind": kind, "request": request}, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], []).append(entry)
+
+    def _save(self, entry: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        #every entry is its own gzip member, so the file can be appended to while recording
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+
+    def _next_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        #identical requests are replayed in recorded order; the last one repeats
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            i = self._replayed.get(key, 0)
+            self._replayed[key] = i + 1
+            return entries[min(i, len(entries) - 1)]
+
+    def call(self, kind: str, request: Dict[str, Any], fn: Callable[[], Any],
+             encode: Callable[[Any], Any] = lambda value: value, decode: Callable[[Any], Any] = lambda value: value) -> Any:
+        """Run fn() through the cassette; encode/decode convert the result to and from JSON."""
+        if self.mode == "off":
+            return fn()
+        key = self.key(kind, request)
+        if self.mode == "replay":
+            entry = self._next_entry(key)
+            if entry is None:
+                if self.strict:
+                    raise CassetteMiss(f"no recorded {kind} response for {json.dumps(request, default=str)[:200]}")
+                return fn()
+            if self.latency_scale > 0:
+                time.sleep(entry["elapsed"] * self.latency_scale)
+            return decode(entry["response"])
+        start = time.perf_counter()
+        value = fn()
+        entry = {"key": key, "kind": kind, "request": request, "response": encode(value), "elapsed": time.perf_counter() - start}
+        with self._lock:
+            self._entries.setdefault(key, []).append(entry)
+            self._save(entry)
+        return value
+
+    async def acall(self, kind: str, request: Dict[str, Any], fn: Callable[[], Any],
+                    encode: Callable[[Any], Any] = lambda value: value, decode: Callable[[Any], Any] = lambda value: value) -> Any:
+        """Async version of call(); fn() returns an awaitable."""
+        if self.mode == "off":
+            return await fn()
+        key = self.key(kind, request)
+        if self.mode == "replay":
+            entry = self._next_entry(key)
+            if entry is None:
+                if self.strict:
+                    raise CassetteMiss(f"no recorded {kind} response for {json.dumps(request, default=str)[:200]}")
+                return await fn()
+            if self.latency_scale > 0:
+                import asyncio
+                await asyncio.sleep(entry["elapsed"] * self.latency_scale)
+            return decode(entry["response"])
+        start = time.perf_counter()
+        value = await fn()
+        entry = {"key": key, "kind": kind, "request": request, "response": encode(value), "elapsed": time.perf_counter() - start}
+        with self._lock:
+            self._entries.setdefault(key, []).append(entry)
+            self._save(entry)
+        return value
+
+
+# Helpers to store bytes and DataFrames in the JSON lines file
+def encode_bytes(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def decode_bytes(data: str) -> bytes:
+    return base64.b64decode(data.encode("ascii"))
+
+
+def encode_dataframe(df: pd.DataFrame) -> str:
+    return df.to_json(orient="split", date_format="iso")
+
+
+def decode_dataframe(data: str) -> pd.DataFrame:
+    return pd.read_json(io.StringIO(data), orient="split")
+
+
+_cassette: Optional[Cassette] = None
+
+
+def get_cassette() -> Cassette:
+    """Return the process-wide cassette, configured from the GENEVIC_CASSETTE* environment variables."""
+    global _cassette
+    if _cassette is None:
+        _cassette = Cassette(
+            path=os.environ.get("GENEVIC_CASSETTE"),
+            mode=os.environ.get("GENEVIC_CASSETTE_MODE", "replay" if os.environ.get("GENEVIC_CASSETTE") else "off"),
+            latency_scale=float(os.environ.get("GENEVIC_CASSETTE_LATENCY", "1.0")),
+        )
+    return _cassette
+
+
+@contextmanager
+def use_cassette(path: str, mode: str = "replay", latency_scale: float = 1.0, strict: bool = True):
+    """Temporarily install a cassette as the process-wide one (e.g. in a benchmark)."""
+    global _cassette
+    previous = _cassette
+    _cassette = Cassette(path, mode, latency_scale, strict)
+    try:
+        yield _cassette
+    finally:
+        _cassette = previous
@@ -0,0 +1,261 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.....................................................................................................................
+Purpose:
+           -Support code for llm_steps.py (the "literature search (all sources)" tool)
+           -Fans a query out to PubMed, arXiv and Google Scholar concurrently, each source with its own deadline,
+            so one tool call replaces three or more agent iterations
+           -Results are deduplicated across sources by normalized DOI, PMID, arXiv ID or title and merged with
+            reciprocal-rank fusion (RRF); a source that fails or misses its deadline is left out
+           -arXiv is searched in the local snapshot index first when one is configured (arxiv_mirror.py)
+References:
+           Cormack, Clarke and Buettcher (2009), Reciprocal rank fusion outperforms Condorcet and individual rank
+           learning methods, SIGIR '09: https://doi.org/10.1145/1571941.1572114
+'''
+#.....................................................................................................................
+
+
+# Importing essential libraries and modules
+import asyncio
+import re
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import arxiv
+import requests
+from langchain.schema import Document
+
+from arxiv_mirror import get_arxiv_mirror
+from cassette import get_cassette
+from identifier_resolver import extract_identifiers
+from pubmed_client import run_sync
+from rate_governor import get_governor
+
+# Seconds each source may take before its results are left out
+SOURCE_DEADLINES = {"pubmed": 8.0, "arxiv": 10.0, "google scholar": 8.0}
+DEFAULT_DEADLINE = 8.0
+# RRF constant: damps the weight of the top ranks (60 in the original paper)
+RRF_K = 60
+ID_FIELDS = ("doi", "pmid", "arxiv")
+
+Source = Callable[[str], Awaitable[List[dict]]]
+
+
+def normalize_doi(doi: Optional[str]) -> str:
+    """Lower-case DOI without resolver prefix or trailing punctuation."""
+    doi = (doi or "").strip().lower()
+    doi = re.sub(r"^(https?://(dx\.)?doi\.org/|doi:\s*)", "", doi)
+    return doi.rstrip(".,;)")
+
+
+def normalize_arxiv(arxiv_id: Optional[str]) -> str:
+    """arXiv ID without URL, "arXiv:" prefix or version."""
+    arxiv_id = (arxiv_id or "").strip().lower()
+    arxiv_id = re.sub(r"^(https?://(export\.)?arxiv\.org/(abs|pdf)/|arxiv:\s*)", "", arxiv_id)
+    return re.sub(r"(v\d+)?(\.pdf)?$", "", arxiv_id)
+
+
+def normalize_title(title: Optional[str]) -> str:
+    """Lower-case words of a title (punctuation, markup and accents of the sources differ)."""
+    title = re.sub(r"<[^>]+>", " ", title or "").lower()
+    return " ".join(re.findall(r"[a-z0-9]+", re.sub(r"['\u2019]s?\b", "", title)))
+
+
+def record_keys(record: dict) -> List[str]:
+    """Deduplication keys of a result: its identifiers and its normalized title."""
+    keys = []
+    if normalize_doi(record.get("doi")):
+        keys.append("doi:" + normalize_doi(record.get("doi")))
+    if record.get("pmid"):
+        keys.append("pmid:" + str(record["pmid"]).strip())
+    if normalize_arxiv(record.get("arxiv")):
+        keys.append("arxiv:" + normalize_arxiv(record.get("arxiv")))
+    title = normalize_title(record.get("title"))
+    # very short titles ("Editorial", "Reply") are not distinctive
+    if len(title.split()) >= 4:
+        keys.append("title:" + title)
+    return keys
+
+
+def reciprocal_rank_fusion(ranked: Dict[str, List[dict]], k: int = RRF_K, top_k: Optional[int] = None) -> List[dict]:
+    """
+    Merge ranked result lists: the same article found by several sources becomes one result with the
+    union of their fields and the score sum(1 / (k + rank)) over the sources (rank starting at 1).
+    """
+    merged: List[dict] = []
+    index: Dict[str, int] = {}
+    for source, records in ranked.items():
+        for rank, record in enumerate(records, start=1):
+            keys = record_keys(record)
+            groups = sorted({index[key] for key in keys if key in index})
+            if groups:
+                position = groups[0]
+                # a record may link groups that were separate so far (e.g. DOI from one, title from another)
+                for other in groups[1:]:
+                    _merge(merged[position], merged[other])
+                    merged[other] = None
+                    for key, value in list(index.items()):
+                        if value == other:
+                            index[key] = position
+                target = merged[position]
+            else:
+                position = len(merged)
+                target = {"sources": [], "score": 0.0, "best_rank": rank}
+                merged.append(target)
+            _merge(target, {**record, "sources": [source], "score": 1.0 / (k + rank), "best_rank": rank})
+            for key in record_keys(target):
+                index[key] = position
+    fused = sorted((group for group in merged if group is not None), key=lambda group: (-group["score"], group["best_rank"]))
+    return fused[:top_k] if top_k else fused
+
+
+def _merge(target: dict, record: dict) -> None:
+    # Fold one result into a merged result
+    new_sources = [source for source in record.get("sources", []) if source not in target["sources"]]
+    # a source counts once per article (its best rank), even if it lists the article twice
+    if new_sources:
+        target["score"] += record.get("score", 0.0)
+    target["best_rank"] = min(target["best_rank"], record.get("best_rank", target["best_rank"]))
+    target["sources"] += new_sources
+    for field, value in record.items():
+        if field in ("score", "best_rank", "sources") or not value:
+            continue
+        if field == "abstract":
+            # snippets are shorter than abstracts
+            if len(value) > len(target.get("abstract") or ""):
+                target["abstract"] = value
+        elif not target.get(field):
+            target[field] = value
+
+
+def to_document(record: dict) -> Document:
+    metadata = {field: record[field] for field in ("title", "authors", "date", "link") if record.get(field)}
+    metadata.update({field: record[field] for field in ID_FIELDS if record.get(field)})
+    metadata["sources"] = ", ".join(record["sources"])
+    return Document(page_content=record.get("abstract") or "", metadata=metadata)
+
+
+class FederatedSearch:
+    """
+    Concurrent search over several sources with rank fusion.
+
+    Parameters:
+        sources: source name -> coroutine function returning ranked results (dicts with title, abstract,
+                 authors, date, link and any of doi, pmid, arxiv)
+        deadlines: seconds per source (SOURCE_DEADLINES by default)
+        top_k: number of fused results returned
+        k: RRF constant
+    After each search, last_status holds what every source returned ("5 results", "timed out", "error: ...").
+    """
+
+    def __init__(self, sources: Dict[str, Source], deadlines: Optional[Dict[str, float]] = None, top_k: int = 8,
+                 k: int = RRF_K) -> None:
+        self.sources = sources
+        self.deadlines = {**SOURCE_DEADLINES, **(deadlines or {})}
+        self.top_k = top_k
+        self.k = k
+        self.last_status: Dict[str, str] = {}
+
+    async def _run_source(self, name: str, query: str) -> List[dict]:
+        try:
+            records = await asyncio.wait_for(self.sources[name](query), self.deadlines.get(name, DEFAULT_DEADLINE))
+        except asyncio.TimeoutError:
+            self.last_status[name] = "timed out"
+            return []
+        except Exception as e:
+            self.last_status[name] = f"error: {e}"
+            return []
+        self.last_status[name] = f"{len(records)} results"
+        return records
+
+    async def asearch(self, query: str) -> List[Document]:
+        """Fused results of all sources as Documents (abstract as content, fields and sources as metadata)."""
+        self.last_status = {}
+        names = list(self.sources)
+        results = await asyncio.gather(*[self._run_source(name, query) for name in names])
+        fused = reciprocal_rank_fusion(dict(zip(names, results)), self.k, self.top_k)
+        return [to_document(record) for record in fused]
+
+    def search(self, query: str) -> List[Document]:
+        """Sync facade over asearch() (runs on the shared client loop)."""
+        return run_sync(self.asearch(query))
+
+
+# Source adapters: ranked results of each wrapper in the common record format
+
+def pubmed_source(pubmed) -> Source:
+    async def search(query: str) -> List[dict]:
+        return [
+            {"title": article.get("title"), "abstract": article.get("summary"), "authors": ", ".join(article.get("authors") or []),
+             "date": article.get("pub_date"), "link": article.get("link"), "pmid": article.get("uid"), "doi": article.get("doi")}
+            for article in await pubmed.aload(query)
+        ]
+    return search
+
+
+class TimeoutSession(requests.Session):
+    """requests.Session with a default timeout (the arxiv package sets none)."""
+
+    def __init__(self, timeout: float) -> None:
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(*args, **kwargs)
+
+
+def arxiv_source(arxiv_wrapper, deadline: float = SOURCE_DEADLINES["arxiv"]) -> Source:
+    def local(query: str) -> List[dict]:
+        # local snapshot index (arxiv_mirror.py), if configured
+        mirror = get_arxiv_mirror()
+        if mirror is None:
+            return []
+        return [
+            {"title": paper["title"], "abstract": paper["abstract"], "authors": paper["authors"], "date": paper["updated"],
+             "link": f"http://arxiv.org/abs/{paper['id']}{paper.get('version') or ''}", "arxiv": paper["id"], "doi": paper.get("doi")}
+            for paper in mirror.search(query, arxiv_wrapper.top_k_results)
+        ]
+
+    def lookup(query: str, until: float) -> List[dict]:
+        # asyncio.wait_for does not stop this thread: the slot wait and the request end at the deadline too,
+        # so that a late search does not hold the arXiv slot (one request at a time) for the next callers
+        with get_governor("export.arxiv.org").slot(timeout=until - time.monotonic()):
+            client = arxiv.Client(num_retries=0)
+            client._session = TimeoutSession(max(0.1, until - time.monotonic()))
+            search = arxiv_wrapper.arxiv_search(query[: arxiv_wrapper.ARXIV_MAX_QUERY_LENGTH], max_results=arxiv_wrapper.top_k_results)
+            return [
+                {"title": result.title, "abstract": " ".join(result.summary.split()),
+                 "authors": ", ".join(author.name for author in result.authors), "date": str(result.published.date()),
+                 "link": result.entry_id, "arxiv": result.get_short_id(), "doi": result.doi}
+                for result in client.results(search)
+            ]
+
+    async def search(query: str) -> List[dict]:
+        until = time.monotonic() + deadline
+        records = await asyncio.to_thread(local, query)
+        if records:
+            return records
+        # the arxiv package is synchronous
+        request = {"query": query, "max_results": arxiv_wrapper.top_k_results, "records": True}
+        return await asyncio.to_thread(get_cassette().call, "arxiv", request, lambda: lookup(query, until))
+    return search
+
+
+def scholar_source(google_scholar) -> Source:
+    async def search(query: str) -> List[dict]:
+        records = []
+        for result in await google_scholar.aorganic_results(query):
+            link = result.get("link") or ""
+            identifiers = extract_identifiers(link)
+            records.append({
+                "title": result.get("title"), "abstract": result.get("snippet"), "link": link,
+                "authors": (result.get("publication_info") or {}).get("summary"),
+                "doi": (identifiers["doi"] or [None])[0], "pmid": (identifiers["pmid"] or [None])[0],
+                "arxiv": (identifiers["arxiv"] or [None])[0], "result_id": result.get("result_id"),
+            })
+        return records
+    return search
@@ -0,0 +1,177 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.........................................................................................
+Purpose:
+        -Keep the payload of the Plotly figures built by the LLM in PGS Chat (show(fig) in AnalyzeGPT.run) bounded
+        -Scatter traces above a point threshold are switched to WebGL (Scattergl)
+        -Line traces are downsampled with Largest-Triangle-Three-Buckets (LTTB), marker-only traces are decimated
+        -Heatmaps are aggregated block-wise (mean) to a maximum number of cells
+        -Per-point hover text that repeats one value is collapsed into a single value
+'''
+#..........................................................................................
+
+# Importing essential libraries and modules
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+WEBGL_THRESHOLD = 5000  # scatter traces with more points are rendered with WebGL
+MAX_POINTS = 10000  # maximum number of points per scatter/line trace
+MAX_CELLS = 250000  # maximum number of heatmap cells
+
+# Per-point trace attributes that have to be subset together with x and y
+POINT_ATTRIBUTES = ["x", "y", "text", "hovertext", "customdata", "ids"]
+MARKER_ATTRIBUTES = ["color", "size", "symbol", "opacity"]
+# Scatter properties that Scattergl does not accept
+SVG_ONLY_PROPERTIES = ["stackgroup", "fillpattern"]
+
+
+def _numeric(values):
+    #Numeric representation of x values for LTTB (datetimes as int64, categories by position)
+    series = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype=float)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.astype("int64").to_numpy(dtype=float)
+    converted = pd.to_datetime(series, errors="coerce")
+    if converted.notna().all():
+        return converted.astype("int64").to_numpy(dtype=float)
+    return np.arange(len(series), dtype=float)
+
+
+def lttb_indices(x, y, n_out):
+    #Indices of the points kept by Largest-Triangle-Three-Buckets downsampling
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    #mean of every following bucket, the last point being the bucket after the last one
+    starts = np.append(edges[1:-1], n - 1)
+    ends = np.append(edges[2:], n)
+    sizes = np.maximum(ends - starts, 1)
+    avg_x = np.add.reduceat(x, starts) / sizes
+    avg_y = np.add.reduceat(y, starts) / sizes
+    indices = np.empty(n_out, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if end <= start:
+            indices[i + 1] = a
+            continue
+        areas = np.abs((x[a] - avg_x[i]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y[i] - y[a]))
+        a = start + int(np.nanargmax(areas)) if np.isfinite(areas).any() else start
+        indices[i + 1] = a
+    return indices
+
+
+def _subset(trace, keep, n):
+    #Subset every per-point attribute of the trace to the kept indices
+    for attribute in POINT_ATTRIBUTES:
+        values = trace.get(attribute)
+        if values is not None and not isinstance(values, str) and np.ndim(values) > 0 and len(values) == n:
+            trace[attribute] = np.asarray(values, dtype=object if attribute in ("text", "hovertext", "ids") else None)[keep]
+    marker = trace.get("marker")
+    if marker:
+        for attribute in MARKER_ATTRIBUTES:
+            values = marker.get(attribute)
+            if values is not None and not isinstance(values, str) and np.ndim(values) > 0 and len(values) == n:
+                marker[attribute] = np.asarray(values)[keep]
+
+
+def _collapse_hover_text(trace):
+    #Per-point text arrays that repeat a single value are replaced by that value
+    for attribute in ("text", "hovertext"):
+        values = trace.get(attribute)
+        if values is not None and not isinstance(values, str) and np.ndim(values) > 0 and len(values) > 1:
+            unique = pd.unique(pd.Series(values, dtype=object))
+            if len(unique) == 1:
+                trace[attribute] = unique[0]
+
+
+def _optimize_scatter(trace, webgl_threshold, max_points):
+    #Stacked and pattern-filled traces (px.area) have no WebGL version and cannot be thinned one by one: left as SVG
+    if any(trace.get(name) for name in SVG_ONLY_PROPERTIES):
+        return trace, 0
+    y = trace.get("y")
+    x = trace.get("x")
+    n = len(y) if y is not None else (len(x) if x is not None else 0)
+    if n <= webgl_threshold:
+        return trace, n
+    mode = trace.get("mode") or ("lines" if n > 20 else "lines+markers")
+    if n > max_points:
+        if "lines" in mode and y is not None and pd.api.types.is_numeric_dtype(pd.Series(y)):
+            keep = lttb_indices(_numeric(x) if x is not None else np.arange(n), y, max_points)
+        else:
+            keep = np.linspace(0, n - 1, max_points).astype(int)
+        _subset(trace, keep, n)
+    trace["type"] = "scattergl"
+    return trace, n
+
+
+def _block_mean(z, row_factor, col_factor):
+    #Mean over row_factor x col_factor blocks (NaN aware); the last block of an axis may be smaller
+    rows, cols = z.shape
+    pad_rows = (-rows) % row_factor
+    pad_cols = (-cols) % col_factor
+    padded = np.pad(z.astype(float), ((0, pad_rows), (0, pad_cols)), constant_values=np.nan)
+    blocks = padded.reshape(padded.shape[0] // row_factor, row_factor, padded.shape[1] // col_factor, col_factor)
+    with np.errstate(invalid="ignore"):
+        return np.nanmean(blocks, axis=(1, 3))
+
+
+def _optimize_heatmap(trace, max_cells):
+    z = trace.get("z")
+    if z is None:
+        return trace, 0
+    try:
+        z = np.asarray(z, dtype=float)
+    except (TypeError, ValueError):
+        return trace, 0
+    if z.ndim != 2:
+        return trace, z.size
+    n = z.size
+    if n <= max_cells:
+        return trace, n
+    factor = int(np.ceil(np.sqrt(n / max_cells)))
+    row_factor = min(factor, z.shape[0])
+    col_factor = min(int(np.ceil(n / max_cells / row_factor)), z.shape[1])
+    trace["z"] = _block_mean(z, row_factor, col_factor)
+    #label every block with the first label it covers
+    for axis, step in (("x", col_factor), ("y", row_factor)):
+        labels = trace.get(axis)
+        if labels is not None and np.ndim(labels) > 0:
+            trace[axis] = np.asarray(labels, dtype=object)[::step]
+    for attribute in ("text", "hovertext", "customdata"):
+        trace.pop(attribute, None)
+    return trace, n
+
+
+def optimize_figure(fig, webgl_threshold=WEBGL_THRESHOLD, max_points=MAX_POINTS, max_cells=MAX_CELLS):
+    #Return a figure with a bounded payload; small figures are returned unchanged
+    traces = [trace.to_plotly_json() for trace in fig.data]
+    changed = False
+    for trace in traces:
+        trace_type = trace.get("type", "scatter")
+        if trace_type in ("scatter", "scattergl"):
+            _, n = _optimize_scatter(trace, webgl_threshold, max_points)
+        elif trace_type == "heatmap":
+            _, n = _optimize_heatmap(trace, max_cells)
+        else:
+            continue
+        if n > webgl_threshold:
+            _collapse_hover_text(trace)
+            changed = True
+    if not changed:
+        return fig
+    try:
+        return go.Figure(data=traces, layout=fig.layout)
+    except ValueError:
+        #a property the rebuilt trace type does not accept: the original figure still renders
+        return fig
@@ -0,0 +1,243 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.....................................................................................................................
+Purpose:
+           -Support code for modified_requests.py (TextRequestsWrapper)
+           -On-disk (SQLite) cache of HTTP response bodies keyed by method and URL, shared by all sessions
+           -Follows Cache-Control (no-store, private, no-cache, max-age, s-maxage), Expires and Age; responses
+            without explicit freshness get the usual heuristic of 10% of their Last-Modified age
+           -Stale entries are revalidated with If-None-Match/If-Modified-Since: a 304 reuses the stored body
+           -Total size budget with least-recently-used eviction
+References:
+           https://www.rfc-editor.org/rfc/rfc9111
+'''
+#.....................................................................................................................
+
+
+# Importing essential libraries and modules
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    cache_key TEXT PRIMARY KEY, url TEXT NOT NULL, status INTEGER NOT NULL, headers TEXT NOT NULL, body BLOB NOT NULL,
+    size INTEGER NOT NULL, stored_at REAL NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+"""
+CACHEABLE_METHODS = ("GET", "HEAD")
+CACHEABLE_STATUS = (200, 203, 300, 301, 308, 404, 410)
+# Headers describing the transfer (bodies are stored decoded) or the client, not the stored response
+UNSTORED_HEADERS = ("connection", "content-encoding", "content-length", "keep-alive", "set-cookie", "transfer-encoding")
+# Upper bound of the heuristic freshness of responses without max-age/Expires
+HEURISTIC_MAX_AGE = 24 * 3600
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Cache-Control directives (lower case) with their values (None for directives without one)."""
+    directives: Dict[str, Optional[str]] = {}
+    for part in (value or "").split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip().strip('"') or None
+    return directives
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _seconds(value: Optional[str]) -> Optional[float]:
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers: Dict[str, str], now: float) -> Optional[float]:
+    """
+    Seconds a response stays fresh, 0 when it must be revalidated on every use,
+    or None when it must not be stored at all.
+    """
+    headers = {name.lower(): value for name, value in headers.items()}
+    cache_control = parse_cache_control(headers.get("cache-control"))
+    # a cache shared by every user must not keep private responses
+    if "no-store" in cache_control or "private" in cache_control or headers.get("vary", "").strip() == "*":
+        return None
+    if "no-cache" in cache_control:
+        return 0.0
+    age = _seconds(headers.get("age")) or 0.0
+    for directive in ("s-maxage", "max-age"):
+        if directive in cache_control:
+            max_age = _seconds(cache_control[directive])
+            return max(0.0, max_age - age) if max_age is not None else 0.0
+    date = _http_date(headers.get("date")) or now
+    expires = headers.get("expires")
+    if expires is not None:
+        # an invalid Expires (e.g. "0") means already expired
+        expires_at = _http_date(expires)
+        return max(0.0, expires_at - date - age) if expires_at is not None else 0.0
+    last_modified = _http_date(headers.get("last-modified"))
+    if last_modified is not None and last_modified < date:
+        return max(0.0, min(HEURISTIC_MAX_AGE, (date - last_modified) / 10) - age)
+    return 0.0
+
+
+class CachedResponse:
+    """A stored response; fresh tells whether it can be used without revalidation."""
+
+    def __init__(self, key: str, url: str, status: int, headers: Dict[str, str], body: bytes, fresh: bool) -> None:
+        self.key = key
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.fresh = fresh
+
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers revalidating this response (empty when it has no validator)."""
+        headers = {name.lower(): value for name, value in self.headers.items()}
+        validators = {}
+        if headers.get("etag"):
+            validators["If-None-Match"] = headers["etag"]
+        if headers.get("last-modified"):
+            validators["If-Modified-Since"] = headers["last-modified"]
+        return validators
+
+
+class HTTPCache:
+    """
+    SQLite-backed HTTP response cache.
+
+    Parameters:
+        path: SQLite database file
+        max_bytes: total size of the stored bodies; the least recently used responses are evicted beyond it
+        max_entry_bytes: larger bodies are not stored (default: an eighth of max_bytes)
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 2**20, max_entry_bytes: Optional[int] = None) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 8
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One connection shared by the Streamlit sessions (threads), serialized by a lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("PRAGMA journal_mode=WAL;" + SCHEMA)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def cache_key(method: str, url: str, params: Any = None) -> str:
+        return json.dumps([method.upper(), url, params], sort_keys=True, default=str)
+
+    def lookup(self, method: str, url: str, params: Any = None) -> Optional[CachedResponse]:
+        """The stored response of a request (fresh or stale), or None."""
+        if method.upper() not in CACHEABLE_METHODS:
+            return None
+        key = self.cache_key(method, url, params)
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT url, status, headers, body, expires_at FROM responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE responses SET last_access = ? WHERE cache_key = ?", (now, key))
+        stored_url, status, headers, body, expires_at = row
+        return CachedResponse(key, stored_url, status, json.loads(headers), bytes(body), now < expires_at)
+
+    def store(self, method: str, url: str, status: int, headers: Dict[str, str], body: bytes, params: Any = None) -> bool:
+        """Store a response if HTTP caching allows it; returns whether it was stored."""
+        if method.upper() not in CACHEABLE_METHODS or status not in CACHEABLE_STATUS:
+            return False
+        now = time.time()
+        lifetime = freshness_lifetime(headers, now)
+        if lifetime is None or len(body) > self.max_entry_bytes:
+            return False
+        cached = CachedResponse("", url, status, headers, body, False)
+        if lifetime == 0 and not cached.validators():
+            # it could never be used without fetching the whole body again
+            return False
+        headers = {name: value for name, value in headers.items() if name.lower() not in UNSTORED_HEADERS}
+        key = self.cache_key(method, url, params)
+        with self._lock, self._connection:
+            previous = self._connection.execute("SELECT size FROM responses WHERE cache_key = ?", (key,)).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, url, status, json.dumps(dict(headers)), sqlite3.Binary(body), len(body), now, now + lifetime, now),
+            )
+            self._size += len(body) - (previous[0] if previous else 0)
+            self._evict()
+        return True
+
+    def refresh(self, cached: CachedResponse, headers: Dict[str, str]) -> CachedResponse:
+        """Update a stored response from a 304 (Not Modified) answer and return it as fresh."""
+        merged = {name: value for name, value in cached.headers.items()}
+        lower = {name.lower(): name for name in merged}
+        for name, value in headers.items():
+            if name.lower() in UNSTORED_HEADERS:
+                continue
+            merged.pop(lower.get(name.lower(), name), None)
+            merged[name] = value
+        now = time.time()
+        lifetime = freshness_lifetime(merged, now)
+        with self._lock, self._connection:
+            if lifetime is None:
+                self._connection.execute("DELETE FROM responses WHERE cache_key = ?", (cached.key,))
+                self._size -= len(cached.body)
+            else:
+                self._connection.execute(
+                    "UPDATE responses SET headers = ?, stored_at = ?, expires_at = ?, last_access = ? WHERE cache_key = ?",
+                    (json.dumps(merged), now, now + lifetime, now, cached.key),
+                )
+        return CachedResponse(cached.key, cached.url, cached.status, merged, cached.body, True)
+
+    def _evict(self) -> None:
+        # Drop least recently used responses until the bodies fit the budget (called with the lock held)
+        while self._size > self.max_bytes:
+            rows = self._connection.execute(
+                "SELECT cache_key, size FROM responses ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                return
+            evicted = []
+            for key, size in rows:
+                if self._size <= self.max_bytes:
+                    break
+                evicted.append((key,))
+                self._size -= size
+            self._connection.executemany("DELETE FROM responses WHERE cache_key = ?", evicted)
+
+    def size(self) -> int:
+        with self._lock:
+            return self._size
+
+
+_cache: Optional[HTTPCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_http_cache() -> HTTPCache:
+    """Return the process-wide cache (GENEVIC_HTTP_CACHE or a file in the system temp directory)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            path = os.environ.get("GENEVIC_HTTP_CACHE", os.path.join(tempfile.gettempdir(), "genevic_cache", "http.db"))
+            _cache = HTTPCache(path, max_bytes=int(os.environ.get("GENEVIC_HTTP_CACHE_MAX_BYTES", 256 * 2**20)))
+        return _cache
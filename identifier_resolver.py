@@ -0,0 +1,145 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.....................................................................................................................
+Purpose:
+           -Support code for llm_steps.py (AbstractSearcher, the "article link handler" tool)
+           -Resolves PubMed links/PMIDs, arXiv links/IDs and DOIs to their abstracts inline, so the agent does not
+            need another think/act round trip through the "pubmed search" or "arxiv search" tool
+           -PMIDs: batched efetch through NewPubMedAPIWrapper and its PMID store
+           -arXiv IDs: arXiv API id_list lookup, cached in memory
+           -DOIs: DOI -> PMID mapping (esearch [doi], cached in the PMID store), then as PMIDs
+'''
+#.....................................................................................................................
+
+
+# Importing essential libraries and modules
+import asyncio
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import arxiv
+
+from cassette import get_cassette
+from pubmed_client import run_sync
+from rate_governor import get_governor
+
+PUBMED_PATTERN = re.compile(r"(?:https?://)?(?:www\.)?(?:pubmed\.ncbi\.nlm\.nih\.gov/|ncbi\.nlm\.nih\.gov/pubmed/)(\d+)|\bPMID:?\s*(\d+)", re.IGNORECASE)
+ARXIV_PATTERN = re.compile(r"(?:https?://)?(?:www\.)?(?:export\.)?arxiv\.org/(?:abs|pdf)/([\w.\-/]+?\d)(?:\.pdf)?(?:[?#].*)?$|\barXiv:\s*(\d{4}\.\d{4,5}(?:v\d+)?)", re.IGNORECASE)
+DOI_PATTERN = re.compile(r"\b(10\.\d{4,9}/[^\s\"'<>]+)")
+
+
+def extract_identifiers(text: str) -> Dict[str, List[str]]:
+    """PMIDs, arXiv IDs and DOIs found in a link or a piece of text."""
+    text = text.strip()
+    identifiers = {"pmid": [], "arxiv": [], "doi": []}
+    for match in PUBMED_PATTERN.finditer(text):
+        identifiers["pmid"].append(match.group(1) or match.group(2))
+    for match in ARXIV_PATTERN.finditer(text):
+        identifiers["arxiv"].append(match.group(1) or match.group(2))
+    if not identifiers["pmid"] and not identifiers["arxiv"]:
+        identifiers["doi"] = [doi.rstrip(".,;)") for doi in DOI_PATTERN.findall(text)]
+    return identifiers
+
+
+class IdentifierResolver:
+    """
+    Resolve identifiers to abstracts.
+
+    Parameters:
+        pubmed: NewPubMedAPIWrapper used for PMIDs and DOIs
+        arxiv_cache_size: number of arXiv abstracts kept in memory
+    """
+
+    def __init__(self, pubmed, arxiv_cache_size: int = 512) -> None:
+        self.pubmed = pubmed
+        self.arxiv_cache_size = arxiv_cache_size
+        self._arxiv_cache: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _format_pubmed(article: dict) -> str:
+        return str({
+            "uid": article["uid"],
+            "title": article["title"],
+            "pub_date": article["pub_date"],
+            "link": article["link"],
+            "abstract": article["summary"],
+        })
+
+    @staticmethod
+    def _format_arxiv(entry: dict) -> str:
+        return (
+            f"Published: {entry['published']}\nTitle: {entry['title']}\nAuthors: {entry['authors']}\n"
+            f"Entry ID: {entry['entry_id']}\nSummary: {entry['summary']}"
+        )
+
+    def arxiv_entries(self, arxiv_ids: List[str]) -> Dict[str, dict]:
+        """arXiv entries by requested ID (IDs that could not be found are left out)."""
+        with self._lock:
+            missing = [arxiv_id for arxiv_id in arxiv_ids if arxiv_id not in self._arxiv_cache]
+        if missing:
+            def lookup() -> List[dict]:
+                with get_governor("export.arxiv.org").slot():
+                    results = arxiv.Client().results(arxiv.Search(id_list=missing, max_results=len(missing)))
+                    return [
+                        {
+                            "id": result.get_short_id(),
+                            "published": str(result.published.date()),
+                            "title": result.title,
+                            "authors": ", ".join(author.name for author in result.authors),
+                            "entry_id": result.entry_id,
+                            "summary": " ".join(result.summary.split()),
+                        }
+                        for result in results
+                    ]
+            entries = get_cassette().call("arxiv", {"id_list": missing}, lookup)
+            by_id = {re.sub(r"v\d+$", "", entry["id"]): entry for entry in entries}
+            with self._lock:
+                for requested in missing:
+                    entry = by_id.get(re.sub(r"v\d+$", "", requested))
+                    if entry is not None:
+                        self._arxiv_cache[requested] = entry
+                while len(self._arxiv_cache) > self.arxiv_cache_size:
+                    self._arxiv_cache.popitem(last=False)
+        with self._lock:
+            return {arxiv_id: self._arxiv_cache[arxiv_id] for arxiv_id in arxiv_ids if arxiv_id in self._arxiv_cache}
+
+    async def aresolve_links(self, links: List[str]) -> Dict[str, List[str]]:
+        """
+        Abstracts per link, for the links that hold identifiers (all of them resolved in one batch).
+        A link whose identifiers could not be resolved maps to an empty list; links without identifiers are left out.
+        """
+        identifiers = {link: extract_identifiers(link) for link in links}
+        identifiers = {link: found for link, found in identifiers.items() if any(found.values())}
+        dois = list(dict.fromkeys(doi for found in identifiers.values() for doi in found["doi"]))
+        doi_pmids = dict(zip(dois, await asyncio.gather(*[self.pubmed.adoi_to_pmids(doi) for doi in dois])))
+        link_pmids = {
+            link: list(dict.fromkeys(found["pmid"] + [pmid for doi in found["doi"] for pmid in doi_pmids[doi]]))
+            for link, found in identifiers.items()
+        }
+        pmids = list(dict.fromkeys(pmid for found in link_pmids.values() for pmid in found))
+        arxiv_ids = list(dict.fromkeys(arxiv_id for found in identifiers.values() for arxiv_id in found["arxiv"]))
+
+        async def pubmed_articles() -> List[dict]:
+            return await self.pubmed.afetch_articles(pmids) if pmids else []
+
+        async def arxiv_entries() -> Dict[str, dict]:
+            # the arxiv package is synchronous
+            return await asyncio.to_thread(self.arxiv_entries, arxiv_ids) if arxiv_ids else {}
+
+        articles, entries = await asyncio.gather(pubmed_articles(), arxiv_entries())
+        by_pmid = {article["uid"]: self._format_pubmed(article) for article in articles}
+        return {
+            link: [by_pmid[pmid] for pmid in link_pmids[link] if pmid in by_pmid]
+            + [self._format_arxiv(entries[arxiv_id]) for arxiv_id in found["arxiv"] if arxiv_id in entries]
+            for link, found in identifiers.items()
+        }
+
+    def resolve_links(self, links: List[str]) -> Dict[str, List[str]]:
+        """Sync version of aresolve_links() (runs on the shared client loop)."""
+        return run_sync(self.aresolve_links(links))
@@ -18,7 +18,11 @@ Langchain Arxiv API wrapper:https://python.langchain.com/docs/integrations/tools
 #..........................................................................................
 Purpose: 
         -Support code for Literature Search page
-        -Uses modified_pubmed.py and Langchain's ArxivAPIWrapper and SerpAPIWrapper
+        -Uses modified_pubmed.py and Langchain's ArxivAPIWrapper; Google Scholar goes through SerpAPI with a
+         result cache and quota ledger (serpapi_cache.py)
+        -federated_search.py combines the three sources in one tool
+        -arxiv search answers from a local index of the arXiv metadata snapshot when one is configured
+         (arxiv_mirror.py, GENEVIC_ARXIV_MIRROR), with the arXiv API as the fallback
 '''
 #..........................................................................................
 
@@ -29,16 +33,23 @@ from langchain.callbacks.manager import (
     AsyncCallbackManagerForToolRun,
     CallbackManagerForToolRun,
 )
-from typing import Optional, Type
+from typing import ClassVar, List, Optional, Type
 from langchain.agents import Tool
 
 from modified_pubmed import NewPubMedAPIWrapper
 from langchain.utilities import ArxivAPIWrapper
-from langchain.utilities import SerpAPIWrapper
 
 
-from bs4 import BeautifulSoup
+import asyncio
 from modified_requests import TextRequestsWrapper
+from abstract_extractor import extract_abstract
+from cassette import get_cassette
+from rate_governor import Throttled, get_governor
+from tool_budget import abudgeted, budgeted
+from identifier_resolver import IdentifierResolver
+from serpapi_cache import CachedSerpAPI, QuotaExhausted
+from federated_search import FederatedSearch, arxiv_source, pubmed_source, scholar_source
+from arxiv_mirror import format_papers, get_arxiv_mirror
 import re
 
 
@@ -50,28 +61,76 @@ def load_tools(serpapi_api_key):
     # Initialize the Arxiv API wrapper
     arxiv = ArxivAPIWrapper()
 
+    # Arxiv search: local snapshot index when configured (arxiv_mirror.py), else the arXiv API through the
+    # cassette layer (record/replay), paced by the shared arXiv governor
+    def arxiv_search(query: str) -> str:
+        mirror = get_arxiv_mirror()
+        if mirror is not None:
+            papers = mirror.search(query, arxiv.top_k_results)
+            if papers:
+                return format_papers(papers, arxiv.doc_content_chars_max)
+
+        def search() -> str:
+            with get_governor("export.arxiv.org").slot():
+                result = arxiv.run(query)
+                # ArxivAPIWrapper returns errors as text
+                if result.startswith("Arxiv exception") and re.search(r"\b(429|503)\b", result):
+                    raise Throttled(429)
+            return result
+        try:
+            return get_cassette().call("arxiv", {"query": query}, search)
+        except Throttled:
+            return "Arxiv exception: rate limited, try again later"
+
+    # The arxiv package is synchronous; the async tool runs it in a worker thread
+    async def aarxiv_search(query: str) -> str:
+        return await asyncio.to_thread(arxiv_search, query)
+
     # Define a custom tool for Google Scholar searches
     class GoogleScholar(BaseTool):
         # Metadata about the tool
         name = "Google Scholar"
         description = "Given a query for an article on Google Scholar, this returns a list of the resulting article's titles, authors, abstract links, and result ids"
         
-        # Define parameters for SerpAPIWrapper
+        # Define parameters for the SerpAPI Google Scholar engine
         params = {
             "engine": "google_scholar",
             "hl": "en",
             "num": 5,
         }
 
-        # Initialize SerpAPIWrapper with the API key and defined parameters
-        search = SerpAPIWrapper(params=params, serpapi_api_key=serpapi_api_key)
+        # SerpAPI client with the API key and defined parameters; results are cached and the quota is accounted
+        search: ClassVar[CachedSerpAPI] = CachedSerpAPI(params=params, api_key=serpapi_api_key)
         
+        def organic_results(self, query: str) -> list:
+            """
+            Organic results of the Google Scholar search (cached, through the cassette layer).
+            """
+            return self.search.results(query).get('organic_results', [])
+
         def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
             """
             Search and return a specified number of articles' titles, links, ids, and authors.
             """
-            # Fetch search results from Google Scholar
-            search_result = self.search.results(query)['organic_results']
+            try:
+                return self._refine(self.organic_results(query))
+            except QuotaExhausted:
+                # degrade to PubMed when the SerpAPI quota is at its reserve and the query is not cached
+                return self._pubmed_fallback(pubmed.load(query))
+
+        def _pubmed_fallback(self, articles: list) -> str:
+            # PubMed results in the shape of the Google Scholar results
+            search_results = "Google Scholar is unavailable (search quota), PubMed results instead:\n"
+            for article in articles:
+                search_results += str({
+                    'title': article['title'],
+                    'link': article['link'],
+                    'result_id': article['uid'],
+                    'authors': ", ".join(article.get('authors') or []),
+                }) + "\n"
+            return search_results
+
+        def _refine(self, search_result: list) -> str:
             # Process and refine the results
             refined_results = []
             for i in search_result:
@@ -88,24 +147,43 @@ def load_tools(serpapi_api_key):
                 search_results = search_results + str(refined_results[i]) + "\n"
             return search_results
         
+        async def aorganic_results(self, query: str) -> list:
+            """
+            Asynchronous version of organic_results.
+            """
+            return (await self.search.aresults(query)).get('organic_results', [])
+
         async def _arun(self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> str:
             """
-            Asynchronous method for the tool, not implemented.
+            Asynchronous version of _run.
             """
-            raise NotImplementedError("Not implemented")
+            try:
+                return self._refine(await self.aorganic_results(query))
+            except QuotaExhausted:
+                return self._pubmed_fallback(await pubmed.aload(query))
 
     # Instantiate the GoogleScholar class
     google_scholar = GoogleScholar()
 
+    # Resolver of PMIDs, arXiv IDs and DOIs used by the AbstractSearcher
+    resolver = IdentifierResolver(pubmed)
+
+    # One call to PubMed, arXiv and Google Scholar at once (concurrent, deduplicated, rank-fused)
+    federated = FederatedSearch({
+        "pubmed": pubmed_source(NewPubMedAPIWrapper(top_k_results=5)),
+        "arxiv": arxiv_source(ArxivAPIWrapper(top_k_results=5)),
+        "google scholar": scholar_source(google_scholar),
+    })
+
 
 
     #This code snippet defines a custom tool, AbstractSearcher, 
-    #for retrieving abstracts from arbitrary links, such as those from Google Scholar, PubMed, or Arxiv, using HTTP GET requests and Beautiful Soup for parsing HTML content.
+    #for retrieving abstracts from arbitrary links, such as those from Google Scholar, PubMed, or Arxiv, using HTTP GET requests and a targeted abstract extractor (abstract_extractor.py).
     #Use arbitrary links from google scholar to retrieve abstracts  
     class AbstractSearcher(BaseTool):
         # Metadata about the tool
         name = "Abstract searcher"
-        description = "Uses an HTTP GET command + Beautiful Soup to get the abstract of an arbitrary link"
+        description = "Uses an HTTP GET command + an abstract extractor to get the abstract of an arbitrary link"
         
         # Initialize a wrapper for making HTTP requests
         http_caller = TextRequestsWrapper()
@@ -113,67 +191,131 @@ def load_tools(serpapi_api_key):
         
         def _run(self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
             """
-            Redirects to a preexisting tool if the query matches a known pattern (Arxiv or PubMed),
-            otherwise, it analyzes the HTML content to extract the abstract.
+            Resolves PubMed, arXiv and DOI links (or bare identifiers) directly to their abstracts,
+            otherwise, it analyzes the HTML content to extract the abstract. The input may hold several links.
             """
-            # Patterns to identify Arxiv and PubMed links
-            arxiv_pattern = r'https://arxiv\.org/abs/(.*)'
-            pubmed_pattern = r'https://pubmed\.ncbi\.nlm\.nih\.gov/(.*)/'
-            
-            # Check if the query matches the Arxiv pattern
-            if re.match(arxiv_pattern, query):
-                id = re.match(arxiv_pattern, query).group(1)
-                return f"INSTRUCTIONS: use arxiv search with query {id}"
-            
-            # Check if the query matches the PubMed pattern
-            elif re.match(pubmed_pattern, query):
-                id = re.match(pubmed_pattern, query).group(1)
-                return f"INSTRUCTIONS: use pubmed search with query {id}"
-            
-            # For other links, use Beautiful Soup to parse HTML content and extract abstract
-            else:
-                soup = BeautifulSoup(self.http_caller.get(query), 'lxml')
-                returned_result = ""
-                # Iterate through all paragraph tags and concatenate their text content
-                for data in soup.find_all("p"): 
-                    returned_result += (data.get_text() + "\n")
-                return returned_result
+            links = self._split_links(query)
+            # Known identifiers are resolved inline (saves the agent a round trip through another tool)
+            resolved, error = {}, None
+            try:
+                resolved = resolver.resolve_links(links)
+            except Exception as e:
+                error = e
+            pages = {}
+            for link in self._to_fetch(links, resolved):
+                try:
+                    pages[link] = self.http_caller.fetch(link)
+                except Exception as e:
+                    pages[link] = e
+            return self._report(links, resolved, pages, error)
+
+        @staticmethod
+        def _split_links(query: str) -> List[str]:
+            # Links separated by spaces, commas or new lines; "PMID: 123" and "arXiv: 2101.01234" stay one item
+            query = re.sub(r"\b(PMID|arXiv):?\s+(?=\d)", r"\1:", query, flags=re.IGNORECASE)
+            return [link for link in re.split(r"[\s,]+", query) if link]
+
+        @staticmethod
+        def _to_fetch(links: List[str], resolved: dict) -> List[str]:
+            # Links without identifiers, and identifier links that could not be resolved, are fetched as web pages
+            return [link for link in links if not resolved.get(link) and link.startswith(("http://", "https://"))]
+
+        def _report(self, links: List[str], resolved: dict, pages: dict, error: Optional[Exception]) -> str:
+            # One entry per link: its abstracts, its page text, or why it could not be resolved or retrieved
+            results = []
+            if error is not None:
+                results.append(f"Identifiers could not be looked up ({error}); their links were fetched as web pages")
+            for link in links:
+                if resolved.get(link):
+                    results.extend(resolved[link])
+                elif link not in pages:
+                    results.append(f"{link}: could not be resolved")
+                elif isinstance(pages[link], Exception):
+                    results.append(f"{link}: could not be retrieved ({pages[link]})")
+                else:
+                    results.append(self._page_text(link, pages[link]))
+            return "\n".join(results)
+
+        def _page_text(self, link: str, page) -> str:
+            # Bounded fetch result -> text: paragraphs of HTML, the first pages of PDFs, nothing for binary payloads
+            if page.kind == "html":
+                return self._abstract(page.text())
+            if page.kind == "binary" or (page.kind == "pdf" and not page.body):
+                return f"{link}: skipped ({page.reason})"
+            text = page.text()
+            if page.kind == "pdf" and not text:
+                return f"{link}: PDF without extractable text"
+            return text
+
+        @staticmethod
+        def _abstract(html: str) -> str:
+            # Title and abstract of the page (meta tags, JSON-LD, publisher containers, then the densest paragraphs)
+            extracted = extract_abstract(html)
+            if not extracted["abstract"]:
+                return "No abstract was found on the page"
+            if extracted["title"]:
+                return f"Title: {extracted['title']}\nAbstract: {extracted['abstract']}"
+            return extracted["abstract"]
             
         async def _arun(
             self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None
         ) -> str:
-            """Use the tool asynchronously."""
-            raise NotImplementedError("Not implemented")
+            """
+            Use the tool asynchronously. The input may hold several links (separated by spaces, commas or new lines):
+            the identifiers among them are resolved in one batch and the other pages are fetched concurrently.
+            Every link gets a line: its abstract, its page text, or why it could not be resolved or retrieved.
+            """
+            links = self._split_links(query)
+            resolved, error = {}, None
+            try:
+                resolved = await resolver.aresolve_links(links)
+            except Exception as e:
+                error = e
+            others = self._to_fetch(links, resolved)
+            pages = dict(zip(others, await asyncio.gather(*[self.http_caller.afetch(link) for link in others], return_exceptions=True)))
+            return self._report(links, resolved, pages, error)
 
     # Instantiate the AbstractSearcher class
     abs_search = AbstractSearcher()
 
     
 # Initialize a list of tools
+    # The outputs are compressed to a per-tool token budget (tool_budget.py) before they reach the agent's scratchpad
     tools = [
         # Arxiv Search Tool
         Tool(
             name="arxiv search",
-            func=arxiv.run,
+            func=budgeted("arxiv search", arxiv_search),
+            coroutine=abudgeted("arxiv search", aarxiv_search),
             description="Use this to use a query to get articles on arxiv. Input could be an arxiv ID, an article title, or a search term. IF THE USER SPECIFIES A TITLE OF AN ARTICLE OR PAPER AND THIS TOOL IS BEING USED, PREFIX THE QUERY WITH 'ti'. IF THE USER SPECIFIES AN AUTHOR, PREFIX THE QUERY WITH 'au'. The output will return a list of articles as dictionaries, which include their title, author, abstract, link, and publish date. Use the most relevant dictionary as text."
         ),
         # PubMed Search Tool
         Tool(
             name="pubmed search",
-            func=pubmed.load_docs,
+            func=budgeted("pubmed search", pubmed.load_docs),
+            coroutine=abudgeted("pubmed search", pubmed.aload_docs),
             description="Use this to use a query to get articles on Pubmed. Pubmed specializes in articles relating to bioinformatics. The input can be a pubmed id or a search term. The output will return a list of dictionaries that are the relevant articles and their ids, titles, publish dates, and links. From that list use the most relevant (based on the title and abstract) dictionary as text."
         ),
         # Google Scholar Search Tool
         Tool(
             name="google scholar search",
-            func=google_scholar.run,
+            func=budgeted("google scholar search", google_scholar.run),
+            coroutine=abudgeted("google scholar search", google_scholar.arun),
             description="Use this to use a query to get articles on Google Scholar. The input can be a google scholar id or a search term. The output will return a list of dictionaries that are the relevant article's titles, authors, abstract links, and result ids. THIS WILL NOT OUTPUT THE ABSTRACT. From that list use the most relevant (based on the title) dictionary as text."
         ),
+        # Federated Search Tool
+        Tool(
+            name="literature search (all sources)",
+            func=budgeted("literature search (all sources)", federated.search),
+            coroutine=abudgeted("literature search (all sources)", federated.asearch),
+            description="Use this first to search PubMed, arXiv and Google Scholar at once with a search term. The output is one list of dictionaries, the articles found by all sources without duplicates and best first, with their titles, authors, dates, links, ids (pmid, doi, arxiv), the sources that found them, and their abstract (or a snippet for Google Scholar only results). Use the most relevant dictionaries as text; use the article link handler for results without an abstract."
+        ),
         # Article Link Handler Tool
         Tool(
             name="article link handler",
-            func=abs_search.run,
-            description="Given a link to an abstract when no abstract is present, use this tool and extract the abstract. Always use this for google scholar results. Input will be a link to an article. Output could be 2 possibilities: instructions to use a tool with a specified query or the website's paragraph text which will contain the abstract."
+            func=budgeted("article link handler", abs_search.run),
+            coroutine=abudgeted("article link handler", abs_search.arun),
+            description="Given a link to an abstract when no abstract is present, use this tool and extract the abstract. Always use this for google scholar results. Input will be a link to an article (or several links separated by spaces). Output is the abstract for PubMed, arXiv and DOI links, otherwise the website's paragraph text which will contain the abstract (or, for a link that could not be resolved or retrieved, a line saying so)."
         )
     ]
     # Return the list of initialized tools   
@@ -21,6 +21,9 @@ https://api.python.langchain.com/en/latest/utilities/langchain_community.utiliti
 Purpose: 
            -Support code for llm_steps.py
            -Modified Pubmed API wrapper
+           -Requests go through the async E-utilities client (pubmed_client.py), with a sync facade
+           -Searches and articles are cached in a local PMID-keyed store (pubmed_store.py)
+           -Optional offline backend: local FTS5 mirror of the PubMed baseline (pubmed_mirror.py)
 '''
 #.....................................................................................................................
 
@@ -38,11 +41,25 @@ from pydantic import BaseModel, Extra
 
 from langchain.schema import Document
 
-import ssl
+import asyncio
+import datetime
+import io
+import math
+import re
+from typing import IO, AsyncIterator, Iterator, Optional
+from xml.etree import ElementTree
+
+from pubmed_client import get_pubmed_client, run_on_client_loop, run_sync, submit
+from pubmed_store import get_pubmed_store
+from pubmed_mirror import STOPWORDS, get_pubmed_mirror
+from tool_budget import budget_text
 
 
 logger = logging.getLogger(__name__)
 
+# Article fields left out of the Documents of the pubmed search tool
+DOC_EXCLUDED_FIELDS = ("abstract_sections", "mesh_terms")
+
 
 
 class NewPubMedAPIWrapper(BaseModel):
@@ -55,7 +72,14 @@ class NewPubMedAPIWrapper(BaseModel):
 
     Parameters:
         top_k_results: number of the top-scored document used for the PubMed tool
-        load_max_docs: a limit to the number of loaded documents
+        api_key: NCBI API key (NCBI_API_KEY by default); raises the rate limit from 3 to 10 requests/s
+        efetch_batch_size: number of IDs fetched with one efetch request
+        use_store: serve searches and articles from the local store (pubmed_store.py) when possible
+        two_phase: rank a candidate_pool of esearch hits on their esummary (BM25 over titles,
+          recency and journal priors) and efetch only the top-k
+        backend: "remote" (E-utilities) or "local" (BM25 search of the local mirror, pubmed_mirror.py,
+          falling back to the E-utilities when the mirror has no match or is not configured)
+        load_max_docs: a limit to the number of documents loaded by iter_load()
         load_all_available_meta:
           if True: the `metadata` of the loaded Documents gets all available meta info
             (see https://www.ncbi.nlm.nih.gov/books/NBK25499/#chapter4.ESearch)
@@ -64,8 +88,13 @@ class NewPubMedAPIWrapper(BaseModel):
 
     base_url_esearch: str = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?"
     base_url_efetch: str = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?"
-    max_retry: int = 5
-    sleep_time: float = 0.2
+    base_url_esummary: str = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi?"
+    api_key: Optional[str] = None
+    efetch_batch_size: int = 200
+    use_store: bool = True
+    backend: str = "remote"
+    two_phase: bool = False
+    candidate_pool: int = 200
 
     # Default values for the parameters
     top_k_results: int = 3
@@ -95,9 +124,9 @@ class NewPubMedAPIWrapper(BaseModel):
                 for result in self.load(query[: self.ARXIV_MAX_QUERY_LENGTH])
             ]
 
-            # Join the results and limit the character count
+            # Join the results and compress them to the character budget (per article, sentence level, query-ranked)
             return (
-                "\n\n".join(docs)[: self.doc_content_chars_max]
+                budget_text("\n\n".join(docs), query, self.doc_content_chars_max // 4)
                 if docs
                 else "No good PubMed Result was found"
             )
@@ -109,98 +138,331 @@ class NewPubMedAPIWrapper(BaseModel):
         Search PubMed for documents matching the query.
         Return a list of dictionaries containing the document metadata.
         """
+        # Sync facade over aload() (runs on the shared client loop)
+        return run_sync(self.aload(query))
+
+    async def aload(self, query: str) -> List[dict]:
+        """Async version of load(); the efetch batches run concurrently."""
+        if self.backend == "local":
+            mirror = get_pubmed_mirror()
+            if mirror is not None:
+                articles = mirror.search(query, self.top_k_results)
+                if articles:
+                    return articles
         #changes from original: relevance filter and title/abstract fields (line 89). 
+        store = get_pubmed_store() if self.use_store else None
+        sort = "rerank" if self.two_phase else "relevance"
+        uids = store.get_search(query, sort, self.top_k_results) if store is not None else None
+        webenv = ""
+        if uids is None:
+            if self.two_phase:
+                # Phase 1: wide candidate set, ranked locally on the esummary fields
+                esearch_result = await self._aesearch(query, self.candidate_pool)
+                summaries = await self._aesummary(esearch_result["idlist"], esearch_result["webenv"])
+                uids = rerank_summaries(query, summaries, self.top_k_results)
+            else:
+                esearch_result = await self._aesearch(query, self.top_k_results)
+                uids = esearch_result["idlist"]
+            webenv = esearch_result["webenv"]
+            if store is not None:
+                store.put_search(query, sort, self.top_k_results, uids)
+
+        return await self.afetch_articles(uids, webenv)
+
+    def fetch_articles(self, uids: List[str]) -> List[dict]:
+        """Articles for a list of PMIDs, from the local store where possible (sync facade)."""
+        return run_sync(self.afetch_articles(uids))
+
+    async def afetch_articles(self, uids: List[str], webenv: str = "") -> List[dict]:
+        # Serve the stored articles locally, fetch only the missing PMIDs
+        # in batches of efetch_batch_size IDs (one request for the usual top-k)
+        #changes from modified: one efetch per batch instead of one per UID
+        store = get_pubmed_store() if self.use_store else None
+        fetched = store.get_articles(uids) if store is not None else {}
+        missing = [uid for uid in uids if uid not in fetched]
+        batches = await asyncio.gather(
+            *[
+                self.aretrieve_articles(missing[start : start + self.efetch_batch_size], webenv)
+                for start in range(0, len(missing), self.efetch_batch_size)
+            ]
+        )
+        for new_articles in batches:
+            if store is not None:
+                store.put_articles(new_articles)
+            for article in new_articles:
+                fetched[article["uid"]] = article
+        # Keep the order of uids (esearch relevance)
+        articles = [fetched[uid] for uid in uids if uid in fetched]
+        return articles
+
+    def doi_to_pmids(self, doi: str) -> List[str]:
+        """PMIDs of a DOI (esearch on the [doi] field), cached in the local store."""
+        return run_sync(self.adoi_to_pmids(doi))
+
+    async def adoi_to_pmids(self, doi: str) -> List[str]:
+        store = get_pubmed_store() if self.use_store else None
+        pmids = store.get_search(doi, "doi", 1) if store is not None else None
+        if pmids is None:
+            url = self.base_url_esearch + "db=pubmed&retmode=json&term=" + urllib.parse.quote(f"{doi}[doi]")
+            pmids = json.loads((await self._aget(url)).decode("utf-8"))["esearchresult"]["idlist"]
+            if store is not None:
+                store.put_search(doi, "doi", 1, pmids)
+        return pmids
+
+    async def _aesummary(self, uids: List[str], webenv: str) -> List[dict]:
+        # Lightweight document summaries (title, journal, dates) of all IDs in one request, in the given order
+        if not uids:
+            return []
+        url = (
+            self.base_url_esummary
+            + "db=pubmed&retmode=json&id="
+            + ",".join(uids)
+            + (("&webenv=" + webenv) if webenv else "")
+        )
+        result = json.loads((await self._aget(url)).decode("utf-8")).get("result", {})
+        return [result[uid] for uid in uids if uid in result]
+
+    async def _aesearch(self, query: str, retmax: int) -> dict:
+        # esearch on the history server; returns count, idlist, webenv and querykey
         url = (
             self.base_url_esearch
             + "db=pubmed&term="
             + str({urllib.parse.quote(query)})
-            + f"&field=title/abstract&retmode=json&retmax={self.top_k_results}&usehistory=y&sort=relevance"
+            + f"&field=title/abstract&retmode=json&retmax={retmax}&usehistory=y&sort=relevance"
         )
-        context = ssl._create_unverified_context()
-        result = urllib.request.urlopen(url,context=context)
-        text = result.read().decode("utf-8")
-        json_text = json.loads(text)
-
-        articles = []
-        # Convert the list of articles to a JSON string
-        webenv = json_text["esearchresult"]["webenv"]
-        for uid in json_text["esearchresult"]["idlist"]:
-            article = self.retrieve_article(uid, webenv)
-            articles.append(article)       
+        text = (await self._aget(url)).decode("utf-8")
+        return json.loads(text)["esearchresult"]
+
+    async def _afetch_page(self, webenv: str, query_key: str, retstart: int, retmax: int) -> List[dict]:
+        # One page of the esearch result from the history server, with one efetch
+        url = (
+            self.base_url_efetch
+            + f"db=pubmed&retmode=xml&WebEnv={webenv}&query_key={query_key}&retstart={retstart}&retmax={retmax}"
+        )
+        articles = list(iter_pubmed_articles(io.BytesIO(await self._aget(url))))
+        if self.use_store:
+            get_pubmed_store().put_articles(articles)
         return articles
 
+    def iter_load(self, query: str, max_docs: Optional[int] = None, page_size: Optional[int] = None) -> Iterator[dict]:
+        """
+        Lazily yield the articles matching the query, in relevance order, up to max_docs
+        (load_max_docs by default). Pages of page_size (efetch_batch_size) articles are fetched
+        from the esearch history server; the next page is fetched while the current one is consumed,
+        and nothing more is fetched once the caller stops iterating.
+        """
+        max_docs = self.load_max_docs if max_docs is None else max_docs
+        page_size = page_size or self.efetch_batch_size
+        esearch_result = run_sync(self._aesearch(query, 0))
+        total = min(int(esearch_result["count"]), max_docs)
+        starts = list(range(0, total, page_size))
+        pending = None
+        try:
+            for i, start in enumerate(starts):
+                page = pending if pending is not None else submit(
+                    self._afetch_page(esearch_result["webenv"], esearch_result["querykey"], start, min(page_size, total - start))
+                )
+                pending = None
+                if i + 1 < len(starts):
+                    next_start = starts[i + 1]
+                    pending = submit(
+                        self._afetch_page(esearch_result["webenv"], esearch_result["querykey"], next_start, min(page_size, total - next_start))
+                    )
+                yield from page.result()
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def aiter_load(self, query: str, max_docs: Optional[int] = None, page_size: Optional[int] = None) -> AsyncIterator[dict]:
+        """Async version of iter_load() (pages are fetched one after the other)."""
+        max_docs = self.load_max_docs if max_docs is None else max_docs
+        page_size = page_size or self.efetch_batch_size
+        esearch_result = await run_on_client_loop(self._aesearch(query, 0))
+        total = min(int(esearch_result["count"]), max_docs)
+        for start in range(0, total, page_size):
+            page = await run_on_client_loop(
+                self._afetch_page(esearch_result["webenv"], esearch_result["querykey"], start, min(page_size, total - start))
+            )
+            for article in page:
+                yield article
+
+    def _get(self, url: str) -> bytes:
+        """GET an E-utilities URL and return the raw body."""
+        return run_sync(self._aget(url))
+
+    async def _aget(self, url: str) -> bytes:
+        # changes from modified: shared keep-alive pool and NCBI rate limit (pubmed_client.py) instead of urlopen
+        return await run_on_client_loop(get_pubmed_client(self.api_key).get(url))
+
     def _transform_doc(self, doc: dict) -> Document:
         summary = doc.pop("summary")
-        return Document(page_content=summary, metadata=doc)
+        #abstract_sections repeats the summary and mesh_terms is long: both stay out of the tool output
+        metadata = {field: value for field, value in doc.items() if field not in DOC_EXCLUDED_FIELDS}
+        return Document(page_content=summary, metadata=metadata)
 
     def load_docs(self, query: str) -> List[Document]:
         document_dicts = self.load(query=query)
         return [self._transform_doc(d) for d in document_dicts]
 
+    async def aload_docs(self, query: str) -> List[Document]:
+        document_dicts = await self.aload(query=query)
+        return [self._transform_doc(d) for d in document_dicts]
+
     def retrieve_article(self, uid: str, webenv: str) -> dict:
+        articles = self.retrieve_articles([uid], webenv)
+        if articles:
+            return articles[0]
+        return {"uid": uid, "title": "", "summary": "", "pub_date": "", "link": f"https://pubmed.ncbi.nlm.nih.gov/{uid}/"}
+
+    def retrieve_articles(self, uids: List[str], webenv: str) -> List[dict]:
+        """Fetch several articles with one efetch request (comma-separated IDs) and parse them."""
+        return run_sync(self.aretrieve_articles(uids, webenv))
+
+    async def aretrieve_articles(self, uids: List[str], webenv: str) -> List[dict]:
         url = (
             self.base_url_efetch
             + "db=pubmed&retmode=xml&id="
-            + uid
-            + "&webenv="
-            + webenv
+            + ",".join(uids)
+            + (("&webenv=" + webenv) if webenv else "")
         )
         #print(url)
-        retry = 0
-        while True:
-            try:
-                context = ssl._create_unverified_context()
-                result = urllib.request.urlopen(url,context=context)
-                break
-            except urllib.error.HTTPError as e:
-                if e.code == 429 and retry < self.max_retry:
-                    # Too Many Requests error
-                    # wait for an exponentially increasing amount of time
-                    print(
-                        f"Too Many Requests, "
-                        f"waiting for {self.sleep_time:.2f} seconds..."
-                    )
-                    time.sleep(self.sleep_time)
-                    self.sleep_time *= 2
-                    retry += 1
-                else:
-                    raise e
-
-        xml_text = result.read().decode("utf-8")
-
-        # Get title
-        title = ""
-        if "<ArticleTitle>" in xml_text and "</ArticleTitle>" in xml_text:
-            start_tag = "<ArticleTitle>"
-            end_tag = "</ArticleTitle>"
-            title = xml_text[
-                xml_text.index(start_tag) + len(start_tag) : xml_text.index(end_tag)
-            ]
+        # 429s are avoided by the rate limiter and retried by the client with Retry-After
+        xml_bytes = await self._aget(url)
 
-        # Get abstract
-        abstract = ""
-        if "<Abstract>" in xml_text and "</Abstract>" in xml_text:
-            start_tag = "<Abstract>"
-            end_tag = "</Abstract>"
-            abstract = xml_text[
-                xml_text.index(start_tag) + len(start_tag) : xml_text.index(end_tag)
-            ]
+        # Stream the <PubmedArticle> elements of the payload
+        return list(iter_pubmed_articles(io.BytesIO(xml_bytes)))
 
-        # Get publication date
-        pub_date = ""
-        if "<PubDate>" in xml_text and "</PubDate>" in xml_text:
-            start_tag = "<PubDate>"
-            end_tag = "</PubDate>"
-            pub_date = xml_text[
-                xml_text.index(start_tag) + len(start_tag) : xml_text.index(end_tag)
-            ]
 
-        # Return article as dictionary
-        article = {
-            "uid": uid,
-            "title": title,
-            "summary": abstract,
-            "pub_date": pub_date,
-            "link": f"https://pubmed\.ncbi\.nlm\.nih\.gov/{uid}/" #changes from original: added link field to article 
-        }
-        return article
+# Journals whose articles get a small boost in the two-phase ranking (esummary "source", lower case)
+JOURNAL_PRIORS = {
+    "nature": 0.3, "science": 0.3, "cell": 0.3, "n engl j med": 0.3, "lancet": 0.3,
+    "nat genet": 0.25, "am j hum genet": 0.2, "nat commun": 0.15, "alzheimers dement": 0.15,
+    "brain": 0.15, "mol psychiatry": 0.15, "jama neurol": 0.15, "plos genet": 0.1, "bioinformatics": 0.1,
+}
+
+
+def _tokens(text: str) -> List[str]:
+    return [token for token in re.findall(r"\w+", text.lower()) if token not in STOPWORDS]
+
+
+def rerank_summaries(query: str, summaries: List[dict], k: int, k1: float = 1.2, b: float = 0.75,
+                     recency_weight: float = 0.3, rank_weight: float = 0.3, half_life: float = 8.0) -> List[str]:
+    """
+    Rank esummary records (in esearch relevance order) against the query and return the top-k PMIDs.
+    score = BM25 of the title (normalized to the best title) + journal prior
+            + recency_weight * 0.5 ** (age / half_life years) + rank_weight / (1 + esearch rank / 10)
+    """
+    if not summaries:
+        return []
+    query_tokens = set(_tokens(query))
+    titles = [_tokens(summary.get("title", "")) for summary in summaries]
+    n = len(titles)
+    avg_len = sum(len(title) for title in titles) / n or 1.0
+    document_frequency = {token: sum(1 for title in titles if token in title) for token in query_tokens}
+    bm25 = []
+    for title in titles:
+        score = 0.0
+        for token in query_tokens:
+            tf = title.count(token)
+            if tf:
+                idf = math.log(1 + (n - document_frequency[token] + 0.5) / (document_frequency[token] + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(title) / avg_len))
+        bm25.append(score)
+    best = max(bm25) or 1.0
+    this_year = datetime.date.today().year
+    scored = []
+    for rank, (summary, score) in enumerate(zip(summaries, bm25)):
+        year = re.match(r"\d{4}", summary.get("sortpubdate") or summary.get("pubdate") or "")
+        age = max(0, this_year - int(year.group(0))) if year else half_life * 3
+        total = (
+            score / best
+            + JOURNAL_PRIORS.get((summary.get("source") or "").lower().rstrip("."), 0.0)
+            + recency_weight * 0.5 ** (age / half_life)
+            + rank_weight / (1 + rank / 10)
+        )
+        scored.append((total, -rank, summary["uid"]))
+    scored.sort(reverse=True)
+    return [uid for _, _, uid in scored[:k]]
+
+
+def _text(elem) -> str:
+    """All text of an element, inline markup (<i>, <sup>, ...) removed."""
+    if elem is None:
+        return ""
+    return " ".join("".join(elem.itertext()).split())
+
+
+def _pub_date(elem) -> str:
+    if elem is None:
+        return ""
+    medline_date = elem.findtext("MedlineDate")
+    if medline_date:
+        return medline_date
+    return " ".join(part for part in (elem.findtext("Year"), elem.findtext("Month"), elem.findtext("Day")) if part)
+
+
+def _parse_pubmed_article(elem) -> dict:
+    """Structured fields of one <PubmedArticle> element."""
+    citation = elem.find("MedlineCitation")
+    article = citation.find("Article") if citation is not None else None
+    uid = citation.findtext("PMID", "").strip() if citation is not None else ""
+
+    # Abstract sections, labelled (BACKGROUND, METHODS, ...) or a single unlabelled one
+    sections = []
+    if article is not None:
+        for abstract_text in article.iterfind("Abstract/AbstractText"):
+            sections.append({"label": abstract_text.get("Label", ""), "text": _text(abstract_text)})
+    summary = "\n".join(f"{s['label']}: {s['text']}" if s["label"] else s["text"] for s in sections)
+
+    authors = []
+    if article is not None:
+        for author in article.iterfind("AuthorList/Author"):
+            name = " ".join(part for part in (author.findtext("ForeName"), author.findtext("LastName")) if part)
+            authors.append(name or author.findtext("CollectiveName", ""))
+
+    article_ids = {}
+    for article_id in elem.iterfind("PubmedData/ArticleIdList/ArticleId"):
+        article_ids[article_id.get("IdType")] = (article_id.text or "").strip()
+    doi = article_ids.get("doi", "")
+    if not doi and article is not None:
+        for location in article.iterfind("ELocationID"):
+            if location.get("EIdType") == "doi":
+                doi = (location.text or "").strip()
+
+    return {
+        "uid": uid,
+        "title": _text(article.find("ArticleTitle")) if article is not None else "",
+        "summary": summary,
+        "abstract_sections": sections,
+        "pub_date": _pub_date(article.find("Journal/JournalIssue/PubDate")) if article is not None else "",
+        "journal": article.findtext("Journal/Title", "") if article is not None else "",
+        "authors": authors,
+        "mesh_terms": [_text(heading) for heading in citation.iterfind("MeshHeadingList/MeshHeading/DescriptorName")] if citation is not None else [],
+        "doi": doi,
+        "pmcid": article_ids.get("pmc", ""),
+        "link": f"https://pubmed.ncbi.nlm.nih.gov/{uid}/", #changes from original: added link field to article
+    }
+
+
+def iter_pubmed_articles(source: IO[bytes], deleted: Optional[List[str]] = None) -> Iterator[dict]:
+    """
+    Stream the articles of an efetch XML response (file object) with iterparse.
+    Every <PubmedArticle> is parsed and cleared once it is complete, so memory stays
+    constant per article regardless of the size of the payload.
+    The PMIDs of <DeleteCitation> (PubMed update files) are appended to `deleted` when given.
+    """
+    root = None
+    for event, elem in ElementTree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+        if elem.tag == "PubmedArticle":
+            yield _parse_pubmed_article(elem)
+            elem.clear()
+            # drop the references the root keeps to the processed articles
+            root.clear()
+        elif elem.tag == "DeleteCitation":
+            if deleted is not None:
+                deleted.extend((pmid.text or "").strip() for pmid in elem.iter("PMID"))
+            root.clear()
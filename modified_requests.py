@@ -22,6 +22,11 @@ Purpose:
            -Support code for llm_steps.py
            -Lightweight wrapper around requests library, with async support
            -Modified requests API wrapper
+           -Outbound calls go through the cassette layer (cassette.py) for record/replay; the HTTP cache
+            (http_cache.py) is bypassed while a cassette is active
+           -One process-wide keep-alive connection pool per protocol: a requests.Session (sync) and an
+            aiohttp.ClientSession on the shared background event loop (async), both with default timeouts;
+            close_sessions()/aclose_sessions() release them (also registered with atexit)
            
 '''
 #.....................................................................................................................
@@ -30,12 +35,339 @@ Purpose:
 
 
 # Importing essential libraries and modules
+import atexit
+import io
+import re
+import threading
+import time
 from contextlib import asynccontextmanager
 from typing import Any, AsyncGenerator, Dict, Optional
 
+import json
+
 import aiohttp
 import requests
 from pydantic import BaseModel, Extra
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+
+from cassette import decode_bytes, encode_bytes, get_cassette
+from http_cache import get_http_cache
+from pubmed_client import run_on_client_loop, run_sync
+
+# Connection pool and timeouts (seconds) of the shared sessions
+POOL_CONNECTIONS = 20  # hosts kept in the pool
+POOL_MAXSIZE = 20  # connections per host (sync) / in total (async)
+LIMIT_PER_HOST = 8
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 30.0
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 60.0
+
+# Limits of the bounded fetch (TextRequestsWrapper.fetch/afetch)
+FETCH_READ_TIMEOUT = 10.0
+FETCH_TIME_LIMIT = 20.0  # whole download, so that a trickling server cannot hold the tool
+FETCH_MAX_BYTES = 2 * 2**20  # HTML/text beyond this is cut
+PDF_MAX_BYTES = 10 * 2**20  # larger PDFs are dropped (the text of a cut PDF cannot be extracted)
+PDF_MAX_PAGES = 3
+SNIFF_BYTES = 512
+# Revalidation headers of the HTTP cache (lower case), left out of cassette keys
+CONDITIONAL_HEADERS = ("if-none-match", "if-modified-since")
+CHUNK_BYTES = 16384
+# Leading bytes of common binary formats (images, archives, office documents, media)
+BINARY_SIGNATURES = (
+    b"\x89PNG", b"\xff\xd8\xff", b"GIF8", b"PK\x03\x04", b"\x1f\x8b", b"BZh", b"7z\xbc\xaf", b"Rar!",
+    b"\xd0\xcf\x11\xe0", b"RIFF", b"OggS", b"ID3", b"\x00\x00\x00", b"fLaC", b"wOFF", b"wOF2",
+)
+HTML_SIGNATURES = (b"<!doctype html", b"<html", b"<head", b"<body", b"<!--", b"<?xml", b"<meta", b"<title", b"<div", b"<p")
+
+
+class RecordedResponse:
+    """Recorded HTTP response with the parts of the aiohttp.ClientResponse interface the tools use."""
+
+    def __init__(self, status: int, url: str, headers: Dict[str, str], body: bytes) -> None:
+        self.status = status
+        self.url = url
+        self.headers = headers
+        self._body = body
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get("Content-Type", "").split(";")[0].strip()
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self, encoding: Optional[str] = None) -> str:
+        if encoding:
+            return self._body.decode(encoding, errors="replace")
+        return decode_body(self._body, self.headers)
+
+    async def json(self, **kwargs: Any) -> Any:
+        return json.loads(self._body)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"status": self.status, "url": self.url, "headers": self.headers, "body": encode_bytes(self._body)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RecordedResponse":
+        return cls(data["status"], data["url"], data["headers"], decode_bytes(data["body"]))
+
+
+def decode_body(body: bytes, headers: Dict[str, str]) -> str:
+    """Text of a body in the charset of its Content-Type (UTF-8 when none is given)."""
+    content_type = next((value for name, value in headers.items() if name.lower() == "content-type"), "")
+    match = re.search(r"charset=[\"']?([\w.:-]+)", content_type, re.IGNORECASE)
+    try:
+        return body.decode(match.group(1) if match else "utf-8", errors="replace")
+    except LookupError:
+        return body.decode("utf-8", errors="replace")
+
+
+def sniff_content(content_type: str, head: bytes) -> str:
+    """Kind of a payload ("html", "text", "pdf" or "binary") from its Content-Type and its first bytes."""
+    content_type = content_type.split(";")[0].strip().lower()
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head.startswith(BINARY_SIGNATURES):
+        return "binary"
+    start = head.lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if start.startswith(HTML_SIGNATURES) or content_type in ("text/html", "application/xhtml+xml"):
+        return "html" if b"\x00" not in head else "binary"
+    if content_type == "application/pdf":
+        # labelled PDF without the PDF header (e.g. an HTML error page was caught above)
+        return "binary"
+    if content_type.startswith("text/") or content_type.endswith(("/xml", "+xml", "/json")) or not content_type \
+            or content_type == "application/octet-stream":
+        # servers often label text as octet-stream: text is what has no NUL byte and decodes
+        try:
+            head.decode("utf-8")
+        except UnicodeDecodeError as e:
+            # a multi-byte character cut at the end of the sniffed bytes is fine
+            if e.start < len(head) - 3:
+                return "binary"
+        return "text" if b"\x00" not in head else "binary"
+    return "binary"
+
+
+def extract_pdf_text(body: bytes, max_pages: int = PDF_MAX_PAGES) -> str:
+    """Text of the first pages of a PDF ("" when it cannot be extracted or pypdf is not installed)."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return ""
+    try:
+        reader = PdfReader(io.BytesIO(body))
+        return "\n".join(page.extract_text() or "" for page in reader.pages[:max_pages]).strip()
+    except Exception:
+        # damaged or encrypted PDFs
+        return ""
+
+
+class BoundedResponse:
+    """
+    Result of a bounded fetch.
+
+    kind is "html", "text", "pdf" or "binary"; reason tells why the body was cut (truncated)
+    or dropped (empty body), e.g. "binary content" or "time limit".
+    """
+
+    def __init__(self, status: int, url: str, headers: Dict[str, str], body: bytes, kind: str,
+                 truncated: bool = False, reason: Optional[str] = None) -> None:
+        self.status = status
+        self.url = url
+        self.headers = headers
+        self.body = body
+        self.kind = kind
+        self.truncated = truncated
+        self.reason = reason
+
+    def text(self, max_pages: int = PDF_MAX_PAGES) -> str:
+        """Text of the payload: the (possibly cut) HTML/text, the text of the first PDF pages, or ""."""
+        if self.kind == "pdf":
+            return extract_pdf_text(self.body, max_pages) if self.body else ""
+        if self.kind in ("html", "text"):
+            return decode_body(self.body, self.headers)
+        return ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.status, "url": self.url, "headers": self.headers, "body": encode_bytes(self.body),
+            "kind": self.kind, "truncated": self.truncated, "reason": self.reason,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BoundedResponse":
+        return cls(data["status"], data["url"], data["headers"], decode_bytes(data["body"]), data["kind"],
+                   data["truncated"], data["reason"])
+
+    @classmethod
+    def from_body(cls, status: int, url: str, headers: Dict[str, str], body: bytes) -> "BoundedResponse":
+        """Bounded response of a complete body (e.g. from the HTTP cache)."""
+        content_type = next((value for name, value in headers.items() if name.lower() == "content-type"), "")
+        kind = sniff_content(content_type, body[:SNIFF_BYTES])
+        return cls(status, url, headers, body if kind != "binary" else b"", kind, reason="binary content" if kind == "binary" else None)
+
+
+class _BoundedBody:
+    # Accumulates streamed chunks, sniffs the payload from its first bytes and tells when to stop reading
+
+    def __init__(self, headers: Dict[str, str], max_bytes: int, pdf_max_bytes: int, time_limit: float) -> None:
+        self.content_type = next((value for name, value in headers.items() if name.lower() == "content-type"), "")
+        self.max_bytes = max_bytes
+        self.pdf_max_bytes = pdf_max_bytes
+        self.deadline = time.monotonic() + time_limit
+        self.chunks = []
+        self.size = 0
+        self.kind: Optional[str] = None
+        self.truncated = False
+        self.reason: Optional[str] = None
+        main_type = self.content_type.split("/")[0].strip().lower()
+        length = next((value for name, value in headers.items() if name.lower() == "content-length"), None)
+        if main_type in ("image", "audio", "video", "font"):
+            self._drop("binary", f"{self.content_type.split(';')[0]} content")
+        elif self.content_type.split(";")[0].strip().lower() == "application/pdf" and length and length.isdigit() \
+                and int(length) > pdf_max_bytes:
+            self._drop("pdf", f"PDF larger than {pdf_max_bytes} bytes")
+
+    def _drop(self, kind: str, reason: str) -> None:
+        self.kind = kind
+        self.reason = reason
+        self.chunks = []
+
+    @property
+    def done(self) -> bool:
+        return self.reason is not None
+
+    def feed(self, chunk: bytes) -> bool:
+        """Add a chunk; returns False when reading should stop."""
+        if self.done:
+            return False
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        if self.kind is None and self.size >= SNIFF_BYTES:
+            self._sniff()
+            if self.done:
+                return False
+        limit = self.pdf_max_bytes if self.kind == "pdf" else self.max_bytes
+        if self.size > limit:
+            if self.kind == "pdf":
+                self._drop("pdf", f"PDF larger than {limit} bytes")
+            else:
+                body = b"".join(self.chunks)[:limit]
+                self.chunks = [body]
+                self.truncated = True
+                self.reason = f"cut at {limit} bytes"
+            return False
+        if time.monotonic() > self.deadline:
+            if self.kind == "pdf":
+                self._drop("pdf", "time limit")
+            else:
+                self.truncated = True
+                self.reason = "time limit"
+            return False
+        return True
+
+    def _sniff(self) -> None:
+        self.kind = sniff_content(self.content_type, b"".join(self.chunks)[:SNIFF_BYTES])
+        if self.kind == "binary":
+            self._drop("binary", "binary content")
+
+    def response(self, status: int, url: str, headers: Dict[str, str]) -> BoundedResponse:
+        if self.kind is None:
+            self._sniff()
+        return BoundedResponse(status, url, headers, b"".join(self.chunks), self.kind, self.truncated, self.reason)
+
+
+def _request_record(method: str, url: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    # Cassette key of a request; per-request headers only take part when given, cache validators never do
+    request = {"method": method, "url": url, "params": kwargs.get("params"), "json": kwargs.get("json")}
+    headers = {name: value for name, value in (kwargs.get("headers") or {}).items() if name.lower() not in CONDITIONAL_HEADERS}
+    if headers:
+        request["headers"] = headers
+    return request
+
+
+def _encode_response(response: requests.Response) -> Dict[str, Any]:
+    return {
+        "status": response.status_code,
+        "url": response.url,
+        "headers": dict(response.headers),
+        "encoding": response.encoding,
+        "body": encode_bytes(response.content),
+    }
+
+
+def _decode_response(data: Dict[str, Any]) -> requests.Response:
+    response = requests.Response()
+    response.status_code = data["status"]
+    response.url = data["url"]
+    response.headers = CaseInsensitiveDict(data["headers"])
+    response.encoding = data["encoding"]
+    response._content = decode_bytes(data["body"])
+    return response
+
+
+_session: Optional[requests.Session] = None
+_aiosession: Optional[aiohttp.ClientSession] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide requests.Session (keep-alive pool, retries of idempotent requests on 502/504)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=2, connect=2, backoff_factor=0.3, status_forcelist=(502, 504),
+                          allowed_methods=frozenset({"GET", "HEAD"}), raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _get_aiosession() -> aiohttp.ClientSession:
+    # Shared aiohttp session; only called on the background loop (pubmed_client.py), which owns it
+    global _aiosession
+    if _aiosession is None or _aiosession.closed:
+        connector = aiohttp.TCPConnector(
+            limit=POOL_MAXSIZE,
+            limit_per_host=LIMIT_PER_HOST,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+        timeout = aiohttp.ClientTimeout(total=None, connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+        _aiosession = aiohttp.ClientSession(connector=connector, timeout=timeout)
+    return _aiosession
+
+
+async def aclose_sessions() -> None:
+    """Close the shared aiohttp session (it is created again on the next request)."""
+
+    async def close() -> None:
+        global _aiosession
+        if _aiosession is not None:
+            await _aiosession.close()
+            _aiosession = None
+
+    await run_on_client_loop(close())
+
+
+def close_sessions() -> None:
+    """Close the shared sessions and their pooled connections (they are created again on the next request)."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+    if _aiosession is not None:
+        run_sync(aclose_sessions())
+
+
+atexit.register(close_sessions)
 
 
 class Requests(BaseModel):
@@ -43,10 +375,12 @@ class Requests(BaseModel):
 
     The main purpose of this wrapper is to handle authentication (by saving
     headers) and enable easy async methods on the same base object.
+    Requests go through the shared keep-alive sessions unless session/aiosession is given.
     """
 
     headers: Optional[Dict[str, str]] = None
     aiosession: Optional[aiohttp.ClientSession] = None
+    session: Optional[requests.Session] = None
 
     class Config:
         """Configuration for this pydantic object."""
@@ -54,41 +388,144 @@ class Requests(BaseModel):
         extra = Extra.forbid
         arbitrary_types_allowed = True
 
+    def _request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Make a request through the cassette layer (record/replay)."""
+        return get_cassette().call(
+            "http",
+            _request_record(method, url, kwargs),
+            lambda: self._send(method, url, **kwargs),
+            encode=_encode_response,
+            decode=_decode_response,
+        )
+
+    def _send(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        # changes from modified: pooled session and a default (connect, read) timeout instead of requests.request
+        kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+        headers = {**(self.headers or {}), **(kwargs.pop("headers", None) or {})}
+        return (self.session or get_session()).request(method, url, headers=headers, **kwargs)
+
     def get(self, url: str, **kwargs: Any) -> requests.Response:
         """GET the URL and return the text."""
-        return requests.get(url, headers=self.headers, **kwargs)
+        return self._request("GET", url, **kwargs)
+
+    def fetch(self, url: str, max_bytes: int = FETCH_MAX_BYTES, pdf_max_bytes: int = PDF_MAX_BYTES,
+              time_limit: float = FETCH_TIME_LIMIT, **kwargs: Any) -> BoundedResponse:
+        """GET the URL with a bounded, streamed read of the body."""
+        request = {**_request_record("GET", url, kwargs), "bounded": [max_bytes, pdf_max_bytes]}
+        return get_cassette().call(
+            "http",
+            request,
+            lambda: self._stream(url, max_bytes, pdf_max_bytes, time_limit, **kwargs),
+            encode=BoundedResponse.to_dict,
+            decode=BoundedResponse.from_dict,
+        )
+
+    def _stream(self, url: str, max_bytes: int, pdf_max_bytes: int, time_limit: float, **kwargs: Any) -> BoundedResponse:
+        kwargs.setdefault("timeout", (CONNECT_TIMEOUT, FETCH_READ_TIMEOUT))
+        # closing the response early drops the connection instead of downloading the rest
+        with self._send("GET", url, stream=True, **kwargs) as response:
+            headers = dict(response.headers)
+            reader = _BoundedBody(headers, max_bytes, pdf_max_bytes, time_limit)
+            if not reader.done:
+                # read1 returns what has arrived (iter_content would block until a whole chunk is in)
+                while True:
+                    chunk = response.raw.read1(CHUNK_BYTES, decode_content=True)
+                    if not chunk or not reader.feed(chunk):
+                        break
+            return reader.response(response.status_code, response.url, headers)
 
     def post(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
         """POST to the URL and return the text."""
-        return requests.post(url, json=data, headers=self.headers, **kwargs)
+        return self._request("POST", url, json=data, **kwargs)
 
     def patch(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
         """PATCH the URL and return the text."""
-        return requests.patch(url, json=data, headers=self.headers, **kwargs)
+        return self._request("PATCH", url, json=data, **kwargs)
 
     def put(self, url: str, data: Dict[str, Any], **kwargs: Any) -> requests.Response:
         """PUT the URL and return the text."""
-        return requests.put(url, json=data, headers=self.headers, **kwargs)
+        return self._request("PUT", url, json=data, **kwargs)
 
     def delete(self, url: str, **kwargs: Any) -> requests.Response:
         """DELETE the URL and return the text."""
-        return requests.delete(url, headers=self.headers, **kwargs)
+        return self._request("DELETE", url, **kwargs)
 
     @asynccontextmanager
     async def _arequest(
         self, method: str, url: str, **kwargs: Any
     ) -> AsyncGenerator[aiohttp.ClientResponse, None]:
-        """Make an async request."""
-        if not self.aiosession:
-            async with aiohttp.ClientSession() as session:
-                async with session.request(
-                    method, url, headers=self.headers, **kwargs
-                ) as response:
+        """Make an async request.
+
+        Without an aiosession the request runs on the shared session of the background loop and
+        the body is read there; a RecordedResponse (same text()/read()/json() interface) is yielded.
+        With an active cassette the response is recorded/replayed.
+        """
+        cassette = get_cassette()
+        if cassette.mode == "off":
+            if self.aiosession is not None:
+                async with self._araw_request(method, url, **kwargs) as response:
                     yield response
+            else:
+                yield await self._afetch(method, url, **kwargs)
+            return
+
+        yield await cassette.acall(
+            "http", _request_record(method, url, kwargs), lambda: self._afetch(method, url, **kwargs),
+            encode=RecordedResponse.to_dict, decode=RecordedResponse.from_dict,
+        )
+
+    async def _afetch(self, method: str, url: str, **kwargs: Any) -> RecordedResponse:
+        """Make an async request and read the body."""
+
+        async def fetch() -> RecordedResponse:
+            async with self._araw_request(method, url, **kwargs) as response:
+                body = await response.read()
+                return RecordedResponse(response.status, str(response.url), dict(response.headers), body)
+
+        if self.aiosession is not None:
+            return await fetch()
+        return await run_on_client_loop(fetch())
+
+    async def afetch(self, url: str, max_bytes: int = FETCH_MAX_BYTES, pdf_max_bytes: int = PDF_MAX_BYTES,
+                     time_limit: float = FETCH_TIME_LIMIT, **kwargs: Any) -> BoundedResponse:
+        """Async version of fetch()."""
+        request = {**_request_record("GET", url, kwargs), "bounded": [max_bytes, pdf_max_bytes]}
+
+        async def stream() -> BoundedResponse:
+            kwargs.setdefault("timeout", aiohttp.ClientTimeout(total=None, connect=CONNECT_TIMEOUT, sock_read=FETCH_READ_TIMEOUT))
+            async with self._araw_request("GET", url, **kwargs) as response:
+                headers = dict(response.headers)
+                reader = _BoundedBody(headers, max_bytes, pdf_max_bytes, time_limit)
+                if not reader.done:
+                    async for chunk in response.content.iter_chunked(CHUNK_BYTES):
+                        if not reader.feed(chunk):
+                            # the connection is dropped instead of downloading the rest
+                            response.close()
+                            break
+                return reader.response(response.status, str(response.url), headers)
+
+        async def fetch() -> BoundedResponse:
+            if self.aiosession is not None:
+                return await stream()
+            return await run_on_client_loop(stream())
+
+        return await get_cassette().acall(
+            "http", request, fetch, encode=BoundedResponse.to_dict, decode=BoundedResponse.from_dict
+        )
+
+    @asynccontextmanager
+    async def _araw_request(
+        self, method: str, url: str, **kwargs: Any
+    ) -> AsyncGenerator[aiohttp.ClientResponse, None]:
+        """Make an async request on the network (on the background loop when no aiosession is given)."""
+        kwargs["headers"] = {**(self.headers or {}), **(kwargs.get("headers") or {})}
+        if not self.aiosession:
+            # changes from modified: shared keep-alive session instead of one ClientSession per request
+            async with _get_aiosession().request(method, url, **kwargs) as response:
+                yield response
         else:
-            async with self.aiosession.request(
-                method, url, headers=self.headers, **kwargs
-            ) as response:
+            kwargs.setdefault("timeout", aiohttp.ClientTimeout(total=None, connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT))
+            async with self.aiosession.request(method, url, **kwargs) as response:
                 yield response
 
     @asynccontextmanager
@@ -136,10 +573,14 @@ class TextRequestsWrapper(BaseModel):
     """Lightweight wrapper around requests library.
 
     The main purpose of this wrapper is to always return a text output.
+    GET responses are served from the shared HTTP cache (http_cache.py) when use_cache is set
+    and no cassette is active.
     """
 
     headers: Optional[Dict[str, str]] = None
     aiosession: Optional[aiohttp.ClientSession] = None
+    session: Optional[requests.Session] = None
+    use_cache: bool = True
 
     class Config:
         """Configuration for this pydantic object."""
@@ -149,11 +590,62 @@ class TextRequestsWrapper(BaseModel):
 
     @property
     def requests(self) -> Requests:
-        return Requests(headers=self.headers, aiosession=self.aiosession)
+        return Requests(headers=self.headers, aiosession=self.aiosession, session=self.session)
+
+    def _caching(self) -> bool:
+        # With an active cassette every request goes to the cassette, so that what is recorded
+        # and replayed does not depend on the state of the local HTTP cache
+        return self.use_cache and get_cassette().mode == "off"
+
+    def _lookup(self, url: str, kwargs: Dict[str, Any]):
+        # Cached response of a GET, adding the revalidation headers to kwargs when it is stale
+        if not self._caching():
+            return None
+        cached = get_http_cache().lookup("GET", url, kwargs.get("params"))
+        if cached is not None and not cached.fresh:
+            kwargs["headers"] = {**cached.validators(), **(kwargs.get("headers") or {})}
+        return cached
+
+    def _update(self, url: str, kwargs: Dict[str, Any], cached, status: int, headers: Dict[str, str], body: bytes):
+        # Headers and body of a GET answer: the stored ones on 304 (Not Modified), else the new ones (stored if cacheable)
+        if cached is not None and status == 304:
+            cached = get_http_cache().refresh(cached, headers)
+            return cached.headers, cached.body
+        if self._caching():
+            get_http_cache().store("GET", url, status, headers, body, kwargs.get("params"))
+        return headers, body
 
     def get(self, url: str, **kwargs: Any) -> str:
         """GET the URL and return the text."""
-        return self.requests.get(url, **kwargs).text
+        cached = self._lookup(url, kwargs)
+        if cached is not None and cached.fresh:
+            return decode_body(cached.body, cached.headers)
+        response = self.requests.get(url, **kwargs)
+        headers, body = self._update(url, kwargs, cached, response.status_code, dict(response.headers), response.content)
+        return decode_body(body, headers)
+
+    def _bounded(self, url: str, kwargs: Dict[str, Any], cached, response: BoundedResponse) -> BoundedResponse:
+        # Only complete bodies are cached; a 304 is answered with the stored body
+        if cached is not None and response.status == 304:
+            headers, body = self._update(url, kwargs, cached, response.status, response.headers, b"")
+            return BoundedResponse.from_body(cached.status, cached.url, headers, body)
+        if response.kind != "binary" and not response.reason:
+            self._update(url, kwargs, None, response.status, response.headers, response.body)
+        return response
+
+    def fetch(self, url: str, **kwargs: Any) -> BoundedResponse:
+        """GET the URL with a bounded read (timeouts, byte cap, content sniffing); see Requests.fetch."""
+        cached = self._lookup(url, kwargs)
+        if cached is not None and cached.fresh:
+            return BoundedResponse.from_body(cached.status, cached.url, cached.headers, cached.body)
+        return self._bounded(url, kwargs, cached, self.requests.fetch(url, **kwargs))
+
+    async def afetch(self, url: str, **kwargs: Any) -> BoundedResponse:
+        """Async version of fetch()."""
+        cached = self._lookup(url, kwargs)
+        if cached is not None and cached.fresh:
+            return BoundedResponse.from_body(cached.status, cached.url, cached.headers, cached.body)
+        return self._bounded(url, kwargs, cached, await self.requests.afetch(url, **kwargs))
 
     def post(self, url: str, data: Dict[str, Any], **kwargs: Any) -> str:
         """POST to the URL and return the text."""
@@ -173,8 +665,13 @@ class TextRequestsWrapper(BaseModel):
 
     async def aget(self, url: str, **kwargs: Any) -> str:
         """GET the URL and return the text asynchronously."""
+        cached = self._lookup(url, kwargs)
+        if cached is not None and cached.fresh:
+            return decode_body(cached.body, cached.headers)
         async with self.requests.aget(url, **kwargs) as response:
-            return await response.text()
+            status, headers, body = response.status, dict(response.headers), await response.read()
+        headers, body = self._update(url, kwargs, cached, status, headers, body)
+        return decode_body(body, headers)
 
     async def apost(self, url: str, data: Dict[str, Any], **kwargs: Any) -> str:
         """POST to the URL and return the text asynchronously."""
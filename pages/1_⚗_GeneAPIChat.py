@@ -32,6 +32,7 @@ import sys  # System-specific parameters and functions
 import io  # I/O core tools
 import matplotlib.pyplot as plt  # Visualization library for 2D plots
 import gseapy  # Gene set enrichment analysis library
+from cassette import get_cassette, encode_dataframe, decode_dataframe  # Record/replay of outbound calls
 import seaborn as sns  # Visualization library based on matplotlib, provides a high-level interface for drawing attractive statistical graphics
 #import mpld3  # Matplotlib to D3 converter. (Commented out, not in use)
 
@@ -178,13 +179,17 @@ def enrichr_function(genelist, selected_library, folder_path):
     # Extract gene list from the input data
     genes = genelist["gene"]
     
-    # Perform enrichment analysis using the gseapy library
-    enr_res = gseapy.enrichr(
-        gene_list=genes,
-        organism='human',
-        gene_sets=selected_library,  # Use the selected gene set library
-        cutoff=0.5  # Set the cutoff for the analysis
-    )
+    # Perform enrichment analysis using the gseapy library (through the cassette layer for record/replay)
+    def run_enrichr():
+        enr_res = gseapy.enrichr(
+            gene_list=genes,
+            organism='human',
+            gene_sets=selected_library,  # Use the selected gene set library
+            cutoff=0.5  # Set the cutoff for the analysis
+        )
+        return enr_res.results
+    enr_results = get_cassette().call("gseapy", {"gene_list": list(genes), "organism": "human", "gene_sets": selected_library, "cutoff": 0.5},
+                                      run_enrichr, encode=encode_dataframe, decode=decode_dataframe)
     
     # Ensure the output folder exists
     os.makedirs(folder_path, exist_ok=True)
@@ -196,7 +201,7 @@ def enrichr_function(genelist, selected_library, folder_path):
         output_file = os.path.join(folder_path, "enrichment_results_multiplegenesets.csv")
     
     # Save the enrichment analysis results to a CSV file
-    enr_res.results.to_csv(output_file, index=False)
+    enr_results.to_csv(output_file, index=False)
     
     # Display a message in the app with the path to the results file
     st.write(f"Enrichment analysis results saved to {output_file}")
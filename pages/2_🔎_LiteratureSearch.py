@@ -14,6 +14,7 @@ Purpose: Front-end design and back-end fucntionality of the Literature Search Ch
 import os  # Provides a way of using operating system dependent functionality.
 import datetime  # Supplies classes for manipulating dates and times.
 import base64  # Provides data encoding and decoding as per RFC 3548.
+import asyncio  # Runs the agent with its async tools.
 from pathlib import Path  # Offers classes representing filesystem paths with semantics appropriate for different operating systems.
 from dotenv import load_dotenv  # Reads key-value pairs from a .env file and sets them as environment variables.
 #Langchain libraries
@@ -343,8 +344,8 @@ if 'past' not in st.session_state:
 
 # Function to generate a response from the agent based on the user's prompt
 def generate_response(prompt): 
-    # Execute the agent chain with the provided input
-    response = agent_chain.run(input=prompt)
+    # Execute the agent chain with the provided input (async tools, so several sources can be fetched concurrently)
+    response = asyncio.run(agent_chain.arun(input=prompt))
     # Debugging: Print the current conversation buffer
     print(st.session_state["agent_memory"].buffer)
     return response
@@ -0,0 +1,138 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.........................................................................................
+Purpose:
+        -System messages, few-shot examples, extract patterns and FAQ prompts of the PGS Chat page
+        -Shared by the PGS Chat page, batch_analyze.py and the benchmarks
+'''
+#..........................................................................................
+
+
+#Retrieve from DB (AnalyzeGPT.query_run)
+# Define a system message for interaction with SQL database
+QUERY_SYSTEM_MESSAGE="""
+        You are an agent designed to interact with a SQL database with schema detail in <<data_sources>>.
+        Given an input question, create a syntactically correct {sql_engine} query to run, then look at the results of the query and return the answer.
+        You can order the results by a relevant column to return the most interesting examples in the database.
+        Never query for all the columns from a specific table, only ask for a the few relevant columns given the question.
+        You MUST double check your query before executing it. If you get an error while executing a query, rewrite the query and try again.
+        DO NOT make any DML statements (INSERT, UPDATE, DELETE, DROP etc.) to the database.
+        Remember to format SQL query as in ```sql\n SQL QUERY HERE ``` in your response.
+        """
+# Initialize few_shot_examples variable (content not shown for brevity)
+QUERY_FEW_SHOT_EXAMPLES=""
+# Define patterns for extracting SQL queries from ChatGPT responses
+QUERY_EXTRACT_PATTERNS = [('sql', r"```sql\n(.*?)```")]
+# Define prompts for ChatGPT and GPT-4 (content not shown for brevity)
+QUERY_PROMPTS = {
+   "ChatGPT": [
+                "Show variants corresponding to 5 top ranked genes, ranked  from top to bottom, in Alzheimer.",
+                "Show variants corresponding to 5 top ranked genes, ranked  from top to bottom, in Alzheimer. If duplicate, show only once.",
+                "Show all information corresponding to 5 top ranked genes, ranked from top to bottom in Alzheimer.",
+                "Show all information corresponding to 5 top ranked genes, ranked from top to bottom in Alzheimer. If duplicate, show only once.",
+                "Display the genes with 5 high ranks and their corresponding ranks for each PGS score ID.",
+                "How often does APOE gene occur in Alzheimer?",
+                "What are the top 5 most frequently occurring gene in Alzheimer?",
+                "How often does gene APOE occur for Alzheimer?",
+                "Show genes and their frequency for ALzheimer that occur less frequently than APOE?",
+    ],
+    "GPT-4": [
+                "Show variants corresponding to 5 top ranked genes, ranked  from top to bottom, in Alzheimer.",
+                "Show variants corresponding to 5 top ranked genes, ranked  from top to bottom, in Alzheimer. If duplicate, show only once.",
+                "Show all information corresponding to 5 top ranked genes, ranked from top to bottom in Alzheimer.",
+                "Show all information corresponding to 5 top ranked genes, ranked from top to bottom in Alzheimer. If duplicate, show only once.",
+                "Display the genes with 5 high ranks and their corresponding ranks for each PGS score ID.",
+                "How often does APOE gene occur in Alzheimer?",
+                "What are the top 5 most frequently occurring gene in Alzheimer?",
+                "How often does gene APOE occur for Alzheimer?",
+                "Show genes and their frequency for ALzheimer that occur less frequently than APOE?",
+    ]
+}
+
+
+#Visualize DB (AnalyzeGPT.run)
+#Define a system message for visualizing and analyzing data
+VISUALIZE_SYSTEM_MESSAGE="""
+        You are a smart AI assistant to help answer business questions based on analyzing data.
+        You can plan solving the question with one more multiple thought step. At each thought step, you can write python code to analyze data to assist you. Observe what you get at each step to plan for the next step.
+        You are given following utilities to help you retrieve data and commmunicate your result to end user.
+        1. execute_sql(sql_query: str): A Python function can query data from the <<data_sources>> given a query which you need to create. The query has to be syntactically correct for {sql_engine} and only use tables and columns under <<data_sources>>. The execute_sql function returns a Python pandas dataframe contain the results of the query.
+        2. Use plotly library for data visualization.
+        3. Use observe(label: str, data: any) utility function to observe data under the label for your evaluation. Use observe() function instead of print() as this is executed in streamlit environment. Due to system limitation, you will only see the first 10 rows of the dataset.
+        4. To communicate with user, use show() function on data, text and plotly figure. show() is a utility function that can render different types of data to end user. Remember, you don't see data with show(), only user does. You see data with observe()
+            - If you want to show  user a plotly visualization, then use ```show(fig)``
+            - If you want to show user data which is a text or a pandas dataframe or a list, use ```show(data)```
+            - Never use print(). User don't see anything with print()
+        5. Lastly, don't forget to deal with data quality problem. You should apply data imputation technique to deal with missing data or NAN data.
+        6. Always follow the flow of Thought: , Observation:, Action: and Answer: as in template below strictly.
+
+        """
+# Initialize few_shot_examples variable (content not shown for brevity)
+VISUALIZE_FEW_SHOT_EXAMPLES="""
+        <<Template>>
+        Question: User Question
+        Thought 1: Your thought here.
+        Action:
+        ```python
+        #Import neccessary libraries here
+        import numpy as np
+        #Query some data
+        sql_query = "SOME SQL QUERY"
+        step1_df = execute_sql(sql_query)
+        # Replace NAN with 0. Always have this step
+        step1_df['Some_Column'] = step1_df['Some_Column'].replace(np.nan,0)
+        #observe query result
+        observe("some_label", step1_df) #Always use observe() instead of print
+        ```
+        Observation:
+        step1_df is displayed here
+        Thought 2: Your thought here
+        Action:
+        ```python
+        import plotly.express as px
+        #from step1_df, perform some data analysis action to produce step2_df
+        #To see the data for yourself the only way is to use observe()
+        observe("some_label", step2_df) #Always use observe()
+        #Decide to show it to user.
+        fig=px.line(step2_df)
+        #visualize fig object to user.
+        show(fig)
+        #you can also directly display tabular or text data to end user.
+        show(step2_df)
+        ```
+        Observation:
+        step2_df is displayed here
+        Answer: Your final answer and comment for the question. Also use Python for computation, never compute result youself.
+        <</Template>>
+
+        """
+# Define patterns for extracting thoughts, actions, and answers from ChatGPT responses
+VISUALIZE_EXTRACT_PATTERNS = [("Thought:",r'(Thought \d+):\s*(.*?)(?:\n|$)'), ('Action:',r"```python\n(.*?)```"),("Answer:",r'([Aa]nswer:) (.*)')]
+# Define prompts for ChatGPT or GPT-4
+VISUALIZE_PROMPTS = {
+    "ChatGPT": [
+                "Plot a heat map for top 5 ranked variants and their genes against ranks , ranked high to low, in Alzheimer.  No duplicates.",
+                "Plot a heat map with variants against ranks for the top 5 ranked genes, ranked high to low, in Alzheimer.  If duplicate show only once.",
+                "Plot a chart SNP against ranks for the top 5 ranked genes, ranked high to low, in Alzheimer. use pgssnpmeta only. If duplicate show only once.",
+                "Plot rsids and genes against ranks for the top 5 ranked genes, ranked high to low, in Alzheimer. use pgssnpmeta only. If duplicate show only once. show legends and use better visualization.",
+                "Plot variants against ranks for the top 5 ranked genes, ranked high to low, in Alzheimer. use pgssnpmeta only.",
+                "Plot variants against ranks for the top 5 ranked genes, ranked high to low, in Alzheimer. use pgssnpmeta only. If duplicate show only once.",
+                "Plot the PGS score IDs and other info for the top 5 genes with top ranks displayed first in Alzheimer.",
+                "Plot a bar plot  top 5 most frequently occurring gene in Alzheimer.",
+                "Plot the PGS score IDs and their count in European Ancestory for Alzheimer." ,
+    ],
+    "GPT-4": [
+                "Plot a heat map for top 5 ranked variants and their genes against ranks , ranked high to low, in Alzheimer.  No duplicates.",
+                "Plot a heat map with variants against ranks for the top 5 ranked genes, ranked high to low, in Alzheimer.  If duplicate show only once.",
+                "Plot a chart SNP against ranks for the top 5 ranked genes, ranked high to low, in Alzheimer. use pgssnpmeta only. If duplicate show only once.",
+                "Plot rsids and genes against ranks for the top 5 ranked genes, ranked high to low, in Alzheimer. use pgssnpmeta only. If duplicate show only once. show legends and use better visualization.",
+                "Plot variants against ranks for the top 5 ranked genes, ranked high to low, in Alzheimer. use pgssnpmeta only.",
+                "Plot variants against ranks for the top 5 ranked genes, ranked high to low, in Alzheimer. use pgssnpmeta only. If duplicate show only once.",
+                "Plot the PGS score IDs and other info for the top 5 genes with top ranks displayed first in Alzheimer.",
+                "Plot a bar plot  top 5 most frequently occurring gene in Alzheimer.",
+                "Plot the PGS score IDs and their count in European Ancestory for Alzheimer." ,
+    ]
+}
@@ -0,0 +1,145 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.....................................................................................................................
+Purpose:
+           -Support code for modified_pubmed.py
+           -asyncio client for the NCBI E-utilities with one shared keep-alive connection pool (aiohttp)
+           -Requests are paced by the shared governor of the E-utilities host (rate_governor.py), which never
+            exceeds NCBI's limits (3 requests/s, 10 requests/s per API key), so that concurrent
+            esearch/efetch calls stay under the limit instead of reacting to 429s
+           -The client lives on a background event loop, so sync code (and every Streamlit session)
+            shares the same pool and limiter through run_sync()
+References:
+           https://www.ncbi.nlm.nih.gov/books/NBK25497/#chapter2.Usage_Guidelines_and_Requiremen
+'''
+#.....................................................................................................................
+
+
+# Importing essential libraries and modules
+import asyncio
+import concurrent.futures
+import os
+import ssl
+import threading
+from typing import Any, Coroutine, Dict, Optional
+
+import aiohttp
+
+from cassette import decode_bytes, encode_bytes, get_cassette
+from rate_governor import THROTTLE_STATUS, Throttled, get_governor, parse_retry_after
+
+EUTILS_HOST = "eutils.ncbi.nlm.nih.gov"
+
+
+class AsyncPubMedClient:
+    """
+    Async E-utilities client.
+
+    Parameters:
+        api_key: NCBI API key sent with every request (the governor of the key allows 10 requests/s)
+        max_connections: size of the keep-alive connection pool
+        max_retry: retries of a request answered with 429 or 5xx
+        backoff_factor: other 5xx answers are retried after backoff_factor * 2 ** (retry - 1) seconds
+         (0.3, 0.6, 1.2, ... as the Retry policy of modified_requests.py)
+    Requests are paced by the process-wide governor of the E-utilities host and API key (rate_governor.py).
+    """
+
+    def __init__(self, api_key: Optional[str] = None, max_connections: int = 10, max_retry: int = 5,
+                 backoff_factor: float = 0.3) -> None:
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.max_retry = max_retry
+        self.backoff_factor = backoff_factor
+        self.governor = get_governor(EUTILS_HOST, api_key)
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _session_for_loop(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            # changes from modified: one SSL context and one keep-alive pool instead of one per request
+            connector = aiohttp.TCPConnector(limit=self.max_connections, ssl=ssl._create_unverified_context(), keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _fetch(self, url: str) -> bytes:
+        # the API key is only added here, so it never reaches the cassette files or their request keys
+        if self.api_key:
+            url += f"&api_key={self.api_key}"
+        retry = 0
+        while True:
+            try:
+                async with self.governor.aslot():
+                    async with self._session_for_loop().get(url) as response:
+                        if response.status in THROTTLE_STATUS:
+                            raise Throttled(response.status, parse_retry_after(response.headers.get("Retry-After")))
+                        response.raise_for_status()
+                        return await response.read()
+            except Throttled:
+                # the governor pauses the host (Retry-After) and lowers its rate; retry this request
+                if retry >= self.max_retry:
+                    raise
+                retry += 1
+            except aiohttp.ClientResponseError as e:
+                # other server errors are retried after an exponential backoff, without slowing the whole host down
+                if e.status < 500 or retry >= self.max_retry:
+                    raise
+                retry += 1
+                await asyncio.sleep(self.backoff_factor * 2 ** (retry - 1))
+
+    async def get(self, url: str) -> bytes:
+        """GET an E-utilities URL through the cassette layer and return the raw body."""
+        return await get_cassette().acall(
+            "http", {"method": "GET", "url": url}, lambda: self._fetch(url), encode=encode_bytes, decode=decode_bytes
+        )
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+# Background event loop running the shared client
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_clients: Dict[Optional[str], AsyncPubMedClient] = {}
+_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="pubmed-client", daemon=True).start()
+        return _loop
+
+
+def submit(coroutine: Coroutine[Any, Any, Any]) -> concurrent.futures.Future:
+    """Schedule a coroutine on the background loop and return a future for its result."""
+    return asyncio.run_coroutine_threadsafe(coroutine, _background_loop())
+
+
+def run_sync(coroutine: Coroutine[Any, Any, Any]) -> Any:
+    """Run a coroutine on the background loop and wait for the result (sync facade)."""
+    return submit(coroutine).result()
+
+
+async def run_on_client_loop(coroutine: Coroutine[Any, Any, Any]) -> Any:
+    """Await a coroutine on the background loop from any other event loop."""
+    loop = _background_loop()
+    try:
+        if asyncio.get_running_loop() is loop:
+            return await coroutine
+    except RuntimeError:
+        pass
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, loop))
+
+
+def get_pubmed_client(api_key: Optional[str] = None) -> AsyncPubMedClient:
+    """Return the process-wide client for an API key (NCBI_API_KEY by default)."""
+    api_key = api_key or os.environ.get("NCBI_API_KEY") or None
+    with _lock:
+        if api_key not in _clients:
+            _clients[api_key] = AsyncPubMedClient(api_key)
+        return _clients[api_key]
@@ -0,0 +1,205 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.....................................................................................................................
+Purpose:
+           -Offline local PubMed mirror backed by SQLite FTS5 (title and abstract)
+           -Ingests PubMed baseline/update files (pubmed*.xml.gz) with a streaming parser and batched inserts;
+            files already ingested are skipped, update files replace revised citations and apply DeleteCitation
+           -Answers NewPubMedAPIWrapper.load (backend="local") with BM25-ranked results in milliseconds
+Usage:
+           python pubmed_mirror.py ingest --db data/pubmed_mirror.db baseline/pubmed24n*.xml.gz updatefiles/*.xml.gz
+           python pubmed_mirror.py search --db data/pubmed_mirror.db "APOE Alzheimer"
+References:
+           https://pubmed.ncbi.nlm.nih.gov/download/
+'''
+#.....................................................................................................................
+
+
+# Importing essential libraries and modules
+import argparse
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (pmid INTEGER PRIMARY KEY, data TEXT NOT NULL);
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(title, abstract, content='', contentless_delete=1);
+CREATE TABLE IF NOT EXISTS ingested_files (name TEXT PRIMARY KEY, articles INTEGER, deleted INTEGER, ingested_at REAL);
+"""
+# SQLite before 3.43 has no contentless_delete; a regular FTS5 table (which also stores the text) is used instead
+SCHEMA_FALLBACK = SCHEMA.replace("content='', contentless_delete=1", "")
+# Words left out of queries and rankings (natural-language agent queries rarely match with them);
+# the one list of the repository, imported by modified_pubmed.py, arxiv_mirror.py and tool_budget.py
+STOPWORDS = {"a", "an", "and", "are", "as", "at", "by", "for", "from", "in", "is", "of", "on", "or", "the", "to", "with"}
+
+
+def fts_query(query: str, operator: str = "AND") -> str:
+    """
+    FTS5 MATCH expression for a free-text query: its words without stopwords, quoted (so no FTS5 syntax leaks in)
+    and joined with AND (every word must occur) or OR (any word, the bm25 ranking favours the best matches).
+    """
+    tokens = re.findall(r"\w+", query.lower())
+    tokens = [token for token in tokens if token not in STOPWORDS] or tokens
+    return f" {operator} ".join(f'"{token}"' for token in dict.fromkeys(tokens))
+
+
+class PubMedMirror:
+    """
+    Local PubMed mirror.
+
+    Parameters:
+        path: SQLite database file
+        batch_size: articles per insert transaction while ingesting
+    """
+
+    def __init__(self, path: str, batch_size: int = 5000) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        try:
+            self._connection.executescript(SCHEMA)
+        except sqlite3.OperationalError:
+            self._connection.executescript(SCHEMA_FALLBACK)
+        self._lock = threading.Lock()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def _delete(self, pmids: List[int]) -> None:
+        # Remove articles (revised or deleted citations) from both tables
+        for start in range(0, len(pmids), 500):
+            chunk = pmids[start : start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            self._connection.execute(f"DELETE FROM articles_fts WHERE rowid IN ({placeholders})", chunk)
+            self._connection.execute(f"DELETE FROM articles WHERE pmid IN ({placeholders})", chunk)
+
+    def _write_batch(self, articles: List[dict]) -> None:
+        with self._lock, self._connection:
+            self._delete([int(article["uid"]) for article in articles])
+            self._connection.executemany(
+                "INSERT INTO articles VALUES (?, ?)", [(int(article["uid"]), json.dumps(article)) for article in articles]
+            )
+            self._connection.executemany(
+                "INSERT INTO articles_fts(rowid, title, abstract) VALUES (?, ?, ?)",
+                [(int(article["uid"]), article["title"], article["summary"]) for article in articles],
+            )
+
+    def ingest_file(self, path: str, force: bool = False) -> int:
+        """Stream one baseline/update file into the mirror; returns the number of articles (0 if already ingested)."""
+        from modified_pubmed import iter_pubmed_articles
+
+        name = os.path.basename(path)
+        with self._lock:
+            done = self._connection.execute("SELECT 1 FROM ingested_files WHERE name = ?", (name,)).fetchone()
+        if done and not force:
+            return 0
+        opener = gzip.open if path.endswith(".gz") else open
+        deleted: List[str] = []
+        # a PMID may occur twice in one file (revised citation); the last version wins
+        batch: Dict[str, dict] = {}
+        count = 0
+        with opener(path, "rb") as f:
+            for article in iter_pubmed_articles(f, deleted):
+                if not article["uid"]:
+                    continue
+                batch[article["uid"]] = article
+                count += 1
+                if len(batch) >= self.batch_size:
+                    self._write_batch(list(batch.values()))
+                    batch = {}
+        if batch:
+            self._write_batch(list(batch.values()))
+        with self._lock, self._connection:
+            if deleted:
+                self._delete([int(pmid) for pmid in deleted if pmid])
+            self._connection.execute(
+                "INSERT OR REPLACE INTO ingested_files VALUES (?, ?, ?, ?)", (name, count, len(deleted), time.time())
+            )
+        return count
+
+    def ingest(self, paths: Iterable[str], force: bool = False) -> int:
+        """Ingest files in the given order (baseline first, then the update files in sequence)."""
+        total = 0
+        for path in paths:
+            total += self.ingest_file(path, force)
+        if total == 0:
+            return total
+        # merge the FTS5 index segments written by the batches
+        with self._lock:
+            self._connection.execute("INSERT INTO articles_fts(articles_fts) VALUES ('optimize')")
+            self._connection.commit()
+        return total
+
+    def _match(self, match: str, k: int) -> List[dict]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT a.data FROM articles_fts JOIN articles a ON a.pmid = articles_fts.rowid "
+                "WHERE articles_fts MATCH ? ORDER BY bm25(articles_fts) LIMIT ?",
+                (match, k),
+            ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def search(self, query: str, k: int = 3) -> List[dict]:
+        """
+        BM25-ranked articles (title and abstract) matching every word of the query except stopwords,
+        or, when no article does, any of its words.
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        articles = self._match(match, k)
+        if not articles and " AND " in match:
+            articles = self._match(fts_query(query, "OR"), k)
+        return articles
+
+
+_mirror: Optional[PubMedMirror] = None
+_mirror_lock = threading.Lock()
+
+
+def get_pubmed_mirror() -> Optional[PubMedMirror]:
+    """Return the process-wide mirror (GENEVIC_PUBMED_MIRROR), or None when no mirror is configured."""
+    global _mirror
+    path = os.environ.get("GENEVIC_PUBMED_MIRROR")
+    if not path or not os.path.exists(path):
+        return None
+    with _mirror_lock:
+        if _mirror is None:
+            _mirror = PubMedMirror(path)
+        return _mirror
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local PubMed mirror (SQLite FTS5).")
+    parser.add_argument("command", choices=["ingest", "search"])
+    parser.add_argument("args", nargs="+", help="files to ingest, or the search query")
+    parser.add_argument("--db", default=os.environ.get("GENEVIC_PUBMED_MIRROR", "data/pubmed_mirror.db"))
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--force", action="store_true", help="ingest files again even if already ingested")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args(argv)
+    mirror = PubMedMirror(args.db, batch_size=args.batch_size)
+    if args.command == "ingest":
+        start = time.perf_counter()
+        total = mirror.ingest(sorted(args.args), force=args.force)
+        print(f"Ingested {total} articles in {time.perf_counter() - start:.1f}s ({mirror.count()} in the mirror)")
+    else:
+        start = time.perf_counter()
+        for article in mirror.search(" ".join(args.args), args.k):
+            print(f"{article['uid']}\t{article['pub_date']}\t{article['title']}")
+        print(f"({(time.perf_counter() - start) * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.....................................................................................................................
+Purpose:
+           -Support code for modified_pubmed.py
+           -Local SQLite store of parsed PubMed articles keyed by PMID (with the time they were fetched)
+           -esearch cache keyed by normalized query, sort and retmax, with a time-to-live
+           -Lets NewPubMedAPIWrapper.load serve repeated searches locally and efetch only the missing PMIDs
+'''
+#.....................................................................................................................
+
+
+# Importing essential libraries and modules
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (pmid TEXT PRIMARY KEY, data TEXT NOT NULL, fetched_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS searches (search_key TEXT PRIMARY KEY, pmids TEXT NOT NULL, fetched_at REAL NOT NULL);
+"""
+
+
+def normalize_query(query: str) -> str:
+    """Case and whitespace insensitive form of a search query."""
+    return " ".join(query.lower().split())
+
+
+class PubMedStore:
+    """
+    SQLite-backed store of PubMed articles and esearch results.
+
+    Parameters:
+        path: SQLite database file
+        search_ttl: seconds an esearch result is served from the cache
+        article_ttl: seconds a stored article is served before it is fetched again (None = forever)
+    """
+
+    def __init__(self, path: str, search_ttl: float = 24 * 3600, article_ttl: Optional[float] = None) -> None:
+        self.path = path
+        self.search_ttl = search_ttl
+        self.article_ttl = article_ttl
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One connection shared by the Streamlit sessions (threads), serialized by a lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("PRAGMA journal_mode=WAL;" + SCHEMA)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def search_key(query: str, sort: str, retmax: int) -> str:
+        return json.dumps([normalize_query(query), sort, int(retmax)])
+
+    def get_search(self, query: str, sort: str, retmax: int) -> Optional[List[str]]:
+        """PMIDs of a cached esearch, or None when missing or expired."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT pmids, fetched_at FROM searches WHERE search_key = ?", (self.search_key(query, sort, retmax),)
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.search_ttl:
+            return None
+        return json.loads(row[0])
+
+    def put_search(self, query: str, sort: str, retmax: int, pmids: List[str]) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?, ?)",
+                (self.search_key(query, sort, retmax), json.dumps(pmids), time.time()),
+            )
+
+    def get_articles(self, pmids: List[str]) -> Dict[str, dict]:
+        """Stored articles by PMID; missing or expired PMIDs are left out."""
+        if not pmids:
+            return {}
+        placeholders = ",".join("?" * len(pmids))
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT pmid, data, fetched_at FROM articles WHERE pmid IN ({placeholders})", list(pmids)
+            ).fetchall()
+        now = time.time()
+        return {
+            pmid: json.loads(data)
+            for pmid, data, fetched_at in rows
+            if self.article_ttl is None or now - fetched_at <= self.article_ttl
+        }
+
+    def put_articles(self, articles: List[dict]) -> None:
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO articles VALUES (?, ?, ?)",
+                [(article["uid"], json.dumps(article), now) for article in articles if article.get("uid")],
+            )
+
+
+_store: Optional[PubMedStore] = None
+_store_lock = threading.Lock()
+
+
+def get_pubmed_store() -> PubMedStore:
+    """Return the process-wide store (GENEVIC_PUBMED_STORE or a file in the system temp directory)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            path = os.environ.get("GENEVIC_PUBMED_STORE", os.path.join(tempfile.gettempdir(), "genevic_cache", "pubmed.db"))
+            _store = PubMedStore(path, search_ttl=float(os.environ.get("GENEVIC_PUBMED_SEARCH_TTL", 24 * 3600)))
+        return _store
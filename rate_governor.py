@@ -0,0 +1,215 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.....................................................................................................................
+Purpose:
+           -Support code for llm_steps.py and pubmed_client.py
+           -One process-wide rate governor per upstream host (PubMed E-utilities, arXiv, SerpAPI),
+            shared by all Streamlit sessions, threads and event loops
+           -AIMD: the request rate and the number of concurrent requests grow additively after successes
+            and are halved on throttling (429/503); Retry-After pauses the whole host. Other errors
+            neither slow the host down nor count as successes
+           -Hosts with a higher limit for API keys (NCBI) get one governor per key, sized from that key
+           -The backoff is reset once the host has recovered, so it never accumulates on a long-lived instance
+           -A slot can be requested with a timeout, so that callers with a deadline give up instead of queueing
+'''
+#.....................................................................................................................
+
+
+# Importing essential libraries and modules
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional, Tuple
+
+# Published limits: requests per second and concurrent requests per host
+HOST_LIMITS = {
+    # NCBI: 3 requests/s without an API key
+    "eutils.ncbi.nlm.nih.gov": {"max_rate": 3.0, "max_concurrency": 3},
+    # arXiv API terms of use: no more than one request every three seconds
+    "export.arxiv.org": {"max_rate": 1 / 3.0, "max_concurrency": 1},
+    "serpapi.com": {"max_rate": 5.0, "max_concurrency": 4},
+}
+DEFAULT_LIMITS = {"max_rate": 5.0, "max_concurrency": 4}
+# Limits per API key, for hosts that raise them for requests with a key
+KEYED_HOST_LIMITS = {
+    # NCBI: 10 requests/s with an API key
+    "eutils.ncbi.nlm.nih.gov": {"max_rate": 10.0, "max_concurrency": 3},
+}
+THROTTLE_STATUS = (429, 503)
+
+
+class Throttled(Exception):
+    """Raised inside a governor slot to report that the upstream throttled the request."""
+
+    def __init__(self, status: int = 429, retry_after: Optional[float] = None) -> None:
+        super().__init__(f"throttled by upstream (status {status})")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class HostGovernor:
+    """
+    Adaptive rate and concurrency limit for one upstream host.
+
+    Parameters:
+        host: upstream host name
+        max_rate: requests per second never exceeded (the published limit)
+        max_concurrency: concurrent requests never exceeded
+        min_rate: lower bound of the rate after repeated throttling
+        increase: additive rate increase (requests/s) per successful request
+        recovery: consecutive successes after which the host counts as recovered
+    """
+
+    def __init__(self, host: str, max_rate: float, max_concurrency: int, min_rate: Optional[float] = None,
+                 increase: Optional[float] = None, recovery: int = 20) -> None:
+        self.host = host
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.min_rate = min_rate if min_rate is not None else max_rate / 16
+        self.increase = increase if increase is not None else max_rate / 10
+        self.recovery = recovery
+        self.rate = max_rate
+        self.concurrency = max_concurrency
+        self.in_flight = 0
+        self.throttled = 0
+        self._successes = 0
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self) -> float:
+        # Take a slot and return 0, or return the number of seconds to wait before trying again
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self.in_flight >= self.concurrency:
+                return 0.01
+            if now < self._next_slot:
+                return self._next_slot - now
+            self._next_slot = now + 1.0 / self.rate
+            self.in_flight += 1
+            return 0.0
+
+    def _release(self, throttled: bool = False, retry_after: Optional[float] = None, failed: bool = False) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if failed:
+                # an error other than throttling says nothing about the rate
+                return
+            if throttled:
+                # multiplicative decrease
+                self.throttled += 1
+                self._successes = 0
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.concurrency = max(1, self.concurrency // 2)
+                pause = retry_after if retry_after is not None else 1.0 / self.rate
+                self._paused_until = max(self._paused_until, now + pause)
+            else:
+                # additive increase, back to the published limit
+                self._successes += 1
+                self.rate = min(self.max_rate, self.rate + self.increase)
+                if self._successes % max(1, self.recovery // self.max_concurrency) == 0:
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                if self._successes >= self.recovery:
+                    # recovered: forget the backoff
+                    self.rate = self.max_rate
+                    self.concurrency = self.max_concurrency
+                    self.throttled = 0
+
+    def _wait(self, wait: float, deadline: Optional[float]) -> float:
+        # Seconds to sleep before trying again; TimeoutError once the deadline has passed
+        if deadline is None:
+            return wait
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"no request slot for {self.host} before the deadline")
+        return min(wait, remaining)
+
+    def acquire(self, timeout: Optional[float] = None) -> None:
+        """Wait for a request slot; raise TimeoutError if none is free within timeout seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._try_acquire()
+            if wait == 0:
+                return
+            time.sleep(self._wait(wait, deadline))
+
+    async def aacquire(self, timeout: Optional[float] = None) -> None:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._try_acquire()
+            if wait == 0:
+                return
+            await asyncio.sleep(self._wait(wait, deadline))
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None):
+        """Hold one request slot (sync); raise Throttled inside to report throttling."""
+        self.acquire(timeout)
+        try:
+            yield self
+        except Throttled as e:
+            self._release(True, e.retry_after)
+            raise
+        except BaseException:
+            self._release(failed=True)
+            raise
+        else:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, timeout: Optional[float] = None):
+        """Hold one request slot (async); raise Throttled inside to report throttling."""
+        await self.aacquire(timeout)
+        try:
+            yield self
+        except Throttled as e:
+            self._release(True, e.retry_after)
+            raise
+        except BaseException:
+            self._release(failed=True)
+            raise
+        else:
+            self._release()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {"rate": self.rate, "concurrency": self.concurrency, "in_flight": self.in_flight, "throttled": self.throttled}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        from email.utils import parsedate_to_datetime
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+_governors: Dict[Tuple[str, Optional[str]], HostGovernor] = {}
+_lock = threading.Lock()
+
+
+def get_governor(host: str, api_key: Optional[str] = None) -> HostGovernor:
+    """
+    Return the process-wide governor of a host. For hosts in KEYED_HOST_LIMITS, requests made with an API key
+    share one governor per key with the keyed limits.
+    """
+    keyed = bool(api_key) and host in KEYED_HOST_LIMITS
+    name = (host, api_key if keyed else None)
+    with _lock:
+        if name not in _governors:
+            limits = KEYED_HOST_LIMITS[host] if keyed else HOST_LIMITS.get(host, DEFAULT_LIMITS)
+            _governors[name] = HostGovernor(host, **limits)
+        return _governors[name]
@@ -0,0 +1,187 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.........................................................................................
+Purpose:
+        -Streaming, chunked export of query results (CSV, gzip-compressed CSV or Parquet)
+        -The export only runs when the user asks for it (Prepare download). Rows are streamed in chunks from one
+         cursor on the result handle (result_viewer.ResultHandle) into a file with a size cap, so no full copy of
+         the result is kept in memory
+        -With Streamlit static file serving enabled (.streamlit/config.toml) the file is written under static/exports
+         and downloaded through a link that Streamlit streams from disk; otherwise st.download_button is used
+        -The file is removed when the ResultExport is released (new export, end of the session) or at exit
+'''
+#..........................................................................................
+
+# Importing essential libraries and modules
+import gzip
+import os
+import tempfile
+import uuid
+import weakref
+
+# Export formats: (file extension, mime type, label)
+EXPORT_FORMATS = {
+    "csv": (".csv", "text/csv", "CSV"),
+    "csv.gz": (".csv.gz", "application/gzip", "CSV (gzip)"),
+    "parquet": (".parquet", "application/octet-stream", "Parquet"),
+}
+# Streamlit serves the static/ folder next to the main script (Home.py) at app/static/ when static serving is on;
+# files above 200 MB are refused, so exports stay below that
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+MAX_EXPORT_BYTES = 190 * 1024 * 1024
+
+
+def static_serving():
+    #True when the app runs with Streamlit static file serving enabled
+    try:
+        import streamlit as st
+        return bool(st.get_option("server.enableStaticServing"))
+    except Exception:
+        return False
+
+
+def export_dir():
+    #Directory for the export files: GENEVIC_EXPORT_DIR, static/exports when Streamlit serves static files,
+    #or the system temp directory
+    directory = os.environ.get("GENEVIC_EXPORT_DIR")
+    if directory is None:
+        directory = os.path.join(STATIC_DIR, "exports") if static_serving() else os.path.join(tempfile.gettempdir(), "genevic_exports")
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class ResultExport:
+    #A query result written to a temporary file.
+    #The file is deleted by cleanup(), when the object is garbage collected (e.g. its Streamlit session ends) or at interpreter exit.
+    def __init__(self, path, fmt, rows, truncated) -> None:
+        self.path = path
+        self.format = fmt
+        self.rows = rows
+        self.truncated = truncated
+        self.file_name = "data" + EXPORT_FORMATS[fmt][0]
+        self.mime = EXPORT_FORMATS[fmt][1]
+        self.label = EXPORT_FORMATS[fmt][2]
+        self._finalizer = weakref.finalize(self, _remove, path)
+
+    @property
+    def size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    @property
+    def url(self):
+        #Relative URL of the file on Streamlit's static file server, or None when the file is not served
+        relative = os.path.relpath(os.path.realpath(self.path), os.path.realpath(STATIC_DIR))
+        if relative.startswith("..") or not static_serving():
+            return None
+        return "app/static/" + relative.replace(os.sep, "/")
+
+    def open(self):
+        #File object for st.download_button (used when static serving is off)
+        return open(self.path, "rb")
+
+    def cleanup(self):
+        self._finalizer()
+
+
+def parquet_schema(chunk):
+    #Parquet schema fixed from the first chunk, so that later chunks are cast to it:
+    #integer columns stay int64 when a later chunk has NULLs (pandas reads them as float),
+    #columns that are all NULL in the first chunk are written as strings
+    import pyarrow as pa
+    fields = []
+    for field in pa.Schema.from_pandas(chunk, preserve_index=False):
+        if pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        elif pa.types.is_integer(field.type):
+            field = field.with_type(pa.int64())
+        fields.append(field)
+    return pa.schema(fields)
+
+
+def _conform(chunk, schema):
+    #Convert the string columns of a chunk to strings, whatever pandas inferred for them
+    import pyarrow as pa
+    for field in schema:
+        if pa.types.is_string(field.type):
+            chunk[field.name] = chunk[field.name].astype("string")
+    return chunk
+
+
+def export_result(handle, fmt="csv", chunksize=50000, max_bytes=MAX_EXPORT_BYTES):
+    #Stream the rows of a result handle in chunks (one cursor) to an export file.
+    #Writing stops once the file reaches max_bytes; the export is then marked as truncated.
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unsupported export format: {fmt}")
+    path = os.path.join(export_dir(), f"{uuid.uuid4().hex}{EXPORT_FORMATS[fmt][0]}")
+    rows = 0
+    truncated = False
+    chunks = handle.iter_chunks(chunksize)
+    try:
+        if fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            with open(path, "wb") as raw:
+                writer = None
+                for chunk in chunks:
+                    if writer is None:
+                        writer = pq.ParquetWriter(raw, parquet_schema(chunk), compression="snappy")
+                    writer.write_table(pa.Table.from_pandas(_conform(chunk, writer.schema), schema=writer.schema, preserve_index=False))
+                    rows += len(chunk)
+                    if raw.tell() >= max_bytes:
+                        truncated = True
+                        break
+                if writer is not None:
+                    writer.close()
+        else:
+            with open(path, "wb") as raw:
+                f = gzip.GzipFile(fileobj=raw, mode="wb") if fmt == "csv.gz" else raw
+                header = True
+                for chunk in chunks:
+                    f.write(chunk.to_csv(index=False, header=header).encode("utf-8"))
+                    header = False
+                    rows += len(chunk)
+                    if raw.tell() >= max_bytes:
+                        truncated = True
+                        break
+                if f is not raw:
+                    f.close()
+    except Exception:
+        _remove(path)
+        raise
+    finally:
+        chunks.close()
+    return ResultExport(path, fmt, rows, truncated)
+
+
+def render_export_controls(container, handle, session_state=None, key="result"):
+    #Render the download controls of a result into a Streamlit container.
+    #The export runs only when Prepare download is clicked; the ResultExport is kept in session_state[f"{key}_export"].
+    col_format, col_button = container.columns((2, 1))
+    fmt = col_format.selectbox("Download format", list(EXPORT_FORMATS), format_func=lambda x: EXPORT_FORMATS[x][2], key=f"{key}_export_format")
+    state = session_state if session_state is not None else {}
+    export = state.get(f"{key}_export")
+    if col_button.button("Prepare download", key=f"{key}_export_button"):
+        if export is not None:
+            export.cleanup()
+        export = export_result(handle, fmt)
+        state[f"{key}_export"] = export
+    if export is None:
+        return
+    if export.truncated:
+        container.write(f"The download is limited to the first {export.rows} rows (file size cap).")
+    if export.url is not None:
+        # Served by Streamlit's static file server, which streams the file from disk
+        container.markdown(f'<a href="{export.url}" download="{export.file_name}">Download {export.label}</a>', unsafe_allow_html=True)
+    else:
+        with export.open() as f:
+            container.download_button(label=f"Download {export.label}", data=f, file_name=export.file_name, mime=export.mime, key=f"{key}_export_download")
@@ -0,0 +1,163 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.........................................................................................
+Purpose:
+        -Paginated, server-side viewer for large query results of the PGS Chat page
+        -ResultHandle wraps the query as a subquery and pushes paging (LIMIT/OFFSET or OFFSET/FETCH),
+         sorting (ORDER BY) and filtering (WHERE ... LIKE) down to the database
+        -Only the visible page is fetched and sent to the browser; the total row count comes from a cached COUNT(*)
+        -Comments and trailing semicolons are removed before wrapping; a WITH (CTE) query cannot be a derived table
+         on SQL Server, so such a result is read once and paged, sorted and filtered in memory
+'''
+#..........................................................................................
+
+# Importing essential libraries and modules
+import re
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy import text
+
+# String literals and quoted identifiers are kept as they are, -- and /* */ comments are removed
+SQL_TOKENS = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\[[^\]]*\])|--[^\n]*|/\*.*?\*/", re.DOTALL)
+
+
+def clean_query(query):
+    #The query without comments and trailing semicolons, so that it can be wrapped as a subquery
+    query = SQL_TOKENS.sub(lambda match: match.group(1) or " ", query)
+    return re.sub(r"[\s;]+$", "", query).strip()
+
+
+class ResultHandle:
+    #A handle on a query result. Pages are fetched on demand and a few recent pages are cached.
+    def __init__(self, sql_query_tool, query, sql_engine="sqlite", max_cached_pages=8) -> None:
+        self.sql_query_tool = sql_query_tool
+        self.query = clean_query(query)
+        self.sql_engine = sql_engine
+        self.max_cached_pages = max_cached_pages
+        #SQL Server does not accept a CTE as a derived table: the result is then read once and kept in memory
+        self.wrapped = not (sql_engine == "sqlserver" and re.match(r"with\b", self.query, re.IGNORECASE))
+        self._frame = None
+        self._columns = None
+        self._counts = {}
+        self._pages = OrderedDict()
+
+    def _subquery(self):
+        query = self.query
+        #SQL Server only accepts ORDER BY in a derived table together with TOP/OFFSET
+        if self.sql_engine == "sqlserver" and re.search(r"\border\s+by\b", query, re.IGNORECASE) and not re.search(r"\boffset\b|\btop\b", query, re.IGNORECASE):
+            query += " OFFSET 0 ROWS"
+        return f"({query}) AS _q"
+
+    def _quote(self, column):
+        if column not in self.columns():
+            raise ValueError(f"unknown column: {column}")
+        if self.sql_engine == "sqlserver":
+            return "[" + column.replace("]", "]]") + "]"
+        return '"' + column.replace('"', '""') + '"'
+
+    def _where(self, filter_column, filter_text):
+        if not filter_column or not filter_text:
+            return "", {}
+        cast_type = "NVARCHAR(MAX)" if self.sql_engine == "sqlserver" else "TEXT"
+        #% and _ in the filter text match themselves (and [ on SQL Server, where it starts a character class)
+        escaped = re.sub(r"([\\%_\[])" if self.sql_engine == "sqlserver" else r"([\\%_])", r"\\\1", filter_text)
+        return f" WHERE CAST({self._quote(filter_column)} AS {cast_type}) LIKE :pattern ESCAPE '\\'", {"pattern": f"%{escaped}%"}
+
+    def _read(self, sql, params=None):
+        return pd.read_sql_query(text(sql), self.sql_query_tool.get_engine(), params=params or {})
+
+    def _full(self, filter_column=None, filter_text=None):
+        #The whole result (unwrapped query), filtered in memory like the LIKE filter
+        if self._frame is None:
+            self._frame = self._read(self.query)
+        frame = self._frame
+        if filter_column and filter_text:
+            self._quote(filter_column)
+            frame = frame[frame[filter_column].astype(str).str.contains(filter_text, case=False, regex=False, na=False)]
+        return frame
+
+    def columns(self):
+        #Column names from a query that returns no rows
+        if self._columns is None:
+            if not self.wrapped:
+                probe = self._full()
+            elif self.sql_engine == "sqlserver":
+                probe = self._read(f"SELECT TOP 0 * FROM {self._subquery()}")
+            else:
+                probe = self._read(f"SELECT * FROM {self._subquery()} LIMIT 0")
+            self._columns = list(probe.columns)
+        return self._columns
+
+    def count(self, filter_column=None, filter_text=None):
+        #Total number of rows (with the filter applied), cached per filter
+        key = (filter_column, filter_text)
+        if key not in self._counts:
+            if not self.wrapped:
+                self._counts[key] = len(self._full(filter_column, filter_text))
+                return self._counts[key]
+            where, params = self._where(filter_column, filter_text)
+            self._counts[key] = int(self._read(f"SELECT COUNT(*) AS n FROM {self._subquery()}{where}", params).iloc[0, 0])
+        return self._counts[key]
+
+    def page(self, page=0, page_size=100, sort_by=None, ascending=True, filter_column=None, filter_text=None):
+        #Fetch one page of rows; sorting and filtering run in the database
+        key = (page, page_size, sort_by, ascending, filter_column, filter_text)
+        if key in self._pages:
+            self._pages.move_to_end(key)
+            return self._pages[key]
+        if not self.wrapped:
+            frame = self._full(filter_column, filter_text)
+            if sort_by:
+                self._quote(sort_by)
+                frame = frame.sort_values(sort_by, ascending=ascending, kind="stable")
+            return frame.iloc[int(page) * int(page_size) : (int(page) + 1) * int(page_size)].reset_index(drop=True)
+        where, params = self._where(filter_column, filter_text)
+        params.update({"limit": int(page_size), "offset": int(page) * int(page_size)})
+        order = f" ORDER BY {self._quote(sort_by)} {'ASC' if ascending else 'DESC'}" if sort_by else ""
+        if self.sql_engine == "sqlserver":
+            order = order or " ORDER BY (SELECT NULL)"
+            sql = f"SELECT * FROM {self._subquery()}{where}{order} OFFSET :offset ROWS FETCH NEXT :limit ROWS ONLY"
+        else:
+            sql = f"SELECT * FROM {self._subquery()}{where}{order} LIMIT :limit OFFSET :offset"
+        result = self._read(sql, params)
+        self._pages[key] = result
+        if len(self._pages) > self.max_cached_pages:
+            self._pages.popitem(last=False)
+        return result
+
+    def iter_chunks(self, chunksize=50000):
+        #Stream the whole result in DataFrame chunks from one cursor (for exports)
+        with self.sql_query_tool.get_engine().connect() as connection:
+            connection = connection.execution_options(stream_results=True)
+            for chunk in pd.read_sql_query(text(self.query), connection, chunksize=chunksize):
+                yield chunk
+
+
+def render_result_viewer(container, handle, key="result", page_sizes=(25, 100, 500)):
+    #Render the paging, sorting and filtering controls and the visible page into a Streamlit container.
+    #Widget keys are fixed so that the controls keep their state across reruns.
+    columns = handle.columns()
+    col_filter, col_text, col_sort, col_order, col_size = container.columns((2, 2, 2, 1, 1))
+    filter_column = col_filter.selectbox("Filter column", [""] + columns, key=f"{key}_filter_column")
+    filter_text = col_text.text_input("Contains", key=f"{key}_filter_text")
+    sort_by = col_sort.selectbox("Sort by", [""] + columns, key=f"{key}_sort_by")
+    ascending = col_order.selectbox("Order", ["asc", "desc"], key=f"{key}_order") == "asc"
+    page_size = col_size.selectbox("Rows", list(page_sizes), key=f"{key}_page_size")
+
+    total = handle.count(filter_column or None, filter_text or None)
+    n_pages = max(1, (total + page_size - 1) // page_size)
+    # A new filter or page size changes the number of pages: go back to the first page
+    # (a stored page above max_value makes number_input raise)
+    if st.session_state.get(f"{key}_n_pages") != n_pages or st.session_state.get(f"{key}_page", 1) > n_pages:
+        st.session_state[f"{key}_page"] = 1
+    st.session_state[f"{key}_n_pages"] = n_pages
+    page = container.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, step=1, key=f"{key}_page") - 1
+    data = handle.page(page, page_size, sort_by or None, ascending, filter_column or None, filter_text or None)
+    first = page * page_size + 1 if total > 0 else 0
+    container.write(f"Rows {first}-{page * page_size + len(data)} of {total}")
+    container.dataframe(data, use_container_width=True)
@@ -0,0 +1,237 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.....................................................................................................................
+Purpose:
+           -Support code for llm_steps.py (GoogleScholar tool)
+           -Persistent (SQLite) cache of SerpAPI results keyed by the engine parameters and the normalized query,
+            with a time-to-live, so repeated Google Scholar searches cost neither seconds nor paid quota
+           -Local quota ledger: the searches left on the account (SerpAPI Account API, refreshed hourly) minus
+            the searches made since; when it falls to the reserve, only cached results (even expired ones) are
+            served and QuotaExhausted is raised for new queries, so that the tool can fall back to PubMed
+           -GENEVIC_SERPAPI_URL points the client to another host, e.g. the local stand-in server
+            (benchmarks/stub_serpapi_server.py)
+References:
+           https://serpapi.com/google-scholar-api
+           https://serpapi.com/account-api
+'''
+#.....................................................................................................................
+
+
+# Importing essential libraries and modules
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from cassette import get_cassette
+from modified_requests import CONNECT_TIMEOUT, READ_TIMEOUT, get_session
+from pubmed_store import normalize_query
+from rate_governor import THROTTLE_STATUS, Throttled, get_governor, parse_retry_after
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (cache_key TEXT PRIMARY KEY, result TEXT NOT NULL, fetched_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS ledger (api_key_hash TEXT NOT NULL, at REAL NOT NULL, query TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS account (api_key_hash TEXT PRIMARY KEY, searches_left INTEGER NOT NULL, checked_at REAL NOT NULL);
+"""
+SERPAPI_URL = "https://serpapi.com"
+SERPAPI_HOST = "serpapi.com"
+
+
+class QuotaExhausted(Exception):
+    """Raised when the SerpAPI quota is at its reserve and the query is not cached."""
+
+
+class SerpAPICache:
+    """
+    SQLite-backed SerpAPI result cache and quota ledger.
+
+    Parameters:
+        path: SQLite database file
+        ttl: seconds a result is served from the cache
+    """
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600) -> None:
+        self.path = path
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One connection shared by the Streamlit sessions (threads), serialized by a lock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("PRAGMA journal_mode=WAL;" + SCHEMA)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(params: Dict[str, Any], query: str) -> str:
+        # the API key does not change the results
+        params = {key: value for key, value in params.items() if key not in ("api_key", "q")}
+        return json.dumps([params, normalize_query(query)], sort_keys=True)
+
+    def get(self, params: Dict[str, Any], query: str, max_age: Optional[float] = -1) -> Optional[dict]:
+        """Cached result, or None when missing or older than max_age (the TTL by default, None = any age)."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT result, fetched_at FROM results WHERE cache_key = ?", (self.cache_key(params, query),)
+            ).fetchone()
+        max_age = self.ttl if max_age == -1 else max_age
+        if row is None or (max_age is not None and time.time() - row[1] > max_age):
+            return None
+        return json.loads(row[0])
+
+    def put(self, params: Dict[str, Any], query: str, result: dict) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (self.cache_key(params, query), json.dumps(result), time.time())
+            )
+
+    def record_search(self, api_key_hash: str, query: str) -> None:
+        """Enter one paid search of an account in the ledger."""
+        with self._lock, self._connection:
+            self._connection.execute("INSERT INTO ledger VALUES (?, ?, ?)", (api_key_hash, time.time(), normalize_query(query)))
+
+    def set_searches_left(self, api_key_hash: str, searches_left: int) -> None:
+        """Searches left on the account as reported by SerpAPI (the ledger counts from here)."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO account VALUES (?, ?, ?)", (api_key_hash, int(searches_left), time.time())
+            )
+
+    def searches_left(self, api_key_hash: str) -> Optional[Dict[str, float]]:
+        """{"searches_left", "checked_at"}: the last reported quota minus the searches made since, or None."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT searches_left, checked_at FROM account WHERE api_key_hash = ?", (api_key_hash,)
+            ).fetchone()
+            if row is None:
+                return None
+            used = self._connection.execute(
+                "SELECT COUNT(*) FROM ledger WHERE api_key_hash = ? AND at > ?", (api_key_hash, row[1])
+            ).fetchone()[0]
+        return {"searches_left": row[0] - used, "checked_at": row[1]}
+
+
+_cache: Optional[SerpAPICache] = None
+_cache_lock = threading.Lock()
+
+
+def get_serpapi_cache() -> SerpAPICache:
+    """Return the process-wide cache (GENEVIC_SERPAPI_CACHE or a file in the system temp directory)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            path = os.environ.get("GENEVIC_SERPAPI_CACHE", os.path.join(tempfile.gettempdir(), "genevic_cache", "serpapi.db"))
+            _cache = SerpAPICache(path, ttl=float(os.environ.get("GENEVIC_SERPAPI_TTL", 7 * 24 * 3600)))
+        return _cache
+
+
+class CachedSerpAPI:
+    """
+    SerpAPI search with a persistent cache and quota accounting.
+
+    Parameters:
+        params: engine parameters (engine, hl, num, ...)
+        api_key: SerpAPI key (SERPAPI_API_KEY by default)
+        base_url: SerpAPI host (GENEVIC_SERPAPI_URL or https://serpapi.com)
+        reserve: searches kept in reserve; at or below it new queries raise QuotaExhausted
+        account_ttl: seconds between two refreshes of the quota from the Account API
+        cache: result cache and ledger (the process-wide one by default)
+    """
+
+    def __init__(self, params: Dict[str, Any], api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 reserve: Optional[int] = None, account_ttl: float = 3600, cache: Optional[SerpAPICache] = None) -> None:
+        self.params = params
+        self.api_key = api_key or os.environ.get("SERPAPI_API_KEY")
+        if not self.api_key:
+            raise ValueError("Did not find serpapi_api_key, please add an environment variable `SERPAPI_API_KEY`")
+        self.base_url = (base_url or os.environ.get("GENEVIC_SERPAPI_URL") or SERPAPI_URL).rstrip("/")
+        self.reserve = reserve if reserve is not None else int(os.environ.get("GENEVIC_SERPAPI_RESERVE", 10))
+        self.account_ttl = account_ttl
+        self.cache = cache or get_serpapi_cache()
+        self.governor = get_governor(SERPAPI_HOST)
+        # the ledger is kept per account without storing the key itself
+        self._account = hashlib.sha256(self.api_key.encode()).hexdigest()[:16]
+
+    def _get(self, path: str, params: Dict[str, Any]) -> dict:
+        # One call to SerpAPI on the shared keep-alive session
+        response = get_session().get(
+            f"{self.base_url}{path}", params={**params, "api_key": self.api_key}, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+        )
+        try:
+            result = response.json()
+        except ValueError:
+            result = {"error": response.text[:200]}
+        error = result.get("error")
+        # an exhausted account is answered with 429 too, but waiting does not help
+        if error and re.search(r"run out of searches|plan searches", error, re.IGNORECASE):
+            self.cache.set_searches_left(self._account, 0)
+            raise QuotaExhausted(error)
+        if response.status_code in THROTTLE_STATUS:
+            raise Throttled(response.status_code, parse_retry_after(response.headers.get("Retry-After")))
+        if error:
+            raise ValueError(f"Got error from SerpAPI: {error}")
+        return result
+
+    def searches_left(self) -> Optional[int]:
+        """Searches left according to the ledger (refreshed from the Account API when older than account_ttl)."""
+        ledger = self.cache.searches_left(self._account)
+        if ledger is None or time.time() - ledger["checked_at"] > self.account_ttl:
+            try:
+                with self.governor.slot():
+                    account = self._get("/account.json", {})
+                self.cache.set_searches_left(self._account, account.get("total_searches_left", account.get("plan_searches_left", 0)))
+                ledger = self.cache.searches_left(self._account)
+            except Exception:
+                # the Account API is not essential; keep the last known count
+                pass
+        return int(ledger["searches_left"]) if ledger is not None else None
+
+    def _cached(self, query: str) -> Optional[dict]:
+        # Fresh cached result, or a result of any age when the quota is at its reserve (None: call SerpAPI)
+        cached = self.cache.get(self.params, query)
+        if cached is not None:
+            return cached
+        if get_cassette().mode == "replay":
+            return None
+        left = self.searches_left()
+        if left is not None and left <= self.reserve:
+            stale = self.cache.get(self.params, query, max_age=None)
+            if stale is not None:
+                return stale
+            raise QuotaExhausted(f"SerpAPI quota is at its reserve ({left} searches left)")
+        return None
+
+    def _search(self, query: str) -> dict:
+        with self.governor.slot():
+            return self._get("/search.json", {**self.params, "q": query})
+
+    def _store(self, query: str, result: dict) -> dict:
+        if get_cassette().mode != "replay":
+            self.cache.record_search(self._account, query)
+            self.cache.put(self.params, query, result)
+        return result
+
+    def results(self, query: str) -> dict:
+        """Results of a search: from the cache, else from SerpAPI (through the cassette layer)."""
+        cached = self._cached(query)
+        if cached is not None:
+            return cached
+        result = get_cassette().call("serpapi", {"params": self.params, "query": query}, lambda: self._search(query))
+        return self._store(query, result)
+
+    async def aresults(self, query: str) -> dict:
+        """Async version of results() (the HTTP call runs in a worker thread on the shared session)."""
+        cached = await asyncio.to_thread(self._cached, query)
+        if cached is not None:
+            return cached
+        result = await get_cassette().acall(
+            "serpapi", {"params": self.params, "query": query}, lambda: asyncio.to_thread(self._search, query)
+        )
+        return self._store(query, result)
+
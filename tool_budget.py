@@ -0,0 +1,280 @@
+'''
+Author: Anindita Nath
+Job Title: Postdoctoral Research Fellow
+Location: Bioinformatics and Systems Medicine Laboratory, MSBMI, UTHH
+Date: August, 2023 - January 2024
+#.....................................................................................................................
+Purpose:
+           -Support code for llm_steps.py
+           -Token budget for the outputs of the literature tools before they go into the agent's scratchpad
+           -Sentence-level extractive compression: sentences are ranked by overlap with the query terms and kept,
+            in their original order, until the tool's token cap is reached
+           -Sentences holding identifiers and links (URLs, DOIs, PMIDs, arXiv IDs, result ids) are kept first
+           -Outputs made of records, i.e. str(dict) lines (Google Scholar), Documents (PubMed, federated search) and
+            "Published: ..." entries (arXiv), are budgeted record by record: identifier fields are kept whole, text
+            fields are compressed and long author lists shortened, and the last records are left out if needed
+'''
+#.....................................................................................................................
+
+
+# Importing essential libraries and modules
+import ast
+import math
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from langchain.schema import Document
+
+from pubmed_mirror import STOPWORDS
+
+# Token caps per tool (tool name in llm_steps.load_tools)
+TOOL_TOKEN_BUDGETS = {
+    "arxiv search": 700,
+    "pubmed search": 800,
+    "google scholar search": 500,
+    "article link handler": 500,
+    "literature search (all sources)": 1200,
+}
+DEFAULT_TOKEN_BUDGET = 600
+
+IDENTIFIER_PATTERN = re.compile(
+    r"https?://\S+|\b10\.\d{4,9}/\S+|\bPMC\d+\b|\b\d{4}\.\d{4,5}(v\d+)?\b|'(uid|result_id|Entry ID|link)':|\b(PMID|doi|arXiv)\b",
+    re.IGNORECASE,
+)
+# Fields of records (lower case) kept whole, and fields compressed sentence by sentence
+IDENTIFIER_FIELDS = ("title", "link", "result_id", "uid", "pmid", "doi", "arxiv", "entry id", "sources")
+TEXT_FIELDS = ("abstract", "snippet", "summary")
+# Smallest share of the budget per record
+MIN_RECORD_TOKENS = 20
+# "Published: ..." blocks of the arXiv (and PubMed run) text output, one per paper
+ENTRY_FIELD = re.compile(r"^([A-Z][A-Za-z ]{1,20}): ?(.*)$")
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(\[\"'])|\n+")
+# Stopwords and URL parts, left out of the query terms
+QUERY_STOPWORDS = STOPWORDS | {"http", "https", "www", "com", "org", "html", "abs", "pdf"}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of English text (about 4 characters per token)."""
+    return math.ceil(len(text) / 4)
+
+
+def query_terms(query: str) -> set:
+    return {term for term in re.findall(r"[a-z0-9]+", query.lower()) if term not in QUERY_STOPWORDS and len(term) > 1}
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in SENTENCE_SPLIT.split(text) if sentence and sentence.strip()]
+
+
+def compress_text(text: str, query: str, max_tokens: int) -> str:
+    """
+    Keep the sentences of text that best match the query within max_tokens.
+    Sentences with identifiers or links are kept first; the kept sentences stay in their original order,
+    line breaks between them are kept and gaps are marked with "...".
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # sentences and the separator that follows each of them
+    pieces = SENTENCE_SPLIT.split(text)
+    separators = [match.group(0) for match in SENTENCE_SPLIT.finditer(text)] + [""]
+    sentences, breaks = [], []
+    for piece, separator in zip(pieces, separators):
+        if piece.strip():
+            sentences.append(piece.strip())
+            breaks.append("\n" in separator)
+        elif breaks and "\n" in separator:
+            breaks[-1] = True
+    terms = query_terms(query)
+    scored = []
+    for position, sentence in enumerate(sentences):
+        words = set(re.findall(r"[a-z0-9]+", sentence.lower()))
+        overlap = len(terms & words) / (1 + len(terms)) if terms else 0.0
+        protected = 1 if IDENTIFIER_PATTERN.search(sentence) else 0
+        # ties are broken by position (leading sentences of an abstract carry most of the content)
+        scored.append((protected, overlap, -position))
+    order = sorted(range(len(sentences)), key=lambda i: scored[i], reverse=True)
+    kept = set()
+    used = 0
+    for i in order:
+        cost = estimate_tokens(sentences[i]) + 1
+        if used + cost > max_tokens:
+            continue
+        kept.add(i)
+        used += cost
+    parts = []
+    previous = -1
+    for i in sorted(kept):
+        if previous >= 0:
+            newline = any(breaks[previous:i])
+            if i != previous + 1:
+                parts.append("\n...\n" if newline else " ... ")
+            else:
+                parts.append("\n" if newline else " ")
+        elif i > 0:
+            parts.append("... ")
+        parts.append(sentences[i])
+        previous = i
+    if previous != len(sentences) - 1:
+        parts.append(" ...")
+    return "".join(parts)
+
+
+def parse_records(text: str):
+    """
+    (header lines, records) of an output made of str(dict) lines, such as the Google Scholar tool output,
+    or None when the text is not such an output.
+    """
+    header: List[str] = []
+    records: List[dict] = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{") and line.endswith("}"):
+            try:
+                record = ast.literal_eval(line)
+            except (ValueError, SyntaxError):
+                return None
+            if not isinstance(record, dict):
+                return None
+            records.append(record)
+        elif not records:
+            header.append(line)
+        else:
+            return None
+    return (header, records) if records else None
+
+
+def parse_entries(text: str) -> Optional[List[dict]]:
+    """
+    Entries of an output made of "Published: ...\nTitle: ...\nSummary: ..." blocks separated by blank lines
+    (arXiv search), or None when the text is not such an output. Lines without a field name continue the previous field.
+    """
+    entries: List[dict] = []
+    for block in re.split(r"\n\s*\n(?=Published:)", text.strip()):
+        if not block.startswith("Published:"):
+            return None
+        entry: Dict[str, str] = {}
+        field = None
+        for line in block.splitlines():
+            match = ENTRY_FIELD.match(line)
+            if match and match.group(1) not in entry:
+                field = match.group(1)
+                entry[field] = match.group(2)
+            elif field is not None:
+                entry[field] += " " + line.strip()
+        entries.append(entry)
+    return entries or None
+
+
+def render_entry(entry: dict) -> str:
+    return "\n".join(f"{field}: {value}" for field, value in entry.items())
+
+
+def shorten(text: str, max_tokens: int) -> str:
+    """Cut text at a word boundary to about max_tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[: max_tokens * 4].rsplit(" ", 1)[0] + " ..."
+
+
+def shorten_list(values: list, max_tokens: int) -> list:
+    """The leading items of a list (author names, ...) within about max_tokens, "..." marking the rest."""
+    kept = []
+    for value in values:
+        if estimate_tokens(str(kept + [value, "..."])) > max_tokens and kept:
+            return kept + ["..."]
+        kept.append(value)
+    return kept
+
+
+def compress_record(record: dict, query: str, share: int) -> dict:
+    """
+    One record within about share tokens: identifier fields are kept whole, other fields (authors, journal, ...)
+    are shortened and text fields compressed to what is left of the share.
+    """
+    compressed = {}
+    for field, value in record.items():
+        if field.lower() in IDENTIFIER_FIELDS or field.lower() in TEXT_FIELDS:
+            compressed[field] = value
+        elif isinstance(value, str):
+            compressed[field] = shorten(value, max(10, share // 4))
+        elif isinstance(value, (list, tuple)):
+            compressed[field] = shorten_list(list(value), max(10, share // 4))
+        else:
+            compressed[field] = value
+    rest = estimate_tokens(str({field: value for field, value in compressed.items() if field.lower() not in TEXT_FIELDS}))
+    text_budget = max(MIN_RECORD_TOKENS, share - rest)
+    for field, value in compressed.items():
+        if field.lower() in TEXT_FIELDS and isinstance(value, str):
+            compressed[field] = compress_text(value, query, text_budget)
+    return compressed
+
+
+def compress_records(header: List[str], records: List[dict], query: str, max_tokens: int,
+                     render: Callable[[dict], str] = str, separator: str = "\n") -> str:
+    """
+    Budget records one by one, each with an equal share of max_tokens (see compress_record), and render them.
+    The share shrinks until the output fits; when even the identifier fields do not fit, the last (lowest ranked)
+    records are left out.
+    """
+    def output(lines: List[str]) -> str:
+        return separator.join(["\n".join(header)] + lines if header else lines)
+
+    fixed = estimate_tokens("\n".join(header)) + sum(
+        estimate_tokens(str({field: value for field, value in record.items() if field.lower() in IDENTIFIER_FIELDS})) for record in records
+    )
+    share = max(MIN_RECORD_TOKENS, (max_tokens - fixed) // len(records))
+    while True:
+        lines = [render(compress_record(record, query, share)) for record in records]
+        if estimate_tokens(output(lines)) <= max_tokens or share == MIN_RECORD_TOKENS:
+            break
+        share = max(MIN_RECORD_TOKENS, share * 3 // 4)
+    kept = len(lines)
+    while kept > 1 and estimate_tokens(output(lines[:kept] + [f"({len(lines)} more results left out)"])) > max_tokens:
+        kept -= 1
+    if kept < len(lines):
+        return output(lines[:kept] + [f"({len(lines) - kept} more results left out)"])
+    return output(lines)
+
+
+def compress_documents(documents: List[Document], query: str, max_tokens: int) -> str:
+    """Render Documents as dictionaries (metadata + abstract), budgeted record by record."""
+    if not documents:
+        return "No good Result was found"
+    return compress_records([], [{**document.metadata, "abstract": document.page_content} for document in documents], query, max_tokens)
+
+
+def budget_text(text: str, query: str, max_tokens: int) -> str:
+    """Compress a text output to max_tokens: per record for str(dict) lines and arXiv entries, else per sentence."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    parsed = parse_records(text)
+    if parsed is not None:
+        return compress_records(*parsed, query, max_tokens)
+    entries = parse_entries(text)
+    if entries is not None:
+        return compress_records([], entries, query, max_tokens, render=render_entry, separator="\n\n")
+    return compress_text(text, query, max_tokens)
+
+
+def budget_output(tool_name: str, query: str, output: Any, budgets: Optional[Dict[str, int]] = None) -> str:
+    """Compress a tool output (str or list of Documents) to the tool's token cap."""
+    max_tokens = (budgets or TOOL_TOKEN_BUDGETS).get(tool_name, DEFAULT_TOKEN_BUDGET)
+    if isinstance(output, list) and all(isinstance(item, Document) for item in output):
+        return compress_documents(output, query, max_tokens)
+    return budget_text(str(output), query, max_tokens)
+
+
+def budgeted(tool_name: str, func: Callable[[str], Any], budgets: Optional[Dict[str, int]] = None) -> Callable[[str], str]:
+    """Wrap a tool function so that its output is budgeted."""
+    def run(query: str) -> str:
+        return budget_output(tool_name, query, func(query), budgets)
+    return run
+
+
+def abudgeted(tool_name: str, coroutine: Callable[[str], Awaitable[Any]], budgets: Optional[Dict[str, int]] = None) -> Callable[[str], Awaitable[str]]:
+    """Async version of budgeted()."""
+    async def arun(query: str) -> str:
+        return budget_output(tool_name, query, await coroutine(query), budgets)
+    return arun